@@ -1,11 +1,11 @@
 import streamlit as st
-import pandas as pd
 import json
-import datetime
-import math
-import plotly.graph_objects as go
-from tools.fetch_pool_data import fetch_data
-from tools.fetch_collected_fees import fetch_fees
+import os
+import threading
+import time
+from tools import state_db
+from tools.metrics import compute_metrics
+from tools.decimate import DEFAULT_TARGET_POINTS, lttb_indices
 
 # Page Config
 st.set_page_config(
@@ -132,78 +132,106 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Helper Functions
-def calculate_impermanent_loss(current_price, entry_price):
-    if entry_price <= 0: return 0
-    price_ratio = current_price / entry_price
-    if price_ratio <= 0: return 0
-    sqrt_ratio = math.sqrt(price_ratio)
-    # IL = (2 * sqrt(P) / (1 + P)) - 1
-    il = (2 * sqrt_ratio / (1 + price_ratio)) - 1
-    return il * 100
-
-def calculate_fee_apr(total_fees, position_value, days_active):
-    if position_value <= 0 or days_active <= 0: return 0
-    daily_rate = (total_fees / position_value) / days_active
-    apr = daily_rate * 365 * 100
-    return apr
-
-@st.cache_data(ttl=600)
-def load_data():
-    try:
-        with open("tools/config.json", "r") as f: config = json.load(f)
-    except: config = {}
-    
-    try:
-        with open("tools/history.json", "r") as f: history = json.load(f)
-    except: history = []
+POOLS_FILE = "tools/pools.json"
 
+@st.cache_data(max_entries=256, show_spinner=False)
+def _read_json(path, mtime):
+    # mtime is part of the cache key: a file is only re-read after it changes
+    with open(path, "r") as f:
+        return json.load(f)
+
+def load_json(path, default=None):
     try:
-        with open("tools/position_data.json", "r") as f: pos = json.load(f)
-        with open("tools/fees_data.json", "r") as f: fees = json.load(f)
-    except:
-        pos = {}
-        fees = {}
-        
-    return config, history, pos, fees
+        return _read_json(path, os.path.getmtime(path))
+    except (OSError, json.JSONDecodeError):
+        return default
+
+def load_pools():
+    return load_json(POOLS_FILE, {}).get("pools", [])
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _read_pool(nft_id, version):
+    # version (last write to the pool in the state store) is part of the cache key
+    data = state_db.load_pool_data(state_db.connect(), nft_id)
+    data["pos"] = data["pos"] or {}
+    return data
+
+def load_pool_data(pool_entry):
+    nft_id = pool_entry["nft_id"]
+    return _read_pool(nft_id, state_db.pool_version(state_db.connect(), nft_id))
+
+class SyncJob:
+    """Background sync of one pool, polled by the progress fragment."""
 
-def sync_data():
-    with st.spinner("Syncing data from blockchain..."):
-        pos_data = fetch_data()
+    def __init__(self, pool_entry):
+        self.pool_entry = pool_entry
+        self.stage = "starting"
+        self.ok = None
+        self.error = None
+        self.started = time.time()
+        self.finished = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        # Imported lazily: pulls in the provider stack only when a sync is requested
+        from tools.sync import sync_pool
         try:
-            fees_data = fetch_fees()
+            self.ok = sync_pool(self.pool_entry, on_stage=self._set_stage)
         except Exception as e:
-            st.warning(f"Could not fetch fees: {e}")
-            fees_data = None
-        if pos_data:
-            # Save latest data
-            with open("tools/position_data.json", "w") as f:
-                json.dump(pos_data, f, indent=2)
-            
-            if fees_data:
-                with open("tools/fees_data.json", "w") as f:
-                    json.dump(fees_data, f, indent=2)
-
-            try:
-                with open("tools/history.json", "r") as f: history = json.load(f)
-            except: history = []
-            
-            # Use safe defaults if keys missing
-            val_usd = pos_data.get('value_usd', 0)
-            fees_usd = pos_data.get('fees_usd', 0)
-            price_c = pos_data.get('price_cbbtc', 0)
-
-            snapshot = {
-                "date": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "value_usd": val_usd,
-                "fees_usd": fees_usd,
-                "price_cbbtc": price_c
-            }
-            history.append(snapshot)
-            with open("tools/history.json", "w") as f: json.dump(history, f, indent=2)
-            
-            st.cache_data.clear()
-            st.rerun()
+            self.ok, self.error = False, str(e)
+        finally:
+            self.stage = "done"
+            self.finished = time.time()
+
+    def _set_stage(self, stage):
+        self.stage = stage
+
+    @property
+    def running(self):
+        return self.finished is None
+
+@st.cache_resource
+def sync_jobs():
+    """Jobs shared across sessions so a sync survives reruns and page reloads."""
+    return {}
+
+def start_sync(pool_entry):
+    jobs = sync_jobs()
+    job = jobs.get(pool_entry["nft_id"])
+    if job and job.running:
+        return job
+    job = SyncJob(pool_entry)
+    jobs[pool_entry["nft_id"]] = job
+    job.thread.start()
+    return job
+
+SYNC_STAGES = {"starting": 0.05, "position": 0.2, "fees": 0.5, "history": 0.85, "done": 1.0}
+
+@st.fragment(run_every=2)
+def sync_progress(nft_id):
+    job = sync_jobs().get(nft_id)
+    if not job:
+        return
+    if job.running:
+        elapsed = time.time() - job.started
+        st.progress(SYNC_STAGES.get(job.stage, 0.1), text=f"Syncing NFT #{nft_id}: {job.stage} ({elapsed:.0f}s)")
+        return
+    if not st.session_state.get(f"sync_seen_{nft_id}_{job.finished}"):
+        # Only pools the sync wrote to get a new version, so only they are reloaded
+        st.session_state[f"sync_seen_{nft_id}_{job.finished}"] = True
+        st.rerun()
+    if job.ok:
+        st.caption(f"Last sync finished in {job.finished - job.started:.0f}s")
+    else:
+        st.error(f"Sync failed: {job.error or 'see server logs'}")
+
+def sync_button(pool_entry, label="🔄 Sync Data"):
+    job = sync_jobs().get(pool_entry["nft_id"])
+    busy = bool(job and job.running)
+    if st.button(label, use_container_width=True, disabled=busy, key=f"sync_{pool_entry['nft_id']}"):
+        start_sync(pool_entry)
+        st.rerun()
+    sync_progress(pool_entry["nft_id"])
 
 # --- Custom Card Component ---
 def metric_card(title, value, sub_value=None, sub_color="green", tooltip=None):
@@ -230,68 +258,40 @@ def metric_card(title, value, sub_value=None, sub_color="green", tooltip=None):
 
 # Main App
 def main():
-    config, history, pos, fees_data = load_data()
+    pools = load_pools()
+    if not pools:
+        st.warning(f"No pools registered in {POOLS_FILE}.")
+        return
+
+    pool_entry = st.selectbox(
+        "Position", pools,
+        format_func=lambda p: p.get("label", f"Pool #{p['nft_id']}"),
+        label_visibility="collapsed"
+    )
+    pool_data = load_pool_data(pool_entry)
+    pos, history = pool_data["pos"], pool_data["history"]
     
     if not pos:
         st.warning("No data found. Click 'Sync Data'.")
-        if st.button("Sync Data"): sync_data()
+        sync_button(pool_entry, "Sync Data")
         return
 
-    # --- Data Extraction ---
-    symbol0, symbol1 = pos.get('symbol0', 'USDC'), pos.get('symbol1', 'cbBTC')
-    amount0, amount1 = pos.get('amount0', 0), pos.get('amount1', 0)
-    value_usd = pos.get('value_usd', 0)
-    price_cbbtc = pos.get('price_cbbtc', 0)
-    price_lower, price_upper = pos.get('price_lower', 0), pos.get('price_upper', 0)
-    in_range = pos.get('in_range', False)
-    liquidity = pos.get('liquidity', 0)
-    
-    unclaimed_0 = pos.get('unclaimed_0', 0) / 1e6
-    unclaimed_1 = pos.get('unclaimed_1', 0) / 1e8
-    
-    collected_usdc = fees_data.get('total_collected_usdc', 0)
-    collected_cbbtc = fees_data.get('total_collected_cbbtc', 0)
-    
-    fees_collected_value = (collected_usdc * 1.0) + (collected_cbbtc * price_cbbtc)
-    fees_pending_value = (unclaimed_0 * 1.0) + (unclaimed_1 * price_cbbtc)
-    total_fees = fees_pending_value + fees_collected_value
-    
-    total_invested = config.get("total_invested_usd", 118.65)
-    initial_price = config.get("initial_cbbtc_price", 88685)
-    deposit_date_str = config.get("deposit_date", "2025-11-24")
-    # FIX: Default to None to ensure fallback to string date if key missing
-    deposit_ts = config.get("deposit_timestamp", None) 
-    
-    # Precise days active
-    try:
-        if deposit_ts:
-            start_dt = datetime.datetime.fromtimestamp(deposit_ts)
-        else:
-            # Parse string date
-            start_dt = datetime.datetime.strptime(deposit_date_str, "%Y-%m-%d")
-        
-        diff = datetime.datetime.now() - start_dt
-        days_active = diff.total_seconds() / 86400
-    except:
-        days_active = 1
-    
-    net_pnl = value_usd - total_invested + total_fees
-    roi_percent = (net_pnl / total_invested) * 100 if total_invested > 0 else 0
-    
-    fee_apr = calculate_fee_apr(total_fees, total_invested, days_active)
-    total_apr = (roi_percent / days_active) * 365 if days_active > 0 else 0
-    
-    # IL and HODL
-    initial_btc = (total_invested * 0.5) / initial_price
-    initial_usdc = total_invested * 0.5
-    hodl_value = (initial_btc * price_cbbtc) + initial_usdc
-    
-    # Divergence Loss (Value vs HODL excluding fees)
-    divergence_loss = value_usd - hodl_value
-    il_percent = (divergence_loss / hodl_value) * 100 if hodl_value > 0 else 0
-    
-    # LP vs HODL (Total Advantage)
-    lp_vs_hodl = (value_usd + total_fees) - hodl_value
+    # --- Metrics (shared engine, memoized per data snapshot) ---
+    m = compute_metrics(pool_entry, pool_data)
+    symbol0, symbol1 = m.symbol0, m.symbol1
+    amount0, amount1 = m.amount0, m.amount1
+    value_usd = m.value_usd
+    price_cbbtc = m.price_current
+    price_lower, price_upper = m.price_lower, m.price_upper
+    in_range = m.in_range
+    exchange_label = m.exchange_label
+    fees_collected_value, fees_pending_value, total_fees = m.fees_collected_value, m.fees_usd, m.total_fees
+    total_invested, initial_price = m.total_invested, m.initial_price
+    deposit_date_str, days_active = m.deposit_date, m.position_age_days
+    net_pnl, roi_percent = m.net_pnl, m.roi_percent
+    fee_apr, total_apr = m.fee_apr, m.total_apr
+    divergence_loss, il_percent = m.il_usd, m.il_percent
+    lp_vs_hodl = m.lp_vs_hodl
 
     # --- Header Section ---
     c1, c2 = st.columns([3, 1])
@@ -300,7 +300,7 @@ def main():
 <div style="display: flex; align-items: center; gap: 10px;">
 <div style="width: 32px; height: 32px; border-radius: 50%; background: linear-gradient(135deg, #2775ca, #8c4eee);"></div>
 <h1 style="margin: 0; font-size: 1.5rem;">{symbol0} / <span style="color: #2ea043;">{symbol1}</span></h1>
-<span class="bg-badge">Uniswap V3</span>
+<span class="bg-badge">{exchange_label}</span>
 </div>
 <p style="color: #8b949e; margin-top: 5px; font-size: 0.9rem;">Targeting {price_upper:,.0f} - {price_lower:,.0f} {symbol0}/{symbol1}</p>
 """, unsafe_allow_html=True)
@@ -312,8 +312,7 @@ def main():
 <span style="color: {status_color}; font-weight: bold; font-family: monospace; border: 1px solid {status_color}; padding: 4px 8px; border-radius: 4px;">● {status_text}</span>
 </div>
 """, unsafe_allow_html=True)
-        if st.button("🔄 Sync Data", use_container_width=True):
-            sync_data()
+        sync_button(pool_entry)
 
     st.markdown("---")
 
@@ -355,7 +354,7 @@ def main():
     # =========================================================================
     r3c1, r3c2, r3c3, r3c4 = st.columns(4)
     with r3c1:
-        metric_card("cbBTC Price", f"${price_cbbtc:,.0f}", "Current Market", "blue")
+        metric_card(f"{symbol1} Price", f"${price_cbbtc:,.0f}", "Current Market", "blue")
     with r3c2:
         metric_card("Initial Investment", f"${total_invested:,.2f}", "Principal", "gray")
     with r3c3:
@@ -369,15 +368,14 @@ def main():
     # =========================================================================
     r4c1, r4c2, r4c3 = st.columns([1, 1, 2])
     with r4c1:
-        metric_card("Initial cbBTC Price", f"${initial_price:,.0f}", "Avg Entry", "gray")
+        metric_card(f"Initial {symbol1} Price", f"${initial_price:,.0f}", "Avg Entry", "gray")
     with r4c2:
         # Token Balances
-        balance_str = f"{amount0:.2f} USDC<br>{amount1:.5f} cbBTC"
         st.markdown(f"""
 <div class="dashboard-card">
 <div class="card-title">Token Balances</div>
-<div class="card-value" style="font-size: 1.1rem; line-height: 1.5;">{amount0:,.2f} <span style="font-size: 0.8em; color: #8b949e;">USDC</span></div>
-<div class="card-value" style="font-size: 1.1rem; line-height: 1.5;">{amount1:,.5f} <span style="font-size: 0.8em; color: #8b949e;">cbBTC</span></div>
+<div class="card-value" style="font-size: 1.1rem; line-height: 1.5;">{amount0:,.2f} <span style="font-size: 0.8em; color: #8b949e;">{symbol0}</span></div>
+<div class="card-value" style="font-size: 1.1rem; line-height: 1.5;">{amount1:,.5f} <span style="font-size: 0.8em; color: #8b949e;">{symbol1}</span></div>
 </div>
 """, unsafe_allow_html=True)
     with r4c3:
@@ -407,8 +405,20 @@ def main():
     # =========================================================================
     st.markdown("### Value History")
     if history:
+        # Heavy charting stack is only imported once there is something to plot
+        import pandas as pd
+        import plotly.graph_objects as go
+
         df = pd.DataFrame(history)
         df['date'] = pd.to_datetime(df['date'])
+        df = df.dropna(subset=['value_usd']).reset_index(drop=True)
+
+        # Downsample long histories so the chart stays light; full series on demand
+        if len(df) > DEFAULT_TARGET_POINTS:
+            full_res = st.toggle(f"Full resolution ({len(df)} points)", value=False)
+            if not full_res:
+                xs = (df['date'].astype('int64') // 10**9).tolist()
+                df = df.iloc[lttb_indices(xs, df['value_usd'].tolist(), DEFAULT_TARGET_POINTS)]
         
         fig = go.Figure()
         fig.add_trace(go.Scatter(
@@ -436,12 +446,11 @@ def main():
     # =========================================================================
     # ROW 6: Performance Summary (Yield Projections)
     # =========================================================================
-    avg_daily = total_fees / days_active if days_active > 0 else 0
     projections = {
-        "Daily": avg_daily,
-        "Weekly": avg_daily * 7,
-        "Monthly": avg_daily * 30,
-        "Yearly": avg_daily * 365
+        "Daily": m.daily_fee,
+        "Weekly": m.weekly_fee,
+        "Monthly": m.monthly_fee,
+        "Yearly": m.yearly_fee
     }
 
     st.markdown("### Performance Summary (Projected Yield)")
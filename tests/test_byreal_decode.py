@@ -0,0 +1,155 @@
+import base64
+import hashlib
+import os
+import struct
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tools.providers import byreal_provider as byreal
+
+# Account bytes are laid out field by field from the Raydium CLMM IDL (which
+# ByReal's program forks), so the decoders' hand-written offsets are checked
+# against the struct order rather than against themselves.
+
+B58 = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+USDC_MINT = "EPjFWdd5AufqSSqeM2qN1xzybapC8G4wEGGkZwyTDt1v"
+SOL_MINT = "So11111111111111111111111111111111111111112"
+NFT_MINT = "9Qu5EfzMVBb3xE6dW7mrzrmRVJbXJgzr7cK6xj8yPCAG"
+POOL_ID = "8sLbNZoA1cfnvMJLPfp98ZLAnFSYCFApfJKMbiXNLwxj"
+
+def b58decode(text):
+    n = 0
+    for ch in text:
+        n = n * 58 + B58.index(ch)
+    raw = n.to_bytes((n.bit_length() + 7) // 8, "big")
+    return b"\0" * (len(text) - len(text.lstrip("1"))) + raw
+
+def pack(*fields):
+    """Little-endian packed struct from (format, value) pairs; 'u128'/'i128' and raw bytes allowed."""
+    out = b""
+    for fmt, value in fields:
+        if fmt in ("u128", "i128"):
+            out += value.to_bytes(16, "little", signed=fmt == "i128")
+        elif fmt == "bytes":
+            out += value
+        else:
+            out += struct.pack("<" + fmt, value)
+    return out
+
+def discriminator(kind, name):
+    return hashlib.sha256(f"{kind}:{name}".encode()).digest()[:8]
+
+def pool_state(tick_current=-20_123, sqrt_price=2 ** 64 * 13, liquidity=(1 << 100) + 7):
+    return pack(
+        ("bytes", discriminator("account", "PoolState")),
+        ("B", 254),                              # bump
+        ("bytes", bytes(range(32))),             # amm_config
+        ("bytes", bytes(range(32, 64))),         # owner
+        ("bytes", b58decode(SOL_MINT)),          # token_mint_0
+        ("bytes", b58decode(USDC_MINT)),         # token_mint_1
+        ("bytes", b"\1" * 32), ("bytes", b"\2" * 32), ("bytes", b"\3" * 32),  # vaults, observation_key
+        ("B", 9), ("B", 6),                      # mint_decimals_0/1
+        ("H", 10),                               # tick_spacing
+        ("u128", liquidity),
+        ("u128", sqrt_price),
+        ("i", tick_current),
+        ("H", 0), ("H", 0),                      # padding3, padding4
+        ("u128", 2 ** 127 + 5),                  # fee_growth_global_0_x64
+        ("u128", 3 * 2 ** 64),                   # fee_growth_global_1_x64
+        ("Q", 11), ("Q", 12),                    # protocol_fees_token_0/1
+    ) + bytes(1544 - 325)
+
+def personal_position(tick_lower=-30_000, tick_upper=-10_000):
+    return pack(
+        ("bytes", discriminator("account", "PersonalPositionState")),
+        ("B", 255),                              # bump
+        ("bytes", b58decode(NFT_MINT)),
+        ("bytes", b58decode(POOL_ID)),
+        ("i", tick_lower), ("i", tick_upper),
+        ("u128", 123_456_789_012),               # liquidity
+        ("u128", 2 ** 128 - 9),                  # fee_growth_inside_0_last_x64 (wrapped)
+        ("u128", 77 * 2 ** 64),                  # fee_growth_inside_1_last_x64
+        ("Q", 1_500), ("Q", 2_500),              # token_fees_owed_0/1
+    ) + bytes(3 * 24 + 8 + 7 * 8)                # reward_infos, recent_epoch, padding
+
+def tick_state(tick, outside0, outside1):
+    return pack(
+        ("i", tick),
+        ("i128", -5_000), ("u128", 5_000),       # liquidity_net, liquidity_gross
+        ("u128", outside0), ("u128", outside1),  # fee_growth_outside_0/1_x64
+        ("bytes", bytes(3 * 16 + 13 * 4)),       # reward growths, padding
+    )
+
+def tick_array(start, spacing, outside):
+    """TickArrayState whose tick k has fee_growth_outside = outside(k)."""
+    ticks = b"".join(tick_state(start + k * spacing, *outside(k)) for k in range(byreal.TICK_ARRAY_SIZE))
+    return pack(("bytes", discriminator("account", "TickArrayState")), ("bytes", b58decode(POOL_ID)),
+                ("i", start)) + ticks + bytes(1 + 115)
+
+def test_b58_round_trip():
+    assert all(len(b58decode(key)) == 32 for key in (USDC_MINT, SOL_MINT, NFT_MINT, POOL_ID))
+    assert byreal.b58encode(b58decode(USDC_MINT)) == USDC_MINT
+    assert byreal.b58encode(b58decode(SOL_MINT)) == SOL_MINT
+    assert byreal.b58encode(bytes(32)) == "1" * 32
+
+def test_decode_pool():
+    assert len(pool_state()) == 1544
+    pool = byreal.decode_pool(pool_state())
+    assert pool == {
+        "token_mint_0": SOL_MINT, "token_mint_1": USDC_MINT,
+        "decimals0": 9, "decimals1": 6, "tick_spacing": 10,
+        "liquidity": (1 << 100) + 7, "sqrt_price_x64": 2 ** 64 * 13, "tick_current": -20_123,
+        "fee_growth_global_0_x64": 2 ** 127 + 5, "fee_growth_global_1_x64": 3 * 2 ** 64,
+    }
+
+def test_decode_pool_positive_tick():
+    assert byreal.decode_pool(pool_state(tick_current=443_635))["tick_current"] == 443_635
+
+def test_decode_position():
+    assert len(personal_position()) == 281
+    position = byreal.decode_position(personal_position())
+    assert position == {
+        "nft_mint": NFT_MINT, "pool_id": POOL_ID,
+        "tick_lower": -30_000, "tick_upper": -10_000, "liquidity": 123_456_789_012,
+        "fee_growth_inside_0_last_x64": 2 ** 128 - 9, "fee_growth_inside_1_last_x64": 77 * 2 ** 64,
+        "token_fees_owed_0": 1_500, "token_fees_owed_1": 2_500,
+    }
+
+def test_decode_tick():
+    spacing = 10
+    start = byreal.tick_array_start_index(-20_123, spacing)
+    data = tick_array(start, spacing, lambda k: (1000 + k, (2 ** 128 - 1) - k))
+    assert len(data) == 10_240
+    for k in (0, 1, 37, byreal.TICK_ARRAY_SIZE - 1):
+        tick = start + k * spacing
+        assert byreal.decode_tick(data, start, tick, spacing) == {
+            "fee_growth_outside_0_x64": 1000 + k, "fee_growth_outside_1_x64": (2 ** 128 - 1) - k}
+
+def test_tick_array_start_index():
+    assert byreal.tick_array_start_index(0, 10) == 0
+    assert byreal.tick_array_start_index(599, 10) == 0
+    assert byreal.tick_array_start_index(600, 10) == 600
+    assert byreal.tick_array_start_index(-1, 10) == -600
+    assert byreal.tick_array_start_index(-20_123, 10) == -20_400
+
+def program_data(*fields):
+    return "Program data: " + base64.b64encode(pack(*fields)).decode()
+
+def collect_event(mint, amount0, amount1):
+    return program_data(("bytes", discriminator("event", "CollectPersonalFeeEvent")), ("bytes", b58decode(mint)),
+                        ("bytes", b"\4" * 32), ("bytes", b"\5" * 32), ("Q", amount0), ("Q", amount1))
+
+def decrease_event(mint, withdrawn0, withdrawn1, fee0, fee1):
+    return program_data(("bytes", discriminator("event", "DecreaseLiquidityEvent")), ("bytes", b58decode(mint)),
+                        ("u128", 10 ** 9), ("Q", withdrawn0), ("Q", withdrawn1), ("Q", fee0), ("Q", fee1),
+                        ("Q", 0), ("Q", 0), ("Q", 0), ("Q", 0), ("Q", 0))
+
+def test_decode_events_collect():
+    logs = ["Program log: Instruction: CollectFee", collect_event(NFT_MINT, 40, 50), collect_event(POOL_ID, 1, 1)]
+    assert byreal.decode_events(logs, NFT_MINT) == [
+        {"kind": "collect", "fee0": 40, "fee1": 50, "withdrawn0": 0, "withdrawn1": 0}]
+
+def test_decode_events_decrease_counts_fees_once():
+    logs = [decrease_event(NFT_MINT, 700, 800, 7, 8), collect_event(NFT_MINT, 7, 8), "Program data: !!not base64"]
+    assert byreal.decode_events(logs, NFT_MINT) == [
+        {"kind": "decrease", "fee0": 7, "fee1": 8, "withdrawn0": 700, "withdrawn1": 800}]
@@ -0,0 +1,39 @@
+import math
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tools.decimate import history_series, lttb_indices, minmax_indices
+
+def test_lttb_keeps_threshold_points_in_order():
+    xs = list(range(1_000))
+    ys = [math.sin(x / 50) for x in xs]
+    kept = lttb_indices(xs, ys, 100)
+    assert len(kept) == 100
+    assert kept[0] == 0 and kept[-1] == 999
+    assert all(a < b for a, b in zip(kept, kept[1:]))
+
+def test_lttb_keeps_spikes():
+    xs = list(range(500))
+    ys = [0.0] * 500
+    ys[123], ys[321] = 50.0, -80.0
+    kept = lttb_indices(xs, ys, 20)
+    assert 123 in kept and 321 in kept
+
+def test_lttb_short_series_untouched():
+    assert lttb_indices([0, 1, 2], [5, 6, 7], 10) == [0, 1, 2]
+    assert lttb_indices(list(range(10)), [0] * 10, 2) == list(range(10))
+
+def test_minmax_keeps_bucket_extremes():
+    ys = [(i * 37) % 101 for i in range(1_000)]
+    kept = minmax_indices(ys, 50)
+    assert kept[0] == 0 and kept[-1] == 999 and len(kept) <= 50
+    assert max(ys[i] for i in kept) == max(ys) and min(ys[i] for i in kept) == min(ys)
+
+def test_history_series_rejects_unknown_method():
+    history = [{"date": "2026-01-01 00:00:00", "value_usd": float(i)} for i in range(10)]
+    assert history_series(history, points=5, method="minmax")["total_points"] == 10
+    with pytest.raises(ValueError, match="unknown method"):
+        history_series(history, points=5, method="avg")
@@ -0,0 +1,83 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tools import fetch_collected_fees as fees
+from tools import state_db
+
+NFT_ID = 4227642
+
+@pytest.fixture
+def conn(tmp_path):
+    return state_db.connect(str(tmp_path / "state.db"), seed=False)
+
+def event(block, log_index=0, fee0=10, fee1=1):
+    return {"tx_hash": f"0x{block:064x}", "log_index": log_index, "block_number": block, "kind": "collect",
+            "fee0": fee0, "fee1": fee1, "withdrawn0": 0, "withdrawn1": 0}
+
+def synced(conn, confirmed=1_000, tip=1_064):
+    """Ledger with events on both sides of the confirmed block, checkpoints at confirmed / tip."""
+    state_db.add_fee_events(conn, NFT_ID, [event(900), event(1_000, fee0=20), event(1_010, fee0=300), event(1_060, 1, 4_000)],
+                            [(fees.checkpoint_name(NFT_ID), confirmed, "0xconfirmed"), (fees.tip_name(NFT_ID), tip, "0xtip")])
+
+def checkpoints(conn):
+    return [(state_db.get_checkpoint(conn, name), state_db.get_checkpoint_hash(conn, name))
+            for name in (fees.checkpoint_name(NFT_ID), fees.tip_name(NFT_ID))]
+
+def test_events_are_deduplicated(conn):
+    assert state_db.add_fee_events(conn, NFT_ID, [event(900), event(901)]) == 2
+    assert state_db.add_fee_events(conn, NFT_ID, [event(901), event(902)]) == 1
+    totals = state_db.fee_totals(conn, NFT_ID)
+    assert (totals["fee0"], totals["events"], totals["last_block"]) == (30, 3, 902)
+
+def test_resume_after_tip_when_tail_unchanged(conn):
+    synced(conn)
+    start = fees.resume_point(conn, NFT_ID, 1_000, 1_064, (1_064, "0xtip"), (1_000, "0xconfirmed"))
+    assert start == (1_065, 1_000, "0xconfirmed")
+    assert state_db.fee_totals(conn, NFT_ID)["events"] == 4
+
+def test_new_pool_scans_after_confirmed(conn):
+    assert fees.resume_point(conn, NFT_ID, 499, None, None, None) == (500, 499, None)
+
+def test_shallow_reorg_rolls_back_tentative_tail(conn):
+    synced(conn)
+    start = fees.resume_point(conn, NFT_ID, 1_000, 1_064, (1_064, "0xother"), (1_000, "0xconfirmed"))
+    assert start == (1_001, 1_000, "0xconfirmed")
+    assert [e["block_number"] for e in state_db.fee_events(conn, NFT_ID)] == [900, 1_000]
+    totals = state_db.fee_totals(conn, NFT_ID)
+    assert (totals["fee0"], totals["fee1"], totals["events"], totals["last_block"]) == (30, 2, 2, 1_000)
+    assert checkpoints(conn) == [(1_000, "0xconfirmed"), (1_000, "0xconfirmed")]
+
+def test_deep_reorg_rescans_before_confirmed(conn, monkeypatch):
+    monkeypatch.setattr(fees, "get_pool_start_block", lambda nft_id: 0)
+    confirmed = fees.DEEP_REORG_RESCAN + 950
+    synced(conn, confirmed, confirmed + 64)
+    start = fees.resume_point(conn, NFT_ID, confirmed, confirmed + 64, (confirmed + 64, "0xother"), (confirmed, "0xreplaced"))
+    assert start == (951, 950, None)
+    assert [e["block_number"] for e in state_db.fee_events(conn, NFT_ID)] == [900]
+    assert state_db.fee_totals(conn, NFT_ID)["fee0"] == 10
+    assert checkpoints(conn) == [(950, None), (950, None)]
+
+def test_deep_reorg_stops_at_pool_start(conn, monkeypatch):
+    monkeypatch.setattr(fees, "get_pool_start_block", lambda nft_id: 950)
+    synced(conn)
+    start = fees.resume_point(conn, NFT_ID, 1_000, 1_064, (1_064, "0xother"), (1_000, "0xreplaced"))
+    assert start == (950, 949, None)
+    assert state_db.fee_totals(conn, NFT_ID)["events"] == 1
+
+def test_unverified_legacy_tail_is_rescanned(conn):
+    # Checkpoints written before block hashes were tracked
+    state_db.add_fee_events(conn, NFT_ID, [event(900), event(1_050)],
+                            [(fees.checkpoint_name(NFT_ID), 1_000), (fees.tip_name(NFT_ID), 1_064)])
+    start = fees.resume_point(conn, NFT_ID, 1_000, 1_064, (1_064, "0xtip"), (1_000, "0xconfirmed"))
+    assert start == (1_001, 1_000, None)
+    assert [e["block_number"] for e in state_db.fee_events(conn, NFT_ID)] == [900]
+
+def test_rollback_matches_rebuilt_totals(conn):
+    state_db.add_fee_events(conn, NFT_ID, [event(b, fee0=b, fee1=2 * b) for b in range(100, 200, 7)])
+    assert state_db.rollback_fee_events(conn, NFT_ID, 150) == 7
+    rolled = state_db.fee_totals(conn, NFT_ID)
+    state_db.rebuild_fee_totals(conn, NFT_ID)
+    assert state_db.fee_totals(conn, NFT_ID) == rolled
@@ -0,0 +1,69 @@
+import math
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tools.liquidity import TickTable
+
+SPACING = 60
+# Positions [-600, 600) with 5e12 and [-1200, 1800) with 2e12 liquidity; current tick 30
+NETS = {-1200: 2e12, -600: 5e12, 600: -5e12, 1800: -2e12}
+CURRENT_TICK = 30
+
+def table(fee=3000):
+    return TickTable("0xpool", fee, SPACING, CURRENT_TICK, 1.0001 ** (CURRENT_TICK / 2 + 3), int(7e12),
+                     sorted(NETS), [int(NETS[t]) for t in sorted(NETS)], [-1, 0])
+
+def reference_swap(t, amount_in, zero_for_one):
+    """Walk the curve one initialized tick at a time; NaN once the liquidity runs out."""
+    x = amount_in * (1 - t.fee / 1e6)
+    s, L, out = t.sqrt_price, float(t.active_liquidity), 0.0
+    ticks = sorted(NETS, reverse=zero_for_one)
+    ticks = [k for k in ticks if (k <= t.current_tick if zero_for_one else k > t.current_tick)]
+    for k in ticks:
+        b = 1.0001 ** (k / 2)
+        need = L * (1 / b - 1 / s) if zero_for_one else L * (b - s)
+        if x <= need:
+            break
+        x -= need
+        out += L * (s - b) if zero_for_one else L * (1 / s - 1 / b)
+        s = b
+        L += -NETS[k] if zero_for_one else NETS[k]
+    else:
+        if x > 0:
+            return math.nan
+    if zero_for_one:
+        end = 1 / (1 / s + x / L)
+        return out + L * (s - end)
+    end = s + x / L
+    return out + L * (1 / s - 1 / end)
+
+def test_liquidity_by_tick():
+    t = table()
+    assert t.liquidity_at([CURRENT_TICK, -601, -1201, 700, 1799, 1800]).tolist() == [7e12, 2e12, 0.0, 2e12, 2e12, 0.0]
+    assert np.isnan(t.liquidity_at([-20_000])[0])
+
+@pytest.mark.parametrize("zero_for_one", [True, False])
+def test_swap_matches_reference(zero_for_one):
+    t = table()
+    amounts = np.concatenate(([0.0, 1.0], np.geomspace(1e3, 1e10, 8), np.linspace(2e10, 4e11, 60)))
+    expected = [reference_swap(t, a, zero_for_one) for a in amounts]
+    np.testing.assert_allclose(t.swap(amounts, zero_for_one), expected, rtol=1e-9, atol=1e-6)
+
+@pytest.mark.parametrize("zero_for_one", [True, False])
+def test_swap_past_the_liquidity_is_nan(zero_for_one):
+    t = table()
+    out = t.swap([1e11, 1e15], zero_for_one)
+    assert np.isfinite(out[0]) and np.isnan(out[1])
+
+def test_swap_fee_and_price_impact():
+    t, free = table(fee=3000), table(fee=0)
+    small = 1e4
+    price = t.sqrt_price ** 2  # token1 per token0
+    assert t.swap([small], True)[0] == pytest.approx(free.swap([small * 0.997], True)[0])
+    # A tiny trade fills at the spot price; a large one at a worse average price
+    assert free.swap([small], True)[0] / small == pytest.approx(price, rel=1e-6)
+    assert free.swap([1e11], True)[0] / 1e11 < price * 0.99
@@ -0,0 +1,43 @@
+import os
+import pstats
+import subprocess
+import sys
+import textwrap
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+from tools import profiling
+
+# A stage that profiles itself like dashboard_gen_v3.py does
+STAGE = textwrap.dedent("""
+    import sys
+    sys.path.append({root!r})
+    from tools import profiling
+
+    def render_stage():
+        return sum(i * i for i in range(200_000))
+
+    def main():
+        render_stage()
+
+    if __name__ == "__main__":
+        with profiling.profile("stage", profiling.cli_mode()):
+            main()
+""")
+
+def test_wrapped_stage_profiles_its_own_functions(tmp_path, monkeypatch):
+    script = tmp_path / "stage.py"
+    script.write_text(STAGE.format(root=PROJECT_ROOT))
+    profile_dir = tmp_path / "profiles"
+    env = {**os.environ, "PROFILE": "cprofile", "PROFILE_RUN": "run1", "PROFILE_DIR": str(profile_dir)}
+    env.pop("PROFILE_PID", None)
+    monkeypatch.setenv("PROFILE", "cprofile")
+    cmd = profiling.wrap_command([sys.executable, str(script)])  # as sync.run_script launches stages
+    proc = subprocess.run(cmd, env=env, capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stderr
+    assert proc.stdout.count("Profile:") == 1
+
+    profs = [f for f in os.listdir(profile_dir / "run1") if f.endswith(".prof")]
+    assert len(profs) == 1
+    functions = {func for (_filename, _line, func) in pstats.Stats(str(profile_dir / "run1" / profs[0])).stats}
+    assert {"main", "render_stage"} <= functions
@@ -0,0 +1,53 @@
+import math
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tools import range_risk
+
+def pool(nft_id, price_a, price_b, symbol="cbBTC", returns=None):
+    return {"nft_id": nft_id, "label": f"Pool #{nft_id}", "symbol": symbol, "price": 100.0,
+            "price_a": price_a, "price_b": price_b, "value_usd": 1_000.0, "fee_yield_per_day": 0.001,
+            "returns": np.array([]) if returns is None else returns, "returns_source": "history"}
+
+def test_paths_are_driftless():
+    # A range far above the price holds only the volatile token: net = price ratio - 1, zero on average
+    ranges = [(math.log(1e6), math.log(2e6), 0.0)]
+    t = np.random.default_rng(2).standard_t(5, 5_000)
+    t -= t.mean()  # run() centers the bootstrap shocks the same way
+    for shocks in (None, t / t.std() * 0.8):
+        task = (np.random.SeedSequence(1), 50_000, 30, 1 / 365, 0.8, shocks, ranges)
+        result = range_risk.simulate_chunk(task)[0]
+        assert (result["steps_in"] == 0).all()
+        assert float(result["net"].mean()) == pytest.approx(0.0, abs=0.01)
+
+def test_exit_probability_grows_with_narrower_ranges():
+    results = range_risk.run([pool(1, 95, 105), pool(2, 80, 125), pool(3, 1, 10_000)], paths=20_000, horizon_days=30)
+    narrow, wide, full = (r["exit_probability"] for r in results)
+    assert narrow > wide > full == 0.0
+    assert results[2]["time_in_range"] == 100.0
+    assert results[2]["il"]["p50"] == pytest.approx(0.0, abs=0.5)
+
+def test_in_range_fees_match_the_yield():
+    full = range_risk.run([pool(1, 1, 10_000)], paths=5_000, horizon_days=30)[0]
+    assert full["fee_yield"]["p50"] == pytest.approx(0.1 * 30, rel=1e-4)
+
+def test_results_do_not_depend_on_the_other_pools():
+    alone = range_risk.run([pool(1, 90, 110)], paths=25_000)
+    together = range_risk.run([pool(7, 50, 60, symbol="SOL"), pool(1, 90, 110), pool(2, 80, 120)], paths=25_000)
+    assert together[1] == alone[0]
+
+def test_bootstrap_scales_with_the_step():
+    returns = np.random.default_rng(4).standard_normal(500) * 0.6
+    coarse = range_risk.run([pool(1, 90, 110, returns=returns)], paths=20_000, step_hours=8, model="bootstrap")[0]
+    fine = range_risk.run([pool(1, 90, 110, returns=returns)], paths=20_000, step_hours=2, model="bootstrap")[0]
+    assert coarse["model"] == "bootstrap" and coarse["volatility"] == pytest.approx(60, rel=0.1)
+    # Same horizon and volatility: the exit probability barely depends on the step size
+    assert abs(coarse["exit_probability"] - fine["exit_probability"]) < 10
+
+def test_results_do_not_depend_on_the_workers():
+    pools = lambda: [pool(1, 90, 110), pool(2, 80, 120)]
+    assert range_risk.run(pools(), paths=25_000, workers=2) == range_risk.run(pools(), paths=25_000, workers=1)
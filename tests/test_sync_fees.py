@@ -0,0 +1,47 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tools import state_db, storage, sync
+
+NFT_ID = 999001
+
+class FakeByReal:
+    """Stands in for ByRealProvider: each fee sync decodes one more transaction into the tx cache."""
+
+    def __init__(self, tools_dir):
+        self.cache = os.path.join(tools_dir, "pools", str(NFT_ID), "solana_tx_cache.json")
+        self.synced = 0
+
+    def fetch_fees_data(self):
+        self.synced += 1
+        state = storage.read_json(self.cache, {"cursor": None, "transactions": {}})
+        state["transactions"][f"sig{self.synced}"] = {
+            "slot": 1_000 + self.synced, "block_time": 1_700_000_000 + self.synced,
+            "events": [{"kind": "collect", "fee0": 10 * self.synced, "fee1": 1, "withdrawn0": 0, "withdrawn1": 0}]}
+        storage.write_json(self.cache, state)
+        return {"nft_id": NFT_ID, "events_count": len(state["transactions"])}
+
+@pytest.fixture
+def byreal_sync(tmp_path, monkeypatch):
+    tools_dir = tmp_path / "tools"
+    conn = state_db.connect(str(tools_dir / "state.db"), seed=False)
+    provider = FakeByReal(str(tools_dir))
+    monkeypatch.chdir(tmp_path)  # sync writes tools/pools/<id>/ relative to the project root
+    monkeypatch.setattr(state_db, "SCRIPT_DIR", str(tools_dir))
+    monkeypatch.setattr(state_db, "connect", lambda *args, **kwargs: conn)
+    monkeypatch.setattr(sync.ProviderFactory, "create", staticmethod(lambda config: provider))
+    monkeypatch.setattr(sync, "run_script", lambda script, args=None: True)
+    entry = {"nft_id": NFT_ID, "exchange": "byreal", "network": "solana"}
+    return conn, lambda: sync.sync_pool(entry, pos_data={"nft_id": NFT_ID})
+
+def test_each_sync_adds_new_solana_events_to_the_ledger(byreal_sync):
+    conn, run = byreal_sync
+    assert run()
+    assert [e["tx_hash"] for e in state_db.fee_events(conn, NFT_ID)] == ["sig1"]
+    assert run()
+    events = state_db.fee_events(conn, NFT_ID)
+    assert [(e["tx_hash"], e["block_number"], e["fee0"]) for e in events] == [("sig1", 1_001, 10), ("sig2", 1_002, 20)]
+    assert state_db.fee_totals(conn, NFT_ID)["fee0"] == 30
@@ -0,0 +1,30 @@
+import os
+import sys
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tools import rpc, state_db, v4_pool_index
+
+START = v4_pool_index.POOL_MANAGER_DEPLOY_BLOCK
+CHUNK = v4_pool_index.CHUNK_SIZE
+
+def test_failed_chunk_stops_the_scan(tmp_path, monkeypatch):
+    conn = v4_pool_index.connect(str(tmp_path / "state.db"))
+    requested, lock = [], threading.Lock()
+
+    def get_logs(address, topics, from_block, to_block, rpc_url=None):
+        with lock:
+            requested.append(from_block)
+        return None if from_block == START + 5 * CHUNK else []
+
+    monkeypatch.setattr(rpc, "get_logs", get_logs)
+    assert v4_pool_index.update(conn, to_block=START + 1_000 * CHUNK, workers=2) == 0
+    # Chunks before the failure are committed; only the in-flight window was requested past it
+    assert state_db.get_checkpoint(conn, v4_pool_index.CHECKPOINT) == START + 5 * CHUNK - 1
+    assert len(requested) <= 5 + 1 + 2 * 2
+
+def test_all_chunks_committed_in_order(tmp_path, monkeypatch):
+    conn = v4_pool_index.connect(str(tmp_path / "state.db"))
+    monkeypatch.setattr(rpc, "get_logs", lambda address, topics, lo, hi, rpc_url=None: [])
+    v4_pool_index.update(conn, to_block=START + 37 * CHUNK + 5, workers=3)
+    assert state_db.get_checkpoint(conn, v4_pool_index.CHECKPOINT) == START + 37 * CHUNK + 5
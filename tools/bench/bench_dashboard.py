@@ -0,0 +1,120 @@
+"""
+Dashboard render benchmark.
+
+Renders synthetic portfolios of increasing size through the template engine
+and reports wall time and peak Python memory per pool count, so we can check
+that rendering scales linearly with the number of pools.
+
+Usage: python tools/bench/bench_dashboard.py [--sizes 1,10,100,1000] [--history 500]
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from tools import dashboard_gen_v3 as gen
+from tools.templating import FragmentCache
+
+def synthetic_pool(index, history_points, now):
+    """Build a pool entry + raw data bundle shaped like tools/pools/<id>/*.json"""
+    nft_id = 5000000 + index
+    start = now - datetime.timedelta(hours=history_points)
+    history = [
+        {
+            "date": (start + datetime.timedelta(hours=h)).strftime("%Y-%m-%d %H:%M:%S"),
+            "value_usd": 300 + 20 * ((h * 7919 + index) % 97) / 97,
+        }
+        for h in range(history_points)
+    ]
+    entry = {
+        "nft_id": nft_id,
+        "label": f"Bench pool {index}",
+        "total_invested_usd": 300.0,
+        "deposit_date": start.strftime("%Y-%m-%d"),
+        "initial_cbbtc_price": 88000,
+    }
+    data = {
+        "pos": {
+            "symbol0": "USDC", "symbol1": "cbBTC",
+            "value_usd": history[-1]["value_usd"] if history else 300.0,
+            "amount0": 150.0, "amount1": 0.0017,
+            "in_range": index % 3 != 0,
+            "price_cbbtc": 90000.0, "price_current": 90000.0,
+            "price_lower": 110000.0, "price_upper": 70000.0,
+            "unclaimed_0": 1200000, "unclaimed_1": 1500,
+        },
+        "config": {},
+        "fees": {"total_collected_usdc": 2.5, "total_collected_cbbtc": 0.00003},
+        "history": history,
+        "manual": None,
+    }
+    return entry, data
+
+def run(size, history_points, now):
+    all_metrics = [gen.calc_metrics(*synthetic_pool(i, history_points, now), now) for i in range(size)]
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, "index.html")
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        gen.render_dashboard(all_metrics, output, now, cache=FragmentCache(directory=None))
+        cold = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        warm_cache = FragmentCache(directory=None)
+        gen.render_dashboard(all_metrics, output, now, cache=warm_cache)
+        start = time.perf_counter()
+        gen.render_dashboard(all_metrics, output, now, cache=warm_cache)
+        warm = time.perf_counter() - start
+
+        page_bytes = os.path.getsize(output)
+
+    return {
+        "pools": size,
+        "cold_s": cold,
+        "warm_s": warm,
+        "cold_ms_per_pool": cold * 1000 / size,
+        "peak_mem_kb": peak / 1024,
+        "peak_mem_kb_per_pool": peak / 1024 / size,
+        "page_kb": page_bytes / 1024,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dashboard rendering")
+    parser.add_argument("--sizes", default="1,10,100,1000")
+    parser.add_argument("--history", type=int, default=500, help="history points per pool")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    now = datetime.datetime.now().replace(second=0, microsecond=0)
+    sizes = [int(s) for s in args.sizes.split(",")]
+
+    # Warm the template compiler/bytecode cache so the first size is not penalised
+    run(1, 1, now)
+
+    results = []
+    print(f"{'pools':>6} {'cold s':>9} {'warm s':>9} {'ms/pool':>9} {'peak KB':>10} {'KB/pool':>9} {'page KB':>10}")
+    for size in sizes:
+        r = run(size, args.history, now)
+        results.append(r)
+        print(f"{r['pools']:>6} {r['cold_s']:>9.3f} {r['warm_s']:>9.3f} {r['cold_ms_per_pool']:>9.2f} "
+              f"{r['peak_mem_kb']:>10.0f} {r['peak_mem_kb_per_pool']:>9.1f} {r['page_kb']:>10.0f}")
+
+    if len(results) > 1:
+        first, last = results[0], results[-1]
+        print(f"\nPer-pool cost ratio ({last['pools']} vs {first['pools']} pools): "
+              f"time {last['cold_ms_per_pool'] / first['cold_ms_per_pool']:.2f}x, "
+              f"memory {last['peak_mem_kb_per_pool'] / first['peak_mem_kb_per_pool']:.2f}x (~1x means linear)")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
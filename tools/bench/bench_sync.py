@@ -0,0 +1,214 @@
+"""
+Offline sync benchmark against the recorded-RPC replay server.
+
+Every scenario runs in a fresh interpreter inside a throwaway copy of tools/
+(its own pools.json, pool files, state database and caches), pointed at a
+local rpc_replay.ReplayServer, so nothing touches live endpoints or the real
+tree. Scenarios at each pool count:
+
+  fetch_data   fetch_pool_data.fetch_data for every pool
+  fetch_fees   fetch_collected_fees.fetch_fees for every pool (log scan from start_block)
+  sync         sync.main (batched positions, fee/history stages, dashboard)
+  dashboard    dashboard_gen_v3.main over a pre-seeded state store
+
+Results (wall time, RPC traffic, 429s) go to a JSON report; with --baseline
+the run fails if any scenario got slower than --threshold times the baseline.
+
+Usage: python tools/bench/bench_sync.py [--sizes 1,10,100,1000] [--scenarios fetch_data,sync]
+                                        [--latency-ms 5] [--rate-429 0.02] [--max-log-range 5000]
+                                        [--out bench_report.json] [--baseline old.json]
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(PROJECT_ROOT)
+
+SCENARIOS = ("fetch_data", "fetch_fees", "sync", "dashboard")
+NFT_BASE = 9_000_000
+SCAN_BLOCKS = 60_000  # fee scan length per pool
+DASHBOARD_HISTORY = 500
+WORKSPACE_IGNORE = shutil.ignore_patterns("pools", "pools.json", ".cache", "state.db*", "__pycache__", "*.lock", "*.tmp")
+
+# --- worker side (runs inside the workspace copy) ------------------------------
+
+def _pools(size):
+    from tools.bench.rpc_replay import HEAD_BLOCK
+    return [{
+        "nft_id": NFT_BASE + i, "label": f"Bench USDC/cbBTC #{i}",
+        "exchange": "uniswap_v3", "network": "base", "version": "v3",
+        "total_invested_usd": 300.0, "deposit_date": "2026-01-01", "initial_cbbtc_price": 88000,
+        "start_block": HEAD_BLOCK - SCAN_BLOCKS,
+    } for i in range(size)]
+
+def _seed_dashboard(size):
+    """Registry + state store as left by a sync, built from bench_dashboard's synthetic pools."""
+    from tools import state_db
+    from tools.bench.bench_dashboard import synthetic_pool
+    now = datetime.datetime.now().replace(second=0, microsecond=0)
+    conn = state_db.connect(seed=False)
+    entries = []
+    for i in range(size):
+        entry, data = synthetic_pool(i, DASHBOARD_HISTORY, now)
+        entries.append(entry)
+        state_db.upsert_pool(conn, entry)
+        state_db.save_position(conn, entry["nft_id"], data["pos"])
+        state_db.save_fees(conn, entry["nft_id"], data["fees"])
+        with conn:
+            conn.executemany("INSERT INTO snapshots (nft_id, data) VALUES (?, ?)",
+                             [(entry["nft_id"], json.dumps(h)) for h in data["history"]])
+    return entries
+
+def worker(scenario, size, result_file):
+    from tools import storage
+    if scenario == "dashboard":
+        pools = _seed_dashboard(size)
+    else:
+        pools = _pools(size)
+    storage.write_json("tools/pools.json", {"pools": pools})
+
+    start = time.perf_counter()
+    if scenario == "fetch_data":
+        from tools import fetch_pool_data
+        ok = sum(bool(fetch_pool_data.fetch_data(p["nft_id"])) for p in pools)
+    elif scenario == "fetch_fees":
+        from tools import fetch_collected_fees
+        ok = sum(bool(fetch_collected_fees.fetch_fees(p["nft_id"])) for p in pools)
+    elif scenario == "sync":
+        from tools import sync
+        sync.main()
+        ok = sum(os.path.exists(f"tools/pools/{p['nft_id']}/history.json") for p in pools)
+    else:
+        from tools import dashboard_gen_v3
+        dashboard_gen_v3.main()
+        ok = len(pools) if os.path.exists("index.html") else 0
+    elapsed = time.perf_counter() - start
+    storage.write_json(result_file, {"seconds": elapsed, "pools_ok": ok})
+
+# --- driver side ------------------------------------------------------------------
+
+def make_workspace():
+    workspace = tempfile.mkdtemp(prefix="pool-bench-")
+    shutil.copytree(os.path.join(PROJECT_ROOT, "tools"), os.path.join(workspace, "tools"), ignore=WORKSPACE_IGNORE)
+    return workspace
+
+def run(server, scenario, size, verbose=False):
+    workspace = make_workspace()
+    result_file = os.path.join(workspace, "result.json")
+    env = {**os.environ,
+           "RPC_URL": server.url,
+           "COINGECKO_URL": f"{server.url}/api/v3/simple/price",
+           "STATE_DB": os.path.join(workspace, "tools", "state.db"),
+           "METRICS_DIR": os.path.join(workspace, "tools", ".cache", "metrics")}
+    env.pop("PRICE_RUN_STARTED", None)
+    before = server.snapshot_stats()
+    try:
+        proc = subprocess.run(
+            [sys.executable, os.path.join(workspace, "tools", "bench", "bench_sync.py"),
+             "--worker", scenario, str(size), result_file],
+            cwd=workspace, env=env, text=True,
+            stdout=None if verbose else subprocess.DEVNULL, stderr=None if verbose else subprocess.PIPE)
+        if proc.returncode != 0:
+            return {"scenario": scenario, "pools": size, "error": (proc.stderr or "").strip().splitlines()[-1:]}
+        with open(result_file, "r") as f:
+            result = json.load(f)
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    after = server.snapshot_stats()
+    calls = {m: n - before["calls"].get(m, 0) for m, n in after["calls"].items() if n - before["calls"].get(m, 0)}
+    return {
+        "scenario": scenario,
+        "pools": size,
+        "seconds": result["seconds"],
+        "ms_per_pool": result["seconds"] * 1000 / size,
+        "pools_ok": result["pools_ok"],
+        "http_requests": after["http_requests"] - before["http_requests"],
+        "rpc_calls": calls,
+        "rate_limited": after["rate_limited"] - before["rate_limited"],
+    }
+
+def compare(results, baseline_file, threshold):
+    with open(baseline_file, "r") as f:
+        baseline = {(r["scenario"], r["pools"]): r for r in json.load(f)["results"] if "seconds" in r}
+    regressions = []
+    for r in results:
+        base = baseline.get((r["scenario"], r["pools"]))
+        if base and "seconds" in r:
+            ratio = r["seconds"] / base["seconds"] if base["seconds"] else 1.0
+            r["baseline_ratio"] = ratio
+            if ratio > threshold:
+                regressions.append(f"{r['scenario']} @ {r['pools']} pools: {ratio:.2f}x baseline")
+    return regressions
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--worker":
+        worker(sys.argv[2], int(sys.argv[3]), sys.argv[4])
+        return
+
+    from tools.bench.rpc_replay import ReplayServer
+
+    parser = argparse.ArgumentParser(description="Offline benchmark of the sync pipeline against a replayed RPC")
+    parser.add_argument("--sizes", default="1,10,100,1000")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--cassette", help="recorded RPC responses (see rpc_replay.py record)")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="added latency per HTTP request")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="fraction of HTTP requests answered with 429")
+    parser.add_argument("--max-log-range", type=int, default=0, help="eth_getLogs block-range limit (0 = unlimited)")
+    parser.add_argument("--out", default=os.path.join(PROJECT_ROOT, "bench_report.json"))
+    parser.add_argument("--baseline", help="previous report to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="max slowdown vs baseline before failing")
+    parser.add_argument("--verbose", action="store_true", help="show the scenarios' own output")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    server = ReplayServer(cassette=args.cassette, latency_ms=args.latency_ms,
+                          rate_429=args.rate_429, max_log_range=args.max_log_range).start()
+    print(f"Replay server at {server.url} (latency {args.latency_ms:g} ms, 429 rate {args.rate_429:g})")
+
+    results = []
+    print(f"{'scenario':<12}{'pools':>7}{'seconds':>10}{'ms/pool':>10}{'http':>8}{'429s':>6}  ok")
+    for scenario in scenarios:
+        for size in sizes:
+            r = run(server, scenario, size, args.verbose)
+            results.append(r)
+            if "error" in r:
+                print(f"{scenario:<12}{size:>7}  failed: {' '.join(r['error'])}")
+                continue
+            print(f"{scenario:<12}{size:>7}{r['seconds']:>10.2f}{r['ms_per_pool']:>10.1f}"
+                  f"{r['http_requests']:>8}{r['rate_limited']:>6}  {r['pools_ok']}/{size}")
+    server.shutdown()
+
+    regressions = compare(results, args.baseline, args.threshold) if args.baseline else []
+    report = {
+        "generated": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "server": {"latency_ms": args.latency_ms, "rate_429": args.rate_429, "max_log_range": args.max_log_range,
+                   "cassette": args.cassette},
+        "results": results,
+        "regressions": regressions,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.out}")
+
+    failed = [r for r in results if "error" in r]
+    for line in regressions:
+        print(f"REGRESSION: {line}")
+    sys.exit(1 if regressions or failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""
+Local JSON-RPC stand-in for offline benchmarks.
+
+Answers eth_call, eth_getLogs, eth_blockNumber and eth_getBlockByNumber
+(single and batched requests) from a recorded cassette, and falls back to a
+deterministic synthetic Base chain (positions, a USDC/cbBTC pool with its tick
+bitmap and swaps) for anything not recorded, so a recording
+of a couple of real positions can be scaled to any number of pools. It also
+serves the CoinGecko simple/price endpoint. Latency, HTTP 429 injection and an
+eth_getLogs block-range limit are configurable to reproduce a throttled node;
+advance() and reorg() move the synthetic head and replace its recent blocks.
+
+Usage:
+  python tools/bench/rpc_replay.py serve [--cassette rpc.json] [--latency-ms 20] [--rate-429 0.05]
+  python tools/bench/rpc_replay.py record --upstream https://mainnet.base.org --cassette rpc.json
+"""
+import argparse
+import hashlib
+import http.server
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from tools.clmath import tick_to_sqrt_ratio, to_signed
+
+HEAD_BLOCK = 40_000_000
+CURRENT_TICK = -68_000  # ~90k USDC per cbBTC
+NPM_ADDRESS = "0x03a520b32c04bf3beef7beb72e919cf822ed34f1"
+USDC = "0x833589fcd6edb6e08f4c7c32d4f71b54bda02913"
+CBBTC = "0xcbb7c0000ab88b473b1f5afd9ef808440eed33bf"
+POOL_ADDRESS = "0xfbb6eed8e7aa03b138556eedaf5d271a5e1e43ef"
+COLLECT_TOPIC = "0x40d0efd1a53d60ecbf40971b9daf7dc90178c3aadc7aab1765632738fa8b8f01"
+SWAP_TOPIC = "0xc42079f94a6350d7e6235f29174924f928cc2ac818eb64fed8004e115fbcca67"
+EVENT_EVERY = 20_000  # synthetic positions collect fees every N blocks
+SWAP_EVERY = 30  # the synthetic pool trades every N blocks
+POOL_LIQUIDITY = 5 * 10**15
+TICK_SPACING = 10
+LIQUIDITY_STEP = 60  # an initialized tick every N spacings, each adding 2e14 liquidity towards the current tick
+PRICES = {"coinbase-wrapped-btc": 90000.0, "wrapped-bitcoin": 90000.0, "weth": 3000.0, "solana": 150.0, "usd-coin": 1.0}
+
+def _word(value: int) -> str:
+    return hex(value % (1 << 256))[2:].zfill(64)
+
+def _addr(address: str) -> str:
+    return address.lower()[2:].zfill(64)
+
+class SyntheticChain:
+    """Deterministic answers for the calls the fetchers and providers make."""
+
+    def __init__(self):
+        self.head = HEAD_BLOCK
+        self.forks = [(0, 0)]  # (first block, salt): blocks from a reorg on get new hashes and events
+        self.genesis_time = int(time.time()) - HEAD_BLOCK * 2  # 2 s blocks, head at "now"
+
+    def block_number(self):
+        return hex(self.head)
+
+    def _salt(self, block):
+        return next(salt for start, salt in reversed(self.forks) if block >= start)
+
+    def block_hash(self, block):
+        return "0x" + hashlib.sha256(f"{block}:{self._salt(block)}".encode()).hexdigest()
+
+    def get_block(self, tag):
+        block = self.head if tag in ("latest", "safe", "finalized") else int(tag, 16)
+        if block > self.head:
+            return None
+        return {"number": hex(block), "hash": self.block_hash(block), "parentHash": self.block_hash(block - 1),
+                "timestamp": hex(self.genesis_time + block * 2)}
+
+    def reorg(self, depth):
+        """Replace the last `depth` blocks: new hashes, and Collect events land in different blocks."""
+        self.forks.append((self.head - depth + 1, len(self.forks) * 7919))
+
+    def eth_call(self, call):
+        to, data = call.get("to", "").lower(), call.get("data", "")
+        selector = data[:10]
+        if to == NPM_ADDRESS and selector == "0x99fbab88":  # positions(uint256)
+            token_id = int(data[10:74], 16)
+            lower = CURRENT_TICK - 2000 - (token_id % 7) * 100
+            upper = CURRENT_TICK + 2000 + (token_id % 5) * 100
+            words = [0, 0, _addr(USDC), _addr(CBBTC), 500, lower, upper,
+                     10**12 + token_id, 0, 0, 1_000_000 + token_id % 1000, 1_500 + token_id % 100]
+            return "0x" + "".join(w if isinstance(w, str) else _word(w) for w in words)
+        if selector == "0x1698ee82":  # getPool(address,address,uint24)
+            return "0x" + _addr(POOL_ADDRESS)
+        if selector == "0x3850c7bd":  # slot0()
+            sqrt_price_x96 = int(tick_to_sqrt_ratio(CURRENT_TICK) * (1 << 96))
+            return "0x" + "".join(_word(w) for w in (sqrt_price_x96, CURRENT_TICK, 0, 1, 1, 0, 1))
+        if to == POOL_ADDRESS:
+            if selector == "0x1a686502":  # liquidity()
+                return "0x" + _word(POOL_LIQUIDITY)
+            if selector == "0xd0c93a7c":  # tickSpacing()
+                return "0x" + _word(TICK_SPACING)
+            if selector == "0xddca3f43":  # fee()
+                return "0x" + _word(500)
+            if selector == "0x5339c296":  # tickBitmap(int16)
+                word = to_signed(int(data[10:74], 16), 256)
+                bits = sum(1 << bit for bit in range(256) if (word * 256 + bit) % LIQUIDITY_STEP == 0)
+                return "0x" + _word(bits)
+            if selector == "0x883bdbfd":  # observe(uint32[]): cardinality covers 2 days
+                count = int(data[74:138], 16)
+                ago = [int(data[138 + i * 64:202 + i * 64], 16) for i in range(count)]
+                if max(ago) > 2 * 86400:
+                    raise LookupError("execution reverted: OLD")
+                now = self.head * 2  # seconds since genesis
+                cumulatives = [self.tick_cumulative(now - a) for a in ago]
+                return "0x" + "".join(_word(w) for w in (
+                    64, 64 + 32 * (count + 1), count, *cumulatives, count, *([0] * count)))
+            if selector == "0xf30dba93":  # ticks(int24)
+                tick = to_signed(int(data[10:74], 16), 256)
+                net = 2 * 10**14 if tick <= CURRENT_TICK else -2 * 10**14
+                return "0x" + "".join(_word(w) for w in (abs(net), net, 0, 0, 0, 0, 0, 1))
+        raise LookupError("execution reverted")
+
+    def tick_cumulative(self, t):
+        """Integral up to `t` seconds after genesis of the swaps' tick path CURRENT_TICK + 900 sin(block / 20000)."""
+        return int(CURRENT_TICK * t - 900 * 40_000 * math.cos(t / 40_000))
+
+    def swap_logs(self, lo, hi):
+        """A swap every SWAP_EVERY blocks, alternating direction, with the tick drifting around CURRENT_TICK."""
+        logs = []
+        for block in range(lo + (-lo) % SWAP_EVERY, hi + 1, SWAP_EVERY):
+            tick = CURRENT_TICK + int(900 * math.sin(block / 20_000)) + (block // SWAP_EVERY) % 7 * 10
+            size = 500 + block % 4_000  # USDC
+            usdc, btc = size * 10**6, size * 10**8 // 90_000
+            amount0, amount1 = (usdc, -btc) if (block // SWAP_EVERY) % 2 else (-usdc, btc)
+            sqrt_price_x96 = int(1.0001 ** (tick / 2) * (1 << 96))
+            logs.append({
+                "address": POOL_ADDRESS,
+                "topics": [SWAP_TOPIC, _addr(NPM_ADDRESS), _addr(NPM_ADDRESS)],
+                "data": "0x" + "".join(_word(w) for w in (amount0, amount1, sqrt_price_x96, POOL_LIQUIDITY, tick)),
+                "blockNumber": hex(block),
+                "blockHash": self.block_hash(block),
+                "transactionHash": "0x" + _word(block * 7_919),
+                "logIndex": hex(3),
+                "removed": False,
+            })
+        return logs
+
+    def get_logs(self, query):
+        address = (query.get("address") or "").lower()
+        topics = query.get("topics") or []
+        if address == POOL_ADDRESS and topics and topics[0] == SWAP_TOPIC:
+            return self.swap_logs(int(query["fromBlock"], 16), min(int(query["toBlock"], 16), self.head))
+        if address != NPM_ADDRESS or len(topics) < 2 or not topics[1]:
+            return []
+        token_id = int(topics[1], 16)
+        lo, hi = int(query["fromBlock"], 16), min(int(query["toBlock"], 16), self.head)
+        logs = []
+        for i, (start, salt) in enumerate(self.forks):
+            end = self.forks[i + 1][0] - 1 if i + 1 < len(self.forks) else hi
+            seg_lo, seg_hi = max(lo, start), min(hi, end)
+            first = seg_lo + (-seg_lo - token_id - salt) % EVENT_EVERY
+            logs += [{
+                "address": NPM_ADDRESS,
+                "topics": [COLLECT_TOPIC, topics[1]],
+                "data": "0x" + _addr(NPM_ADDRESS) + _word(2_000_000 + block % 997) + _word(2_000 + block % 89),
+                "blockNumber": hex(block),
+                "blockHash": self.block_hash(block),
+                "transactionHash": "0x" + _word(block * 1_000_003 + token_id + salt),
+                "logIndex": hex(token_id % 50),
+                "removed": False,
+            } for block in range(first, seg_hi + 1, EVENT_EVERY)]
+        return logs
+
+class ReplayServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, cassette=None, latency_ms=0.0, rate_429=0.0, max_log_range=0, upstream=None, seed=1):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.cassette_file = cassette
+        self.recorded = {}
+        if cassette and os.path.exists(cassette):
+            with open(cassette, "r") as f:
+                self.recorded = json.load(f)
+        self.chain = SyntheticChain()
+        self.latency = latency_ms / 1000
+        self.rate_429 = rate_429
+        self.max_log_range = max_log_range
+        self.upstream = upstream
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"http_requests": 0, "calls": {}, "rate_limited": 0, "replayed": 0, "synthetic": 0}
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def advance(self, blocks):
+        self.chain.head += blocks
+
+    def reorg(self, depth):
+        self.chain.reorg(depth)
+
+    def snapshot_stats(self):
+        with self._lock:
+            return json.loads(json.dumps(self.stats))
+
+    def throttled(self):
+        with self._lock:
+            self.stats["http_requests"] += 1
+            if self.rate_429 and self._random.random() < self.rate_429:
+                self.stats["rate_limited"] += 1
+                return True
+        return False
+
+    def answer(self, request):
+        method, params = request.get("method"), request.get("params", [])
+        key = json.dumps([method, params], sort_keys=True)
+        with self._lock:
+            self.stats["calls"][method] = self.stats["calls"].get(method, 0) + 1
+        response = {"jsonrpc": "2.0", "id": request.get("id")}
+        if key in self.recorded:
+            with self._lock:
+                self.stats["replayed"] += 1
+            return {**response, **self.recorded[key]}
+        if self.upstream:
+            return {**response, **self._record(key, request)}
+        with self._lock:
+            self.stats["synthetic"] += 1
+        try:
+            if method == "eth_blockNumber":
+                return {**response, "result": self.chain.block_number()}
+            if method == "eth_getBlockByNumber":
+                return {**response, "result": self.chain.get_block(params[0])}
+            if method == "eth_call":
+                return {**response, "result": self.chain.eth_call(params[0])}
+            if method == "eth_getLogs":
+                query = params[0]
+                span = int(query["toBlock"], 16) - int(query["fromBlock"], 16) + 1
+                if self.max_log_range and span > self.max_log_range:
+                    return {**response, "error": {"code": -32005, "message": f"block range limit ({self.max_log_range}) exceeded"}}
+                return {**response, "result": self.chain.get_logs(query)}
+        except LookupError as e:
+            return {**response, "error": {"code": 3, "message": str(e)}}
+        return {**response, "error": {"code": -32601, "message": f"method {method} not replayed"}}
+
+    def _record(self, key, request):
+        import requests
+        data = requests.post(self.upstream, json={**request, "id": 1}, timeout=60).json()
+        entry = {k: data[k] for k in ("result", "error") if k in data}
+        with self._lock:
+            self.recorded[key] = entry
+            with open(self.cassette_file, "w") as f:
+                json.dump(self.recorded, f, indent=1)
+        return entry
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    server: ReplayServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.endswith("/simple/price"):
+            ids = parse_qs(url.query).get("ids", [""])[0].split(",")
+            self._send(200, {i: {"usd": PRICES[i]} for i in ids if i in PRICES})
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"null")
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self.server.throttled():
+            self._send(429, {"jsonrpc": "2.0", "id": None, "error": {"code": 429, "message": "rate limit exceeded"}})
+            return
+        if isinstance(request, list):
+            self._send(200, [self.server.answer(r) for r in request])
+        else:
+            self._send(200, self.server.answer(request))
+
+def main():
+    parser = argparse.ArgumentParser(description="Recorded/synthetic JSON-RPC replay server")
+    parser.add_argument("mode", choices=["serve", "record"])
+    parser.add_argument("--port", type=int, default=8545)
+    parser.add_argument("--cassette", help="recorded responses (JSON); written in record mode")
+    parser.add_argument("--upstream", help="real RPC endpoint to record from")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--rate-429", type=float, default=0.0, help="fraction of HTTP requests answered with 429")
+    parser.add_argument("--max-log-range", type=int, default=0, help="reject larger eth_getLogs ranges (0 = unlimited)")
+    args = parser.parse_args()
+    if args.mode == "record" and not (args.upstream and args.cassette):
+        parser.error("record needs --upstream and --cassette")
+
+    server = ReplayServer(args.port, args.cassette, args.latency_ms, args.rate_429, args.max_log_range,
+                          upstream=args.upstream if args.mode == "record" else None)
+    print(f"RPC {args.mode} server at {server.url} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(json.dumps(server.snapshot_stats(), indent=2))
+
+if __name__ == "__main__":
+    main()
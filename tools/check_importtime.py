@@ -0,0 +1,71 @@
+import argparse
+import os
+import subprocess
+import sys
+
+# Import-time budget for the entry points that cron, the sync loop and the VPS API
+# spawn as fresh interpreters. Runs `python -X importtime -c "import <module>"`
+# for each, takes the best of N runs, and fails if a module goes over budget or
+# pulls in a heavy dependency that should only load on the code path using it.
+#
+#   python tools/check_importtime.py [--runs 5]
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY = {"web3", "eth_abi", "eth_utils", "solana", "solders", "pandas", "plotly", "numpy", "requests"}
+
+# module -> (budget in ms, heavy modules it is allowed to import)
+TARGETS = {
+    "tools.sync": (60, set()),
+    "tools.server": (80, set()),
+    "tools.update_history": (60, set()),
+    "tools.providers.factory": (30, set()),
+    "tools.dashboard_gen_v3": (150, set()),
+}
+
+def measure(module):
+    """(cumulative import time in ms, set of top-level packages imported)"""
+    env = {**os.environ, "PYTHONPATH": PROJECT_ROOT}
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=PROJECT_ROOT, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    total_us, packages = None, set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line.split("|")
+        try:
+            cumulative = int(parts[1])
+        except ValueError:
+            continue  # header line
+        name = parts[2].strip()
+        packages.add(name.split(".")[0])
+        if name == module:
+            total_us = cumulative
+    return (total_us or 0) / 1000, packages
+
+def main():
+    parser = argparse.ArgumentParser(description="Check import-time budgets of the CLI entry points")
+    parser.add_argument("--runs", type=int, default=3, help="best-of-N runs per module")
+    args = parser.parse_args()
+
+    failures = 0
+    print(f"{'module':<28}{'ms':>8}{'budget':>8}  heavy imports")
+    for module, (budget, allowed) in TARGETS.items():
+        try:
+            runs = [measure(module) for _ in range(args.runs)]
+        except RuntimeError as e:
+            print(f"{module:<28}   error  {e}")
+            failures += 1
+            continue
+        ms = min(r[0] for r in runs)
+        heavy = sorted((runs[0][1] & HEAVY) - allowed)
+        ok = ms <= budget and not heavy
+        failures += not ok
+        print(f"{module:<28}{ms:>8.1f}{budget:>8}  {', '.join(heavy) or '-'}{'' if ok else '  <-- FAIL'}")
+
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
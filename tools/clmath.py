@@ -0,0 +1,57 @@
+from decimal import Decimal, getcontext
+
+# Concentrated-liquidity math shared by the Uniswap V3/V4 fetchers and providers.
+# Amounts use Decimal; fee growth uses exact wrapping integer arithmetic like the contracts.
+
+getcontext().prec = 50
+
+def signed_int24(hex_str):
+    """Parse int24 from hex (right-aligned in 32 bytes)"""
+    val = int(hex_str[-6:], 16)  # Last 3 bytes = 6 hex chars = 24 bits
+    return to_signed(val, 24)
+
+def to_signed(val, bits):
+    """Two's complement of the low `bits` bits of val"""
+    val &= (1 << bits) - 1
+    return val - (1 << bits) if val >= 1 << (bits - 1) else val
+
+def tick_to_sqrt_ratio(tick):
+    """Convert tick to sqrt ratio using Decimal for precision"""
+    base = Decimal("1.0001")
+    return base ** (Decimal(tick) / 2)
+
+def get_amounts(liquidity, sqrt_price, tick_lower, tick_upper, current_tick):
+    """Calculate raw token amounts from liquidity"""
+    L = Decimal(liquidity)
+    sqrt_ratio_a = tick_to_sqrt_ratio(tick_lower)
+    sqrt_ratio_b = tick_to_sqrt_ratio(tick_upper)
+
+    if current_tick < tick_lower:
+        # All in token0
+        amount0 = L * (1/sqrt_ratio_a - 1/sqrt_ratio_b)
+        amount1 = Decimal(0)
+    elif current_tick >= tick_upper:
+        # All in token1
+        amount0 = Decimal(0)
+        amount1 = L * (sqrt_ratio_b - sqrt_ratio_a)
+    else:
+        # In range
+        amount0 = L * (1/sqrt_price - 1/sqrt_ratio_b)
+        amount1 = L * (sqrt_price - sqrt_ratio_a)
+
+    return float(amount0), float(amount1)
+
+def tick_to_price(tick, dec0, dec1):
+    """Price of token0 in token1, decimal-adjusted"""
+    return float(Decimal("1.0001") ** Decimal(tick)) * 10 ** (dec0 - dec1)
+
+def fee_growth_inside(current_tick, tick_lower, tick_upper, global_growth, outside_lower, outside_upper, bits=256):
+    """Pool.getFeeGrowthInside for one token (wrapping uint math; bits=128 for Solana CLMMs)"""
+    mod = 2**bits
+    below = outside_lower if current_tick >= tick_lower else (global_growth - outside_lower) % mod
+    above = outside_upper if current_tick < tick_upper else (global_growth - outside_upper) % mod
+    return (global_growth - below - above) % mod
+
+def uncollected_fees(liquidity, inside, inside_last, q_bits=128, bits=256):
+    """Fees accrued since the position's last checkpoint, in raw token units (X128 growth by default, X64 on Solana)"""
+    return ((inside - inside_last) % 2**bits) * liquidity >> q_bits
@@ -0,0 +1,94 @@
+import datetime
+
+# Points kept per chart series; enough to preserve the shape on any screen width
+DEFAULT_TARGET_POINTS = 500
+METHODS = ("lttb", "minmax")
+
+def lttb_indices(xs, ys, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+    Returns the indices of the points to keep (always includes first and last).
+    """
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+
+    every = (n - 2) / (threshold - 2)
+    indices = [0]
+    a = 0
+
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third triangle vertex
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        avg_len = avg_end - avg_start
+        avg_x = sum(xs[avg_start:avg_end]) / avg_len
+        avg_y = sum(ys[avg_start:avg_end]) / avg_len
+
+        # Pick the point in the current bucket that forms the largest triangle
+        range_start = int(i * every) + 1
+        range_end = int((i + 1) * every) + 1
+        ax, ay = xs[a], ys[a]
+        best_area = -1.0
+        best = range_start
+        for j in range(range_start, range_end):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best_area = area
+                best = j
+
+        indices.append(best)
+        a = best
+
+    indices.append(n - 1)
+    return indices
+
+def minmax_indices(ys, threshold):
+    """Min/max bucketing: keeps the extremes of each bucket, in original order."""
+    n = len(ys)
+    if threshold >= n or threshold < 4:
+        return list(range(n))
+
+    buckets = (threshold - 2) // 2
+    every = (n - 2) / buckets
+    indices = [0]
+    for i in range(buckets):
+        start = int(i * every) + 1
+        end = min(int((i + 1) * every) + 1, n - 1)
+        if start >= end:
+            continue
+        lo = min(range(start, end), key=ys.__getitem__)
+        hi = max(range(start, end), key=ys.__getitem__)
+        indices.extend(sorted({lo, hi}))
+    indices.append(n - 1)
+    return indices
+
+def snapshot_time(snapshot, position):
+    if snapshot.get('timestamp'):
+        return float(snapshot['timestamp'])
+    try:
+        return datetime.datetime.strptime(snapshot.get('date', ''), "%Y-%m-%d %H:%M:%S").timestamp()
+    except ValueError:
+        return float(position)
+
+def history_series(history, fallback_value=0, points=DEFAULT_TARGET_POINTS, method="lttb"):
+    """
+    Turn raw history snapshots into a chart series of at most `points` points.
+    points <= 0 returns the full-resolution series.
+    """
+    if method not in METHODS:
+        raise ValueError(f"unknown method {method!r} (expected one of {', '.join(METHODS)})")
+    xs = [snapshot_time(h, i) for i, h in enumerate(history)]
+    ys = [h.get('value_usd', fallback_value) or 0 for h in history]
+
+    if points and points > 0:
+        keep = minmax_indices(ys, points) if method == "minmax" else lttb_indices(xs, ys, points)
+    else:
+        keep = range(len(history))
+
+    return {
+        "dates": [history[i].get('date', '').split(" ")[0] for i in keep],
+        "values": [ys[i] for i in keep],
+        "timestamps": [xs[i] for i in keep],
+        "total_points": len(history),
+    }
@@ -0,0 +1,217 @@
+import os
+import sys
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# Allow importing from the project root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tools import rpc, storage
+from tools.providers.uniswap_v3_provider import UniswapV3Provider
+from tools.providers.uniswap_v4_provider import UniswapV4Provider
+from tools.v4_pool_index import POOL_MANAGER_DEPLOY_BLOCK
+
+# Wallet-level position discovery: finds every Uniswap V3/V4 position NFT held by
+# the configured owners and keeps tools/pools.json in step. Closed positions
+# (no liquidity, nothing owed) are flagged so the sync loop skips them.
+#
+#   python tools/discover_positions.py [0xOwner ...]
+# Owners default to WALLET_ADDRESSES (comma separated) or "owners" in pools.json.
+
+POOLS_FILE = "tools/pools.json"
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+STATE_FILE = os.path.join(SCRIPT_DIR, ".cache", "discovery.json")
+
+TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+ABI_BALANCE_OF = "0x70a08231"
+ABI_TOKEN_OF_OWNER_BY_INDEX = "0x2f745c59"
+ABI_OWNER_OF = "0x6352211e"
+ABI_GET_POSITION_LIQUIDITY = "0x1efeed33"
+CHUNK_SIZE = 10000
+
+def _addr_word(address: str) -> str:
+    return address.lower()[2:].zfill(64)
+
+def _uint_word(value: int) -> str:
+    return hex(value)[2:].zfill(64)
+
+def _int(res: Optional[str]) -> Optional[int]:
+    return int(res, 16) if res and res != "0x" else None
+
+# --- V3: ERC721Enumerable on the NonfungiblePositionManager -----------------
+
+def discover_v3(owners: List[str]) -> Dict[int, str]:
+    """{token_id: owner} via balanceOf + tokenOfOwnerByIndex, two batched round trips."""
+    npm = UniswapV3Provider.MANAGER_ADDRESS
+    balances = rpc.eth_call_batch([(npm, ABI_BALANCE_OF + _addr_word(o)) for o in owners])
+    calls, call_owners = [], []
+    for owner, res in zip(owners, balances):
+        for i in range(_int(res) or 0):
+            calls.append((npm, ABI_TOKEN_OF_OWNER_BY_INDEX + _addr_word(owner) + _uint_word(i)))
+            call_owners.append(owner)
+    token_ids = rpc.eth_call_batch(calls) if calls else []
+    return {_int(res): owner for owner, res in zip(call_owners, token_ids) if _int(res) is not None}
+
+def v3_positions(token_ids: List[int]) -> Dict[int, Dict]:
+    results = rpc.eth_call_batch(
+        [(UniswapV3Provider.MANAGER_ADDRESS, UniswapV3Provider.ABI_POSITIONS + _uint_word(t)) for t in token_ids])
+    return {t: pos for t, res in zip(token_ids, results) if (pos := UniswapV3Provider._decode_position(res))}
+
+# --- V4: PositionManager is not enumerable, so follow Transfer logs ---------
+
+def discover_v4(owners: List[str], state: Dict, head: int) -> Dict[int, str]:
+    """
+    {token_id: owner} from Transfer logs to/from each owner, scanned incrementally
+    from a per-owner checkpoint, then confirmed with a batched ownerOf.
+    """
+    pm = UniswapV4Provider.POSITION_MANAGER_ADDRESS
+    v4_state = state.setdefault("v4", {})
+    for owner in owners:
+        entry = v4_state.setdefault(owner, {"last_block": POOL_MANAGER_DEPLOY_BLOCK - 1, "tokens": {}})
+        start = entry["last_block"] + 1
+        owner_topic = "0x" + _addr_word(owner)
+        for lo in range(start, head + 1, CHUNK_SIZE):
+            hi = min(lo + CHUNK_SIZE - 1, head)
+            incoming = rpc.get_logs(pm, [TRANSFER_TOPIC, None, owner_topic], lo, hi)
+            outgoing = rpc.get_logs(pm, [TRANSFER_TOPIC, owner_topic], lo, hi) if incoming is not None else None
+            if outgoing is None:
+                print(f"  V4 transfer scan for {owner} stopped at block {lo - 1}")
+                break
+            logs = sorted(incoming + outgoing, key=lambda l: (int(l["blockNumber"], 16), int(l["logIndex"], 16)))
+            for log in logs:
+                token_id = str(int(log["topics"][3], 16))
+                if "0x" + log["topics"][2][-40:].lower() == owner:
+                    entry["tokens"][token_id] = int(log["blockNumber"], 16)
+                else:
+                    entry["tokens"].pop(token_id, None)
+            entry["last_block"] = hi
+        storage.write_json(STATE_FILE, state)
+
+    candidates = {int(t): (owner, block) for owner, entry in v4_state.items() if owner in owners
+                  for t, block in entry["tokens"].items()}
+    ids = sorted(candidates)
+    results = rpc.eth_call_batch([(pm, ABI_OWNER_OF + _uint_word(t)) for t in ids]) if ids else []
+    return {t: candidates[t][0] for t, res in zip(ids, results)
+            if res and len(res) >= 42 and "0x" + res[-40:].lower() == candidates[t][0]}
+
+def v4_liquidity(token_ids: List[int]) -> Dict[int, int]:
+    pm = UniswapV4Provider.POSITION_MANAGER_ADDRESS
+    results = rpc.eth_call_batch([(pm, ABI_GET_POSITION_LIQUIDITY + _uint_word(t)) for t in token_ids])
+    return {t: _int(res) for t, res in zip(token_ids, results) if _int(res) is not None}
+
+def v4_pool_keys(token_ids: List[int]) -> Dict[int, Dict]:
+    pm = UniswapV4Provider.POSITION_MANAGER_ADDRESS
+    results = rpc.eth_call_batch(
+        [(pm, UniswapV4Provider.ABI_GET_POOL_AND_POSITION_INFO + _uint_word(t)) for t in token_ids])
+    provider = UniswapV4Provider({"nft_id": 0, "exchange": "uniswap_v4"})
+    return {t: static for t, res in zip(token_ids, results)
+            if res and res != "0x" and (static := provider._decode_pool_and_position_info(res))}
+
+# --- registry ----------------------------------------------------------------
+
+def _symbol(known: Dict, address: str) -> str:
+    return known.get(address.lower(), {}).get("symbol", address[:6])
+
+def _label(token0, token1, fee, version, known) -> str:
+    return f"{_symbol(known, token0)}/{_symbol(known, token1)} {fee / 10000:g}% ({version.upper()})"
+
+def update_registry(owners: List[str]) -> Dict[str, int]:
+    # pools.json stays locked for the whole scan so a concurrent edit is not overwritten
+    with storage.update_json(POOLS_FILE, {"pools": []}) as registry:
+        return _update_registry(registry, owners)
+
+def _update_registry(registry: Dict, owners: List[str]) -> Dict[str, int]:
+    pools = registry.setdefault("pools", [])
+    by_id = {(p.get("exchange", "uniswap_v3"), p["nft_id"]): p for p in pools}
+    state = storage.read_json(STATE_FILE, {})
+
+    head = rpc.block_number()
+    if head == 0:
+        print("Failed to get current block number")
+        return {}
+
+    # 1. Enumerate owned NFTs
+    owned_v3 = discover_v3(owners)
+    owned_v4 = discover_v4(owners, state, head)
+    print(f"Owned: {len(owned_v3)} V3 / {len(owned_v4)} V4 position NFT(s)")
+
+    # 2. Open/closed status for everything owned or already registered
+    v3_ids = sorted(set(owned_v3) | {i for (ex, i) in by_id if ex == "uniswap_v3"})
+    v4_ids = sorted(set(owned_v4) | {i for (ex, i) in by_id if ex == "uniswap_v4"})
+    v3_pos = v3_positions(v3_ids) if v3_ids else {}
+    v4_liq = v4_liquidity(v4_ids) if v4_ids else {}
+    new_v4 = [t for t in owned_v4 if ("uniswap_v4", t) not in by_id and v4_liq.get(t)]
+    v4_keys = v4_pool_keys(new_v4) if new_v4 else {}
+
+    def is_open(exchange, token_id):
+        if exchange == "uniswap_v3":
+            pos = v3_pos.get(token_id)
+            return bool(pos and (pos["liquidity"] or pos["tokens_owed0"] or pos["tokens_owed1"]))
+        return bool(v4_liq.get(token_id))
+
+    counts = {"added": 0, "closed": 0, "reopened": 0}
+    today = datetime.now().strftime("%Y-%m-%d")
+
+    # 3. Register new open positions
+    for exchange, owned in (("uniswap_v3", owned_v3), ("uniswap_v4", owned_v4)):
+        for token_id, owner in sorted(owned.items()):
+            if (exchange, token_id) in by_id or not is_open(exchange, token_id):
+                continue
+            if exchange == "uniswap_v3":
+                pos = v3_pos[token_id]
+                label = _label(pos["token0"], pos["token1"], pos["fee"], "v3", UniswapV3Provider.KNOWN_TOKENS)
+            else:
+                key = v4_keys.get(token_id, {}).get("pool_key")
+                label = (_label(key["currency0"], key["currency1"], key["fee"], "v4", UniswapV4Provider.KNOWN_TOKENS)
+                         if key else f"V4 #{token_id}")
+            entry = {
+                "nft_id": token_id, "label": label,
+                "exchange": exchange, "network": "base", "version": exchange.split("_")[1],
+                "owner": owner, "deposit_date": today, "discovered": today,
+            }
+            if exchange == "uniswap_v4":
+                entry["start_block"] = state["v4"][owner]["tokens"].get(str(token_id))
+            pools.append(entry)
+            by_id[(exchange, token_id)] = entry
+            counts["added"] += 1
+            print(f"  + {label} #{token_id}")
+
+    # 4. Closed-position detection for every registered Uniswap position we could read
+    for (exchange, token_id), entry in by_id.items():
+        if exchange == "uniswap_v3" and token_id not in v3_pos:
+            continue
+        if exchange == "uniswap_v4" and token_id not in v4_liq:
+            continue
+        if exchange not in ("uniswap_v3", "uniswap_v4"):
+            continue
+        if is_open(exchange, token_id):
+            if entry.get("status") == "closed":
+                entry.pop("status")
+                entry.pop("closed_date", None)
+                counts["reopened"] += 1
+        elif entry.get("status") != "closed":
+            entry["status"] = "closed"
+            entry["closed_date"] = today
+            counts["closed"] += 1
+            print(f"  - {entry.get('label', token_id)} #{token_id} closed")
+
+    storage.write_json(STATE_FILE, state)
+    return counts
+
+def resolve_owners(args: List[str]) -> List[str]:
+    owners = args or [a for a in os.getenv("WALLET_ADDRESSES", "").split(",") if a.strip()]
+    if not owners:
+        owners = storage.read_json(POOLS_FILE, {}).get("owners", [])
+    return [o.strip().lower() for o in owners]
+
+def main():
+    owners = resolve_owners(sys.argv[1:])
+    if not owners:
+        print("No owner addresses: pass them as arguments, set WALLET_ADDRESSES or add 'owners' to pools.json")
+        sys.exit(1)
+    print(f"Discovering positions for {len(owners)} owner(s)...")
+    counts = update_registry(owners)
+    if counts:
+        print(f"Registry updated: {counts['added']} added, {counts['closed']} closed, {counts['reopened']} reopened")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import heapq
+from array import array
+from typing import Iterable, Iterator, Tuple
+
+# Fee events of the Uniswap V3 NonfungiblePositionManager, decoded straight from
+# eth_getLogs pages into fixed-layout columns. A scan keeps ~110 bytes per event
+# instead of the raw JSON-RPC log dicts, and the per-chunk results (each already
+# in block order) stream into one ordered sequence through a heap merge.
+
+COLLECT_TOPIC = "0x40d0efd1a53d60ecbf40971b9daf7dc90178c3aadc7aab1765632738fa8b8f01"
+# keccak("DecreaseLiquidity(uint256,uint128,uint256,uint256)")
+DECREASE_LIQ_TOPIC = "0x26f6a048ee9138f2c0ce266f322cb99228e8d619ae2bff30c67f8dcf9d2377b4"
+
+COLLECT, DECREASE = 0, 1
+KINDS = ("collect", "decrease")
+_KIND_BY_TOPIC = {COLLECT_TOPIC: COLLECT, DECREASE_LIQ_TOPIC: DECREASE}
+_MASK64 = (1 << 64) - 1
+
+# (block, log_index, kind, amount0, amount1, tx_hash, block_hash); tuples order by chain position
+Event = Tuple[int, int, int, int, int, str, str]
+
+class EventColumns:
+    """
+    Decoded events in (block, log_index) order, one array per field.
+    Amounts are uint128 on-chain, so each is stored as hi/lo 64-bit words;
+    transaction and block hashes are packed 32 bytes apiece.
+    """
+    __slots__ = ("block", "log_index", "kind", "amount0_hi", "amount0_lo", "amount1_hi", "amount1_lo",
+                 "tx_hash", "block_hash")
+
+    def __init__(self):
+        self.block = array("Q")
+        self.log_index = array("I")
+        self.kind = array("B")
+        self.amount0_hi, self.amount0_lo = array("Q"), array("Q")
+        self.amount1_hi, self.amount1_lo = array("Q"), array("Q")
+        self.tx_hash = bytearray()
+        self.block_hash = bytearray()
+
+    def append(self, block: int, log_index: int, kind: int, amount0: int, amount1: int, tx_hash: str, block_hash: str):
+        self.block.append(block)
+        self.log_index.append(log_index)
+        self.kind.append(kind)
+        # array raises OverflowError for anything beyond uint128 instead of wrapping
+        self.amount0_hi.append(amount0 >> 64)
+        self.amount0_lo.append(amount0 & _MASK64)
+        self.amount1_hi.append(amount1 >> 64)
+        self.amount1_lo.append(amount1 & _MASK64)
+        self.tx_hash += bytes.fromhex(tx_hash[2:].rjust(64, "0"))
+        self.block_hash += bytes.fromhex(block_hash[2:].rjust(64, "0"))
+
+    def __len__(self) -> int:
+        return len(self.block)
+
+    def __iter__(self) -> Iterator[Event]:
+        for i in range(len(self.block)):
+            yield (self.block[i], self.log_index[i], self.kind[i],
+                   self.amount0_hi[i] << 64 | self.amount0_lo[i], self.amount1_hi[i] << 64 | self.amount1_lo[i],
+                   "0x" + self.tx_hash[i * 32:(i + 1) * 32].hex(), "0x" + self.block_hash[i * 32:(i + 1) * 32].hex())
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (getattr(self, name) for name in self.__slots__ if not name.endswith("_hash"))
+        return sum(len(a) * a.itemsize for a in arrays) + len(self.tx_hash) + len(self.block_hash)
+
+def decode_logs(logs: Iterable[dict]) -> EventColumns:
+    """Collect / DecreaseLiquidity logs of one page -> EventColumns; other and removed logs are skipped."""
+    decoded = []
+    for log in logs:
+        topics = log.get("topics") or []
+        kind = _KIND_BY_TOPIC.get(topics[0].lower()) if topics else None
+        data = log.get("data") or "0x"
+        if kind is None or log.get("removed") or len(data) < 2 + 192:
+            continue
+        # Collect: (recipient, amount0, amount1); DecreaseLiquidity: (liquidity, amount0, amount1)
+        decoded.append((int(log["blockNumber"], 16), int(log["logIndex"], 16), kind,
+                        int(data[66:130], 16), int(data[130:194], 16), log.get("transactionHash") or "0x", log.get("blockHash") or "0x"))
+    decoded.sort()
+    columns = EventColumns()
+    for event in decoded:
+        columns.append(*event)
+    return columns
+
+def ledger_entry(event: Event) -> dict:
+    """
+    An event as a state_db.add_fee_events row. For V3, collect amounts are the raw
+    collected tokens (fees plus withdrawn principal); decrease amounts are the principal.
+    """
+    block, log_index, kind, amount0, amount1, tx_hash, block_hash = event
+    amounts = {"fee0": amount0, "fee1": amount1} if kind == COLLECT else {"withdrawn0": amount0, "withdrawn1": amount1}
+    return {"tx_hash": tx_hash, "log_index": log_index, "block_number": block, "block_hash": block_hash,
+            "kind": KINDS[kind], **amounts}
+
+def merge(chunks: Iterable[EventColumns]) -> Iterator[Event]:
+    """All events of the chunks in chain order, whatever order the chunks finished in."""
+    return heapq.merge(*chunks)
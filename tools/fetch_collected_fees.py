@@ -1,12 +1,14 @@
-import requests
 import json
 import sys
 import os
-import time
 from datetime import datetime
 from dotenv import load_dotenv
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tools import event_log, rpc, state_db, storage, tracing
+from tools.event_log import COLLECT, COLLECT_TOPIC, DECREASE_LIQ_TOPIC
+
 # Load environment variables
 load_dotenv()
 
@@ -14,72 +16,37 @@ load_dotenv()
 RPC_URL = os.getenv("RPC_URL", "https://base-rpc.publicnode.com")
 NPM_ADDRESS = "0x03a520b32c04bf3beef7beb72e919cf822ed34f1"
 
-# Uniswap V3 NonfungiblePositionManager Event Topics
-COLLECT_TOPIC = "0x40d0efd1a53d60ecbf40971b9daf7dc90178c3aadc7aab1765632738fa8b8f01"
-DECREASE_LIQ_TOPIC = "0x26f6a048ee9138f2c0ce266f322cb99228e8d619ae2bff30c67f8d58ad6b8ce9"
+# Blocks more than CONFIRMATIONS below head are final; the tentative tail above
+# them is kept in the ledger too, but re-verified (by block hash) on every run
+CONFIRMATIONS = int(os.getenv("FEE_CONFIRMATIONS", "64"))
+# How far back to rescan if even the confirmed block was replaced (no hashes are kept below it)
+DEEP_REORG_RESCAN = 10 * CONFIRMATIONS
+
+def checkpoint_name(nft_id):
+    """state_db checkpoint: last confirmed block whose events are in the pool's fee ledger."""
+    return f"fees:{nft_id}"
+
+def tip_name(nft_id):
+    """state_db checkpoint: last block scanned, i.e. the end of the tentative tail."""
+    return f"fees:{nft_id}:tip"
 
 def fetch_chunk(args):
-    """Fetch a single chunk of logs. Used by ThreadPoolExecutor."""
+    """Fetch and decode one chunk of logs (rpc.get_logs bisects ranges the node rejects). Used by ThreadPoolExecutor."""
     from_block, to_block, nft_id = args
     nft_id_topic = "0x" + f"{nft_id:064x}"
-    
-    payload = {
-        "jsonrpc": "2.0",
-        "method": "eth_getLogs",
-        "params": [{
-            "address": NPM_ADDRESS,
-            "topics": [[COLLECT_TOPIC, DECREASE_LIQ_TOPIC], nft_id_topic],
-            "fromBlock": hex(from_block),
-            "toBlock": hex(to_block)
-        }],
-        "id": 1
-    }
-    
-    max_retries = 5
-    for attempt in range(max_retries):
-        try:
-            res = requests.post(RPC_URL, json=payload, timeout=60)
-            
-            if res.status_code == 429:
-                time.sleep(3 + attempt * 2)
-                continue
-            
-            data = res.json()
-            
-            if 'error' in data:
-                error_msg = data['error'].get('message', '')
-                # Block range too large - split in half
-                if 'limited' in error_msg.lower() or 'too many' in error_msg.lower():
-                    if from_block >= to_block:
-                        return []
-                    mid = (from_block + to_block) // 2
-                    left = fetch_chunk((from_block, mid, nft_id))
-                    right = fetch_chunk((mid + 1, to_block, nft_id))
-                    return left + right
-                # Rate limit - retry
-                if 'rate limit' in error_msg.lower() or '429' in str(data['error']):
-                    time.sleep(3 + attempt * 2)
-                    continue
-                # Other error - retry
-                time.sleep(2)
-                continue
-            
-            if 'result' in data and isinstance(data['result'], list):
-                return data['result']
-                
-        except Exception as e:
-            time.sleep(2 ** min(attempt, 3))
-    
-    return []
-
-def get_block_number():
-    """Get current block number"""
-    payload = {"jsonrpc": "2.0", "method": "eth_blockNumber", "params": [], "id": 1}
-    try:
-        res = requests.post(RPC_URL, json=payload, timeout=10)
-        return int(res.json().get('result', '0x0'), 16)
-    except:
-        return 0
+    logs = rpc.get_logs(NPM_ADDRESS, [[COLLECT_TOPIC, DECREASE_LIQ_TOPIC], nft_id_topic], from_block, to_block, RPC_URL)
+    # Decoded in the worker: only the compact records outlive the chunk
+    return event_log.decode_logs(logs) if logs is not None else None
+
+def traced_chunk(chunk, parent):
+    """fetch_chunk under its own span; `parent` is the scan span (worker threads don't inherit it)."""
+    with tracing.span("fees.chunk", parent=parent, from_block=chunk[0], to_block=chunk[1]) as span_:
+        events = fetch_chunk(chunk)
+        if events is None:
+            span_.error = "log fetch failed"
+        else:
+            span_.set(events=len(events))
+        return events
 
 def get_pool_start_block(nft_id):
     """Get the start_block for a pool from pools.json"""
@@ -98,43 +65,29 @@ def fetch_fees(nft_id=None):
     if nft_id is None:
         nft_id = 4227642
 
-    pool_dir = f"tools/pools/{nft_id}"
-    cache_file = f"{pool_dir}/fees_data.json"
-    default_start = get_pool_start_block(nft_id)
-
-    # Load previous state
-    collected_usdc = 0
-    collected_cbbtc = 0
-    withdrawn_usdc = 0
-    withdrawn_cbbtc = 0
-    events_count = 0
-    start_block = default_start
-
-    if os.path.exists(cache_file):
-        try:
-            with open(cache_file, "r") as f:
-                state = json.load(f)
-                start_block = state.get("last_synced_block", start_block)
-                collected_usdc = state.get("raw_collected_usdc", 0)
-                collected_cbbtc = state.get("raw_collected_cbbtc", 0)
-                withdrawn_usdc = state.get("withdrawn_usdc", 0)
-                withdrawn_cbbtc = state.get("withdrawn_cbbtc", 0)
-                events_count = state.get("events_count", 0)
-                if "raw_collected_usdc" not in state:
-                    print("Legacy state detected. Re-syncing from scratch...")
-                    start_block = default_start
-                    collected_usdc = collected_cbbtc = withdrawn_usdc = withdrawn_cbbtc = events_count = 0
-        except:
-            pass
-
-    current_block = get_block_number()
-    if current_block == 0:
-        print("Failed to get current block number")
+    # Events land in the state_db ledger, deduplicated by (tx, logIndex). No
+    # checkpoint yet (new pool, or totals from before the ledger): scan from the
+    # pool's start block once.
+    conn = state_db.connect()
+    confirmed = state_db.get_checkpoint(conn, checkpoint_name(nft_id))
+    tip = state_db.get_checkpoint(conn, tip_name(nft_id))
+    if confirmed is None:
+        confirmed = get_pool_start_block(nft_id) - 1
+    elif tip is None:
+        # Ledger from before confirmation tracking: its last CONFIRMATIONS blocks were never verified
+        tip, confirmed = confirmed, confirmed - CONFIRMATIONS
+
+    # One batch: head, plus the tail end and confirmed block as the chain sees them now
+    chain = rpc.block_hashes(["latest", tip if tip is not None else confirmed, confirmed], RPC_URL)
+    if chain[0] is None:
+        print("Failed to get current block")
         return None
+    current_block, head_hash = chain[0]
+    start_block, confirmed, confirmed_hash = resume_point(conn, nft_id, confirmed, tip, chain[1], chain[2])
 
-    if start_block >= current_block:
+    if start_block > current_block:
         print(f"Already synced up to block {current_block}.")
-        start_block = current_block - 100
+        return fee_summary(nft_id, state_db.fee_totals(conn, nft_id), current_block, confirmed)
 
     total_blocks = current_block - start_block
     print(f"Scanning for events for NFT #{nft_id} from {start_block} to {current_block} ({total_blocks} blocks)...")
@@ -150,52 +103,83 @@ def fetch_fees(nft_id=None):
 
     print(f"Processing {len(chunks)} chunks with parallel requests...")
     
-    # Parallel fetch with 10 workers
-    all_logs = []
+    # Parallel fetch with 10 workers; each chunk arrives already decoded
+    chunk_events = []
+    failed = 0
     completed = 0
     
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        future_to_chunk = {executor.submit(fetch_chunk, chunk): chunk for chunk in chunks}
+    with tracing.span("fees.scan", pool=nft_id, from_block=start_block, to_block=current_block, chunks=len(chunks)) as scan, \
+            ThreadPoolExecutor(max_workers=10) as executor:
+        future_to_chunk = {executor.submit(traced_chunk, chunk, scan): chunk for chunk in chunks}
         for future in as_completed(future_to_chunk):
             chunk = future_to_chunk[future]
             try:
-                logs = future.result()
-                all_logs.extend(logs)
-                completed += 1
-                pct = completed / len(chunks) * 100
-                sys.stdout.write(f"\r  Progress: {completed}/{len(chunks)} chunks ({pct:.0f}%)")
-                sys.stdout.flush()
+                events = future.result()
             except Exception as e:
                 print(f"\n  Error fetching chunk {chunk[0]}-{chunk[1]}: {e}")
-                completed += 1
-
-    print(f"\nFound {len(all_logs)} events.")
-
-    # Sort logs by block number to process in order
-    all_logs.sort(key=lambda x: int(x.get('blockNumber', '0x0'), 16))
-
-    for log in all_logs:
-        topic0 = log.get('topics', [])[0].lower()
-        data_hex = log.get('data', '0x')[2:]
-
-        if topic0 == COLLECT_TOPIC and len(data_hex) >= 192:
-            amt0 = int(data_hex[64:128], 16)
-            amt1 = int(data_hex[128:192], 16)
-            collected_usdc += amt0 / 1e6
-            collected_cbbtc += amt1 / 1e8
-            events_count += 1
-            print(f"  [Collect] {amt0/1e6:.4f} USDC + {amt1/1e8:.8f} cbBTC")
-
-        elif topic0 == DECREASE_LIQ_TOPIC and len(data_hex) >= 192:
-            amt0 = int(data_hex[64:128], 16)
-            amt1 = int(data_hex[128:192], 16)
-            withdrawn_usdc += amt0 / 1e6
-            withdrawn_cbbtc += amt1 / 1e8
-            events_count += 1
-            print(f"  [DecreaseLiquidity] Withdrawn: {amt0/1e6:.4f} USDC + {amt1/1e8:.8f} cbBTC")
+                events = None
+            if events is None:
+                failed += 1
+            else:
+                chunk_events.append(events)
+            completed += 1
+            pct = completed / len(chunks) * 100
+            sys.stdout.write(f"\r  Progress: {completed}/{len(chunks)} chunks ({pct:.0f}%)")
+            sys.stdout.flush()
+
+    # Events of the chunks that did arrive are kept either way; the checkpoints only
+    # move once the whole range is in the ledger
+    checkpoints = []
+    if not failed:
+        final = current_block - CONFIRMATIONS
+        if final > confirmed:
+            found_final = rpc.block_hashes([final], RPC_URL)[0]
+            if found_final:
+                confirmed, confirmed_hash = found_final
+        checkpoints = [(checkpoint_name(nft_id), confirmed, confirmed_hash), (tip_name(nft_id), current_block, head_hash)]
+    added = state_db.add_fee_events(
+        conn, nft_id, (event_log.ledger_entry(e) for e in event_log.merge(chunk_events)), checkpoints)
+    found = sum(len(c) for c in chunk_events)
+    collects = sum(c.kind.count(COLLECT) for c in chunk_events)
+    decoded_kib = sum(c.nbytes for c in chunk_events) / 1024
+    print(f"\nFound {found} events ({collects} collect, {found - collects} decrease; {added} new; {decoded_kib:.1f} KiB decoded).")
+    if failed:
+        print(f"{failed} chunk(s) could not be fetched; keeping the previous fee state.")
+        return None
 
-    true_fee_usdc = max(0, collected_usdc - withdrawn_usdc)
-    true_fee_cbbtc = max(0, collected_cbbtc - withdrawn_cbbtc)
+    return fee_summary(nft_id, state_db.fee_totals(conn, nft_id), current_block, confirmed)
+
+def resume_point(conn, nft_id, confirmed, tip, tip_on_chain, confirmed_on_chain):
+    """
+    (first block to scan, confirmed block, its hash). The scan continues after the
+    tip while the tip block's hash is unchanged: a reorg anywhere in the tail
+    changes it. Otherwise the tail is rolled back to the confirmed block, or
+    further back if the confirmed block itself was replaced.
+    """
+    confirmed_hash = state_db.get_checkpoint_hash(conn, checkpoint_name(nft_id))
+    if tip is None:
+        return confirmed + 1, confirmed, confirmed_hash
+    tip_hash = state_db.get_checkpoint_hash(conn, tip_name(nft_id))
+    if tip_hash and tip_on_chain and tip_on_chain[1] == tip_hash:
+        return tip + 1, confirmed, confirmed_hash
+
+    if confirmed_hash and confirmed_on_chain and confirmed_on_chain[1] != confirmed_hash:
+        print(f"Reorg deeper than {CONFIRMATIONS} blocks (block {confirmed} replaced); rescanning {DEEP_REORG_RESCAN} more.")
+        confirmed, confirmed_hash = max(get_pool_start_block(nft_id) - 1, confirmed - DEEP_REORG_RESCAN), None
+    removed = state_db.rollback_fee_events(conn, nft_id, confirmed, [
+        (checkpoint_name(nft_id), confirmed, confirmed_hash), (tip_name(nft_id), confirmed, confirmed_hash)])
+    reason = "were reorged" if tip_hash else "were never verified"
+    print(f"Tentative blocks {confirmed + 1}-{tip} {reason}: rolled back {removed} event(s), rescanning.")
+    return confirmed + 1, confirmed, confirmed_hash
+
+def fee_summary(nft_id, totals, last_synced_block, confirmed_block=None):
+    """fees_data.json from the ledger totals: token amounts for the dashboard plus the exact raw integers."""
+    collected_usdc, collected_cbbtc = totals["fee0"] / 1e6, totals["fee1"] / 1e8
+    withdrawn_usdc, withdrawn_cbbtc = totals["withdrawn0"] / 1e6, totals["withdrawn1"] / 1e8
+    # Collect pays out fees and withdrawn principal together; the difference is the fee income
+    fee0 = max(0, totals["fee0"] - totals["withdrawn0"])
+    fee1 = max(0, totals["fee1"] - totals["withdrawn1"])
+    true_fee_usdc, true_fee_cbbtc = fee0 / 1e6, fee1 / 1e8
 
     print(f"\n--- Lifetime Totals ---")
     print(f"Raw Collected : {collected_usdc:.4f} USDC | {collected_cbbtc:.8f} cbBTC")
@@ -203,7 +187,7 @@ def fetch_fees(nft_id=None):
     print(f"True Fees     : {true_fee_usdc:.4f} USDC | {true_fee_cbbtc:.8f} cbBTC")
     print(f"-----------------------")
 
-    result = {
+    return {
         "nft_id": nft_id,
         "total_collected_usdc": true_fee_usdc,
         "total_collected_cbbtc": true_fee_cbbtc,
@@ -211,31 +195,42 @@ def fetch_fees(nft_id=None):
         "raw_collected_cbbtc": collected_cbbtc,
         "withdrawn_usdc": withdrawn_usdc,
         "withdrawn_cbbtc": withdrawn_cbbtc,
-        "events_count": events_count,
-        "last_synced_block": current_block,
+        # Exact on-chain integers (strings: JSON readers may parse numbers as doubles)
+        "raw_amounts": {key: str(totals[key]) for key in state_db.AMOUNT_FIELDS},
+        "fee_amounts": {"fee0": str(fee0), "fee1": str(fee1)},
+        "events_count": totals["events"],
+        "last_synced_block": last_synced_block,
+        "confirmed_block": confirmed_block,
         "last_updated": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     }
 
-    return result
+def recompute_fees(nft_id):
+    """Rebuild the totals from the stored ledger (e.g. after changing the fee formula); no RPC calls."""
+    conn = state_db.connect()
+    state_db.rebuild_fee_totals(conn, nft_id)
+    totals = state_db.fee_totals(conn, nft_id)
+    print(f"Recomputed NFT #{nft_id} from {totals['events']} ledger event(s).")
+    return fee_summary(nft_id, totals, state_db.get_checkpoint(conn, tip_name(nft_id)),
+                       state_db.get_checkpoint(conn, checkpoint_name(nft_id)))
 
 def main():
-    if len(sys.argv) > 1:
-        nft_id = int(sys.argv[1])
+    # python tools/fetch_collected_fees.py [nft_id] [--recompute]
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    if args:
+        nft_id = int(args[0])
     else:
         nft_id = 4227642
 
     pool_dir = f"tools/pools/{nft_id}"
-    os.makedirs(pool_dir, exist_ok=True)
     output_file = f"{pool_dir}/fees_data.json"
 
-    data = fetch_fees(nft_id)
+    data = recompute_fees(nft_id) if "--recompute" in sys.argv else fetch_fees(nft_id)
     if data:
-        with open(output_file, "w") as f:
-            json.dump(data, f, indent=2)
+        storage.write_json(output_file, data)
+        state_db.save_fees(state_db.connect(), nft_id, data)
         print(f"Saved to {output_file}")
 
-        with open("tools/fees_data.json", "w") as f:
-            json.dump(data, f, indent=2)
+        storage.write_json("tools/fees_data.json", data)
 
 if __name__ == "__main__":
     main()
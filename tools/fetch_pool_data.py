@@ -1,10 +1,13 @@
 import requests
-import json
 import sys
 import os
 from decimal import Decimal, getcontext
 from dotenv import load_dotenv
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tools import state_db, storage, tracing
+from tools.clmath import signed_int24, tick_to_sqrt_ratio, get_amounts
+
 # Load environment variables
 load_dotenv()
 
@@ -29,53 +32,15 @@ FACTORY_ADDRESS = "0x33128a8fC17869897dcE68Ed026d694621f6FDfD"
 
 def call_rpc(to_addr, data):
     payload = {"jsonrpc": "2.0", "method": "eth_call", "params": [{"to": to_addr, "data": data}, "latest"], "id": 1}
-    try:
-        res = requests.post(RPC_URL, json=payload, timeout=10)
-        return res.json().get('result')
-    except Exception as e:
-        print(f"RPC Error: {e}")
-        return None
-
-def signed_int24(hex_str):
-    """Parse int24 from hex (right-aligned in 32 bytes)"""
-    val = int(hex_str[-6:], 16)  # Last 3 bytes = 6 hex chars = 24 bits
-    if val >= 2**23:
-        return val - 2**24
-    return val
-
-def tick_to_sqrt_ratio(tick):
-    """Convert tick to sqrt ratio using Decimal for precision"""
-    base = Decimal("1.0001")
-    return base ** (Decimal(tick) / 2)
-
-def get_amounts(liquidity, sqrt_price, tick_lower, tick_upper, current_tick):
-    """Calculate token amounts from liquidity"""
-    L = Decimal(liquidity)
-    sqrt_ratio_a = tick_to_sqrt_ratio(tick_lower)
-    sqrt_ratio_b = tick_to_sqrt_ratio(tick_upper)
-    
-    if current_tick < tick_lower:
-        # All in token0
-        amount0 = L * (1/sqrt_ratio_a - 1/sqrt_ratio_b)
-        amount1 = Decimal(0)
-    elif current_tick >= tick_upper:
-        # All in token1
-        amount0 = Decimal(0)
-        amount1 = L * (sqrt_ratio_b - sqrt_ratio_a)
-    else:
-        # In range
-        amount0 = L * (1/sqrt_price - 1/sqrt_ratio_b)
-        amount1 = L * (sqrt_price - sqrt_ratio_a)
-    
-    return float(amount0), float(amount1)
-
-def get_cbbtc_price():
-    try:
-        url = "https://api.coingecko.com/api/v3/simple/price?ids=coinbase-wrapped-btc&vs_currencies=usd"
-        res = requests.get(url, timeout=5)
-        return res.json().get('coinbase-wrapped-btc', {}).get('usd', 97000.0)
-    except:
-        return 97000.0
+    with tracing.span("rpc.request", method="eth_call", selector=data[:10]) as span_:
+        try:
+            res = requests.post(RPC_URL, json=payload, timeout=10)
+            span_.set(status=res.status_code)
+            return res.json().get('result')
+        except Exception as e:
+            span_.error = f"{type(e).__name__}: {e}"
+            print(f"RPC Error: {e}")
+            return None
 
 def fetch_data(token_id=None):
     if token_id is None:
@@ -121,6 +86,8 @@ def fetch_data(token_id=None):
     data_pool = ABI_GET_POOL + padded_t0 + padded_t1 + padded_fee
     res_pool = call_rpc(FACTORY_ADDRESS, data_pool)
     
+    pool_address = None
+    price_source = "range_midpoint"
     if res_pool and res_pool != "0x" and len(res_pool) > 42:
         pool_address = "0x" + res_pool[-40:]
         print(f"Pool: {pool_address}")
@@ -132,6 +99,7 @@ def fetch_data(token_id=None):
             sqrt_price_x96 = int(slot0_raw[:64], 16)
             current_tick = signed_int24(slot0_raw[64:128])
             sqrt_price = Decimal(sqrt_price_x96) / Decimal(2**96)
+            price_source = "pool_slot0"
         else:
             current_tick = (tick_lower + tick_upper) // 2
             sqrt_price = tick_to_sqrt_ratio(current_tick)
@@ -200,6 +168,7 @@ def fetch_data(token_id=None):
     # Result Dict
     output = {
         "nft_id": token_id,
+        "pool_address": pool_address, "price_source": price_source,
         "token0": token0_addr, "token1": token1_addr,
         "symbol0": symbol0, "symbol1": symbol1,
         "fee": fee, "liquidity": liquidity,
@@ -225,18 +194,17 @@ def main():
     
     # Determine output path
     pool_dir = f"tools/pools/{token_id}"
-    os.makedirs(pool_dir, exist_ok=True)
     output_file = f"{pool_dir}/position_data.json"
     
-    data = fetch_data(token_id)
+    with tracing.span("position.fetch", pool=token_id):
+        data = fetch_data(token_id)
     if data:
-        with open(output_file, "w") as f:
-            json.dump(data, f, indent=2)
+        storage.write_json(output_file, data)
+        state_db.save_position(state_db.connect(), token_id, data)
         print(f"\nSaved to {output_file}")
         
         # Also save to legacy path for backwards compat
-        with open("tools/position_data.json", "w") as f:
-            json.dump(data, f, indent=2)
+        storage.write_json("tools/position_data.json", data)
 
 if __name__ == "__main__":
     main()
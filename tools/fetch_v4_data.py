@@ -1,309 +1,29 @@
-import requests
-import json
-import traceback
-from web3 import Web3
-from eth_abi import encode
-from eth_utils import keccak
+import sys
+import os
 
-# Configuration
-RPC_URL = "https://mainnet.base.org"
-POSITION_MANAGER_ADDRESS = "0x7c5f5a4bbd8fd63184577525326123b519429bdc"
-
-# ABIs
-PM_ABI = [
-    {
-        "inputs": [],
-        "name": "poolManager",
-        "outputs": [{"internalType": "address", "name": "", "type": "address"}],
-        "stateMutability": "view",
-        "type": "function"
-    },
-    {
-        "inputs": [{"internalType": "uint256", "name": "id", "type": "uint256"}],
-        "name": "poolKeys",
-        "outputs": [
-            {"internalType": "address", "name": "currency0", "type": "address"},
-            {"internalType": "address", "name": "currency1", "type": "address"},
-            {"internalType": "uint24", "name": "fee", "type": "uint24"},
-            {"internalType": "int24", "name": "tickSpacing", "type": "int24"},
-            {"internalType": "address", "name": "hooks", "type": "address"}
-        ],
-        "stateMutability": "view",
-        "type": "function"
-    },
-    {
-        "inputs": [{"internalType": "uint256", "name": "tokenId", "type": "uint256"}],
-        "name": "getPoolAndPositionInfo",
-        "outputs": [
-            {
-                "components": [
-                    {"internalType": "Currency", "name": "currency0", "type": "address"},
-                    {"internalType": "Currency", "name": "currency1", "type": "address"},
-                    {"internalType": "uint24", "name": "fee", "type": "uint24"},
-                    {"internalType": "int24", "name": "tickSpacing", "type": "int24"},
-                    {"internalType": "address", "name": "hooks", "type": "address"}
-                ],
-                "internalType": "struct PoolKey",
-                "name": "poolKey",
-                "type": "tuple"
-            },
-            {
-                "components": [
-                    {"internalType": "uint128", "name": "liquidity", "type": "uint128"},
-                    {"internalType": "uint256", "name": "feeGrowthInside0LastX128", "type": "uint256"},
-                    {"internalType": "uint256", "name": "feeGrowthInside1LastX128", "type": "uint256"}
-                ],
-                "internalType": "struct PositionInfo",
-                "name": "info",
-                "type": "tuple"
-            }
-        ],
-        "stateMutability": "view",
-        "type": "function"
-    }
-]
-
-POOL_MANAGER_ABI = [
-    {
-        "inputs": [{"internalType": "PoolId", "name": "id", "type": "bytes32"}],
-        "name": "pools",
-        "outputs": [
-            {"internalType": "uint160", "name": "sqrtPriceX96", "type": "uint160"},
-            {"internalType": "int24", "name": "tick", "type": "int24"},
-            {"internalType": "uint24", "name": "protocolFee", "type": "uint24"},
-            {"internalType": "uint24", "name": "lpFee", "type": "uint24"}
-        ],
-        "stateMutability": "view",
-        "type": "function"
-    }
-]
-
-ERC20_ABI = [
-    {"inputs": [], "name": "symbol", "outputs": [{"internalType": "string", "name": "", "type": "string"}], "stateMutability": "view", "type": "function"},
-    {"inputs": [], "name": "decimals", "outputs": [{"internalType": "uint8", "name": "", "type": "uint8"}], "stateMutability": "view", "type": "function"}
-]
-
-def compute_pool_id(pool_key):
-    # PoolKey: (currency0, currency1, fee, tickSpacing, hooks)
-    encoded = encode(
-        ['address', 'address', 'uint24', 'int24', 'address'],
-        [
-            pool_key[0],
-            pool_key[1],
-            pool_key[2],
-            pool_key[3],
-            pool_key[4]
-        ]
-    )
-    return keccak(encoded)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tools import storage
+from tools.providers.uniswap_v4_provider import UniswapV4Provider
 
 def main():
-    try:
-        w3 = Web3(Web3.HTTPProvider(RPC_URL))
-        print(f"Connected to Base: {w3.is_connected()}")
-        
-        pos_m_addr = Web3.to_checksum_address(POSITION_MANAGER_ADDRESS)
-        pos_m = w3.eth.contract(address=pos_m_addr, abi=PM_ABI)
-        
-        nft_id = 1345196
-        print(f"Checking NFT ID: {nft_id}")
-        
-        # 1. Get PoolManager address
-        pool_manager_addr = pos_m.functions.poolManager().call()
-        print(f"PoolManager Address: {pool_manager_addr}")
-        
-        # 2. Get Pool Key from tokenURI (More robust than ABI)
-        try:
-            token_uri = pos_m.functions.tokenURI(nft_id).call()
-            # print(f"TokenURI Snippet: {token_uri[:50]}...")
-            
-            import base64
-            
-            # Data usually: data:application/json;base64,....
-            if "base64," in token_uri:
-                b64 = token_uri.split("base64,")[1]
-                decoded = base64.b64decode(b64).decode('utf-8')
-                metadata = json.loads(decoded)
-                
-                print(f"Metadata Name: {metadata.get('name', 'Unknown')}")
-                description = metadata.get('description', '')
-                print(f"Description: {description}")
-                
-                # Description usually "USDC/cbBTC 0.05% ..."
-                # We need exact tokens.
-                # Attributes might help.
-                attributes = metadata.get('attributes', [])
-                
-                # Create a pseudo-key if we can't get addresses directly.
-                # But wait, tokenURI doesn't give addresses directly usually, just symbols.
-                
-                # Fallback: We really need getPoolAndPositionInfo to work or assume correct params.
-                # Let's try to interpret the error from before.
-                # The previous error said:
-                # expected: ...
-                # got: ...
-                # Actually, I didn't see the full error message, just the garbled part.
-                
-                # Let's try a simplified getPoolAndPositionInfo call without components, just opaque bytes?
-                # No, web3 needs schema.
-                
-                # Let's try calling 'positions(tokenId)'
-                # In V4 PM, it maps tokenId -> State.
-                # Let's try adding 'positions' to ABI.
-                pass
-
-        except Exception as e_uri:
-             print(f"URI Error: {e_uri}")
-
-        # Retry getPoolAndPositionInfo with simplified ABI?
-        # Actually, let's look at the previous traceback in my mind.
-        # It successfully connected. It failed at decoding.
-        
-        # Let's try to fetch simple `positions(tokenId)` if it exists.
-        # If not, we will rely on `tokenURI` to confirm it IS a V4 NFT at least.
-        
-        # New Plan: Try to just use the tokens we KNOW (USDC/cbBTC) and scan tiers effectively.
-        # If we find a pool with liquidity, that's likely it.
-        # My previous scan checked 0.01, 0.05, 0.3, 1%.
-        # Maybe the tickSpacing is different?
-        # V4 allows any tickSpacing.
-        
-        # Let's force a check on the most likely tier: 0.05% (500) and tickSpacing 10.
-        # And 0.3% (3000) with 60.
-        # And also check swapped tokens order? get_pool_key handles sorting.
-        
-        # Let's go back to the scanning approach but with MORE combinations, 
-        # because ABI issues with PositionManager are tricky without exact ABI.
-        # I'll keep the PositionManager code commented out or as secondary.
-        
-        # Revert to robust scanning of PoolManager.
-        
-        tiers = [
-            (100, 1), 
-            (500, 10), (500, 60),
-            (3000, 60), (3000, 200),
-            (10000, 200)
-        ]
-        
-        # Also, check if PoolManager address is correct?
-        # 0x498581ff718922c3f8e6a244956af099b2652b2b
-        # If PositionManager says `poolManager` is X, we should use X.
-        
-        # Let's keep the poolManager() call, it worked!
-        # It returned: 0x498581fF718922c3f8e6A244956aF099B2652b2b
-        # So the address I had IS correct.
-        
-        # So why did 'pools(id)' return 0/empty before?
-        # Maybe I computed the ID wrong (wrong tier/tickSpacing).
-        
-        # Let's iterate tiers again with the CONFIRMED PoolManager address.
-        
-        tokenA = Web3.to_checksum_address("0x833589fcd6edb6e08f4c7c32d4f71b54bda02913") # USDC
-        tokenB = Web3.to_checksum_address("0xcbb7c0000ab88b473b1f5afd9ef808440eed33bf") # cbBTC
-        
-        print(f"\nScanning for pools with tokens: {tokenA} / {tokenB}")
-
-        for fee, ts in tiers:
-            key = {
-                "currency0": tokenA if int(tokenA, 16) < int(tokenB, 16) else tokenB,
-                "currency1": tokenB if int(tokenA, 16) < int(tokenB, 16) else tokenA,
-                "fee": fee,
-                "tickSpacing": ts,
-                "hooks": "0x0000000000000000000000000000000000000000"
-            }
-            
-            # Compute ID
-            pid = compute_pool_id([key['currency0'], key['currency1'], key['fee'], key['tickSpacing'], key['hooks']])
-            
-            # Check PM
-            pm = w3.eth.contract(address=pool_manager_addr, abi=POOL_MANAGER_ABI)
-            res = pm.functions.pools(pid).call()
-            
-            # res = (sqrtPriceX96, tick, protocolFee, lpFee)
-            sqrtPriceX96 = res[0]
-            
-            print(f"Tier {fee}/{ts} -> ID: {pid.hex()} -> SqrtPrice: {sqrtPriceX96}")
-            
-            if sqrtPriceX96 > 0:
-                print(f">>> FOUND POOL! Tier {fee}/{ts}")
-                
-                # Parse logic...
-                pool_key = [key['currency0'], key['currency1'], fee, ts, key['hooks']]
-                position_info = [0, 0, 0] # Mock
-                
-                # ... (reuse print logic) ...
-                token0_addr = key['currency0']
-                token1_addr = key['currency1']
-                tick = res[1]
-                
-                # Continue to printing...
-                break 
-        else:
-             print("No pool found via scanning.")
-             return # Exit if not found
-             
-        # ... (fall through to printing) ...
-
-        
-        # 5. Get Token Info
-        t0_contract = w3.eth.contract(address=Web3.to_checksum_address(token0_addr), abi=ERC20_ABI)
-        t1_contract = w3.eth.contract(address=Web3.to_checksum_address(token1_addr), abi=ERC20_ABI)
-        
-        try:
-            sym0 = t0_contract.functions.symbol().call()
-            dec0 = t0_contract.functions.decimals().call()
-            sym1 = t1_contract.functions.symbol().call()
-            dec1 = t1_contract.functions.decimals().call()
-        except:
-            sym0, dec0 = "UNK0", 18
-            sym1, dec1 = "UNK1", 18
-            
-        print(f"Pair: {sym0} ({dec0}) / {sym1} ({dec1})")
-        
-        # 6. Calculate Price
-        if sqrt_price_x96 > 0:
-            price_raw = (sqrt_price_x96 / (2**96)) ** 2
-            
-            price_adjusted = price_raw * (10 ** (dec0 - dec1))
-            
-            print(f"Price ({sym1} per {sym0}): {price_adjusted}")
-            
-            # Create JSON output
-            output = {
-                "nft_id": nft_id,
-                "token0": token0_addr,
-                "token1": token1_addr,
-                "symbol0": sym0,
-                "symbol1": sym1,
-                "fee": fee,
-                "liquidity": position_info[0],
-                "tick_lower": 0,
-                "tick_upper": 0,
-                "current_tick": tick,
-                "price_current": price_adjusted, # Default to price0
-                "value_usd": 0 # Placeholder
-            }
-            
-            # Handle specific pair pricing display
-            if "USDC" in sym0 and "BTC" in sym1:
-                 # sym0=USDC, sym1=BTC -> price is BTC/USDC (small)
-                 # We want USDC/BTC (large)
-                 price_usd = 1/price_adjusted if price_adjusted > 0 else 0
-                 print(f">>> BTC Price: ${price_usd:,.2f}")
-                 output["price_cbbtc"] = price_usd
-
-            elif "BTC" in sym0 and "USDC" in sym1:
-                 # sym0=BTC, sym1=USDC -> price is USDC/BTC (large)
-                 price_usd = price_adjusted
-                 print(f">>> BTC Price: ${price_usd:,.2f}")
-                 output["price_cbbtc"] = price_usd
-
-            with open(f"data/pools/{nft_id}/v4_data.json", "w") as f:
-                json.dump(output, f, indent=2)
-                print(f"\nSaved to data/pools/{nft_id}/v4_data.json")
-
-    except Exception as e:
-        traceback.print_exc()
+    # Accept NFT ID from CLI argument
+    nft_id = int(sys.argv[1]) if len(sys.argv) > 1 else 1345196
+    print(f"Checking NFT ID: {nft_id}")
+
+    provider = UniswapV4Provider({"nft_id": nft_id, "exchange": "uniswap_v4"})
+    output = provider.fetch_position_data()
+    if not output:
+        print("Position not found.")
+        return
+
+    print(f"Pool: {output['pool_id']} (fee {output['fee']}, tickSpacing {output['tick_spacing']}, hooks {output['hooks']})")
+    print(f"Pair: {output['symbol0']}/{output['symbol1']}")
+    print(f"Tick Range: [{output['tick_lower']}, {output['tick_upper']}] | Current: {output['current_tick']}")
+    print(f"Price: {output['price_current']:,.2f} | Value: ${output['value_usd']:,.2f} | Unclaimed: ${output['fees_usd']:,.2f}")
+
+    pool_dir = f"tools/pools/{nft_id}"
+    storage.write_json(f"{pool_dir}/v4_data.json", output)
+    print(f"\nSaved to {pool_dir}/v4_data.json")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,197 @@
+import atexit
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from tools import storage
+
+# Counters, gauges and histograms for RPC health, log scans, sync stages and
+# dashboard renders, exposed in Prometheus text format on /metrics (server.py).
+#
+# Every sync stage runs in its own short-lived process, so each process keeps
+# its metrics in memory and periodically (and at exit) adds them to
+# .cache/metrics/<job>.json; /metrics merges those files. Counters and
+# histograms therefore accumulate across runs, gauges keep the last value.
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(SCRIPT_DIR, ".cache", "metrics"))
+FLUSH_INTERVAL = 30
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_lock = threading.Lock()
+_metrics: Dict[str, "_Metric"] = {}
+_last_flush = time.time()
+_atexit_registered = False
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def _spec(self) -> Dict:
+        return {"kind": self.kind, "help": self.help, "labels": list(self.labelnames)}
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        _recorded()
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with _lock:
+            self._values[self._key(labels)] = value
+        _recorded()
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _spec(self) -> Dict:
+        return {**super()._spec(), "buckets": list(self.buckets)}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with _lock:
+            # [per-bucket counts (non-cumulative, last one is +Inf), sum, count]
+            state = self._values.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0, 0])
+            state[0][next((i for i, b in enumerate(self.buckets) if value <= b), len(self.buckets))] += 1
+            state[1] += value
+            state[2] += 1
+        _recorded()
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observe the wall time of the block, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+def _get(cls, name, help, labelnames, **kwargs):
+    with _lock:
+        metric = _metrics.get(name)
+        if metric is None:
+            metric = _metrics[name] = cls(name, help, labelnames, **kwargs)
+    return metric
+
+def counter(name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+    return _get(Counter, name, help, labelnames)
+
+def gauge(name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return _get(Gauge, name, help, labelnames)
+
+def histogram(name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return _get(Histogram, name, help, labelnames, buckets=buckets)
+
+# --- persistence -------------------------------------------------------------
+
+def job_name() -> str:
+    script = os.path.basename(sys.argv[0]) if sys.argv else ""
+    if not script or script.startswith("-"):  # python -c / stdin
+        return "python"
+    return os.path.splitext(script)[0]
+
+def _recorded():
+    global _atexit_registered
+    if not _atexit_registered:
+        _atexit_registered = True
+        atexit.register(flush)
+    if time.time() - _last_flush > FLUSH_INTERVAL:
+        flush()
+
+def _merge(spec: Dict, stored: Dict, values: Dict[str, object]):
+    """Add this process's deltas into the stored series (gauges are overwritten)."""
+    for key, value in values.items():
+        old = stored.get(key)
+        if old is None or spec["kind"] == "gauge":
+            stored[key] = value
+        elif spec["kind"] == "histogram":
+            stored[key] = [[a + b for a, b in zip(old[0], value[0])], old[1] + value[1], old[2] + value[2]]
+        else:
+            stored[key] = old + value
+
+def flush(job: Optional[str] = None):
+    """Move everything recorded since the last flush into METRICS_DIR/<job>.json."""
+    global _last_flush
+    with _lock:
+        _last_flush = time.time()
+        pending = {}
+        for metric in _metrics.values():
+            if metric._values:
+                pending[metric.name] = (metric._spec(), {json.dumps(k): v for k, v in metric._values.items()})
+                metric._values = {}
+    if not pending:
+        return
+    try:
+        with storage.update_json(os.path.join(METRICS_DIR, f"{job or job_name()}.json"), {}) as stored:
+            for name, (spec, values) in pending.items():
+                entry = stored.setdefault(name, {**spec, "values": {}})
+                _merge(spec, entry["values"], values)
+    except OSError as e:
+        print(f"Metrics flush failed: {e}")
+
+# --- exposition ----------------------------------------------------------------
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _labels(names: List[str], values: List[str], extra: Sequence[Tuple[str, str]] = ()) -> str:
+    pairs = [(n, v) for n, v in zip(names, values) if v != ""] + list(extra)
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in pairs) + "}" if pairs else ""
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render() -> str:
+    """Prometheus text exposition of every job's metrics, each series labelled with the process (script) that recorded it."""
+    flush()
+    families: Dict[str, Tuple[Dict, List[Tuple[str, Dict]]]] = {}
+    if os.path.isdir(METRICS_DIR):
+        for filename in sorted(os.listdir(METRICS_DIR)):
+            if not filename.endswith(".json"):
+                continue
+            job = filename[:-5]
+            for name, entry in storage.read_json(os.path.join(METRICS_DIR, filename), {}).items():
+                families.setdefault(name, (entry, []))[1].append((job, entry["values"]))
+
+    lines = []
+    for name in sorted(families):
+        spec, series = families[name]
+        lines.append(f"# HELP {name} {spec['help']}")
+        lines.append(f"# TYPE {name} {spec['kind']}")
+        for job, values in series:
+            for key, value in sorted(values.items()):
+                label_values = json.loads(key)
+                if spec["kind"] != "histogram":
+                    lines.append(f"{name}{_labels(spec['labels'], label_values, [('process', job)])} {_number(value)}")
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, n in zip([*spec["buckets"], "+Inf"], counts):
+                    cumulative += n
+                    le = bound if bound == "+Inf" else _number(float(bound))
+                    lines.append(f"{name}_bucket{_labels(spec['labels'], label_values, [('process', job), ('le', le)])} {cumulative}")
+                lines.append(f"{name}_sum{_labels(spec['labels'], label_values, [('process', job)])} {_number(total)}")
+                lines.append(f"{name}_count{_labels(spec['labels'], label_values, [('process', job)])} {count}")
+    return "\n".join(lines) + "\n"
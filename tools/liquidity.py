@@ -0,0 +1,178 @@
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tools import rpc, storage, tracing
+from tools.clmath import signed_int24, to_signed
+
+# Active-liquidity curve of a Uniswap V3 pool, read from its tickBitmap / ticks
+# around the current tick and precomputed into arrays:
+#
+#   boundaries      initialized ticks in the window (plus the window edges)
+#   liquidity       active liquidity of each segment [boundaries[k], boundaries[k+1])
+#   up / down       segment start prices and cumulative token in/out to push the price across,
+#                   so any swap size is priced with one searchsorted + closed form
+#
+# Reading the curve costs three batched round trips; tables are cached in
+# .cache/ticks/<pool>.json and in memory for TTL seconds.
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "ticks")
+TTL = int(os.getenv("LIQUIDITY_TABLE_TTL", "300"))
+TABLE_WORDS = int(os.getenv("LIQUIDITY_TABLE_WORDS", "4"))  # bitmap words read on each side of the current one
+
+ABI_SLOT0 = "0x3850c7bd"
+ABI_LIQUIDITY = "0x1a686502"
+ABI_TICK_SPACING = "0xd0c93a7c"
+ABI_FEE = "0xddca3f43"
+ABI_TICK_BITMAP = "0x5339c296"
+ABI_TICKS = "0xf30dba93"
+
+_memory: Dict[str, "TickTable"] = {}
+_lock = threading.Lock()
+
+def _arg(value: int) -> str:
+    return hex(value % (1 << 256))[2:].zfill(64)
+
+class TickTable:
+    """A pool's liquidity by tick; sqrt prices are raw (token1 per token0, no decimals), as floats."""
+
+    def __init__(self, pool: str, fee: int, tick_spacing: int, current_tick: int, sqrt_price: float,
+                 liquidity: int, ticks: List[int], liquidity_net: List[int], word_range: List[int],
+                 fetched_at: Optional[float] = None):
+        import numpy as np
+
+        self.pool = pool
+        self.fee = fee
+        self.tick_spacing = tick_spacing
+        self.current_tick = current_tick
+        self.sqrt_price = sqrt_price
+        self.active_liquidity = liquidity
+        self.ticks = ticks
+        self.liquidity_net = liquidity_net
+        self.word_range = word_range
+        self.fetched_at = fetched_at or time.time()
+
+        # Segments between the initialized ticks; the window edges bound the first and last
+        edges = [word_range[0] * 256 * tick_spacing, (word_range[1] + 1) * 256 * tick_spacing]
+        net = dict(zip(ticks, liquidity_net))
+        self.boundaries = np.array(sorted(set(ticks) | set(edges)), dtype=np.int64)
+        nets = np.array([float(net.get(int(t), 0)) for t in self.boundaries])
+        current = int(np.searchsorted(self.boundaries, current_tick, side="right")) - 1
+        # Crossing boundary k upwards adds its liquidityNet
+        cum = np.cumsum(nets)
+        self.liquidity = np.maximum(float(liquidity) + cum[:-1] - cum[current], 0.0)
+        self.sqrt_boundaries = 1.0001 ** (self.boundaries / 2.0)
+        self._current = current
+
+        s, sb, L = sqrt_price, self.sqrt_boundaries, self.liquidity
+        # Price up (token1 in, token0 out): segments from the current price to the upper edge
+        lo = np.concatenate(([s], sb[current + 1:-1]))
+        hi, Lu = sb[current + 1:], L[current:]
+        self.up = (lo, Lu, np.concatenate(([0.0], np.cumsum(Lu * (hi - lo)))),
+                   np.concatenate(([0.0], np.cumsum(Lu * (1 / lo - 1 / hi)))))
+        # Price down (token0 in, token1 out): segments from the current price to the lower edge
+        hi = np.concatenate(([s], sb[current:0:-1]))
+        lo, Ld = sb[current::-1], L[current::-1]
+        self.down = (hi, Ld, np.concatenate(([0.0], np.cumsum(Ld * (1 / lo - 1 / hi)))),
+                     np.concatenate(([0.0], np.cumsum(Ld * (hi - lo)))))
+
+    @property
+    def tick_range(self):
+        return int(self.boundaries[0]), int(self.boundaries[-1])
+
+    def liquidity_at(self, ticks):
+        """Active liquidity at each tick (NaN outside the table)."""
+        import numpy as np
+
+        idx = np.searchsorted(self.boundaries, np.asarray(ticks), side="right") - 1
+        inside = (idx >= 0) & (idx < len(self.liquidity))
+        return np.where(inside, self.liquidity[np.clip(idx, 0, len(self.liquidity) - 1)], np.nan)
+
+    def swap(self, amount_in, zero_for_one: bool):
+        """
+        Output amounts (raw) for swapping each `amount_in` (raw, fee included) of
+        token0 (zero_for_one) or token1 against the curve; NaN past the table edge.
+        """
+        import numpy as np
+
+        x = np.asarray(amount_in, dtype=float) * (1 - self.fee / 1e6)
+        start, L, cum_in, cum_out = self.down if zero_for_one else self.up
+        j = np.searchsorted(cum_in, x, side="right") - 1
+        past_edge = j >= len(L)
+        j = np.minimum(j, len(L) - 1)
+        rest, s, Lj = x - cum_in[j], start[j], L[j]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if zero_for_one:
+                end = 1 / (1 / s + rest / Lj)
+                out = cum_out[j] + Lj * (s - end)
+            else:
+                end = s + rest / Lj
+                out = cum_out[j] + Lj * (1 / s - 1 / end)
+        out = np.where(rest > 0, out, cum_out[j])
+        return np.where(past_edge, np.nan, out)
+
+    def to_json(self) -> Dict[str, Any]:
+        return {"pool": self.pool, "fee": self.fee, "tick_spacing": self.tick_spacing,
+                "current_tick": self.current_tick, "sqrt_price": self.sqrt_price,
+                "liquidity": str(self.active_liquidity), "ticks": self.ticks,
+                "liquidity_net": [str(n) for n in self.liquidity_net], "word_range": self.word_range,
+                "fetched_at": self.fetched_at}
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "TickTable":
+        return cls(data["pool"], data["fee"], data["tick_spacing"], data["current_tick"], data["sqrt_price"],
+                   int(data["liquidity"]), data["ticks"], [int(n) for n in data["liquidity_net"]],
+                   data["word_range"], data["fetched_at"])
+
+def fetch(pool: str, words: int = TABLE_WORDS, rpc_url: Optional[str] = None) -> Optional[TickTable]:
+    """Read the pool's state and initialized ticks within `words` bitmap words of the current tick."""
+    with tracing.span("liquidity.fetch", pool=pool) as span_:
+        state = rpc.eth_call_batch([(pool, ABI_SLOT0), (pool, ABI_LIQUIDITY), (pool, ABI_TICK_SPACING), (pool, ABI_FEE)],
+                                   rpc_url=rpc_url)
+        if any(not r or r == "0x" for r in state):
+            span_.error = "pool state unavailable"
+            return None
+        slot0, liquidity, spacing, fee = state
+        sqrt_price = int(slot0[2:66], 16) / (1 << 96)
+        current_tick = signed_int24(slot0[2 + 64:2 + 128])
+        spacing, fee, liquidity = signed_int24(spacing), int(fee, 16), int(liquidity, 16)
+
+        center = (current_tick // spacing) >> 8
+        word_range = [center - words, center + words]
+        word_ids = list(range(word_range[0], word_range[1] + 1))
+        bitmaps = rpc.eth_call_batch([(pool, ABI_TICK_BITMAP + _arg(w)) for w in word_ids], rpc_url=rpc_url)
+        if any(b is None for b in bitmaps):
+            span_.error = "tickBitmap unavailable"
+            return None
+        ticks = [((w << 8) + bit) * spacing
+                 for w, bitmap in zip(word_ids, bitmaps) for bit in range(256) if int(bitmap, 16) >> bit & 1]
+
+        results = rpc.eth_call_batch([(pool, ABI_TICKS + _arg(t)) for t in ticks], rpc_url=rpc_url) if ticks else []
+        if any(r is None for r in results):
+            span_.error = "ticks unavailable"
+            return None
+        # ticks(): liquidityGross, liquidityNet (int128), ...
+        nets = [to_signed(int(r[2 + 64:2 + 128], 16), 128) for r in results]
+        span_.set(initialized_ticks=len(ticks))
+    return TickTable(pool.lower(), fee, spacing, current_tick, sqrt_price, liquidity, ticks, nets, word_range)
+
+def load(pool: str, ttl: float = TTL, rpc_url: Optional[str] = None) -> Optional[TickTable]:
+    """The pool's table from memory or .cache/ticks while younger than `ttl`, else freshly read."""
+    pool = pool.lower()
+    with _lock:
+        table = _memory.get(pool)
+    if table is None:
+        cached = storage.read_json(os.path.join(CACHE_DIR, f"{pool}.json"))
+        table = TickTable.from_json(cached) if cached else None
+    if table is None or time.time() - table.fetched_at > ttl:
+        fresh = fetch(pool, rpc_url=rpc_url)
+        if fresh is None:
+            return table  # a stale table beats none
+        table = fresh
+        storage.write_json(os.path.join(CACHE_DIR, f"{pool}.json"), table.to_json(), indent=None)
+    with _lock:
+        _memory[pool] = table
+    return table
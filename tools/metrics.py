@@ -0,0 +1,219 @@
+import datetime
+import hashlib
+import json
+import math
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# Shared metrics engine: the Streamlit app and the static dashboard both call
+# compute_metrics(), so IL / APR / HODL numbers are computed one way only.
+
+TOKEN_DECIMALS = {"USDC": 6, "USDbC": 6, "USDT": 6, "cbBTC": 8, "WBTC": 8, "SOL": 9}
+STABLECOINS = {"USDC", "USDbC", "USDT", "DAI"}
+
+_MEMO_SIZE = 256
+_memo: "OrderedDict[str, PoolMetrics]" = OrderedDict()
+
+class PoolMetrics:
+    """Derived metrics for one position snapshot."""
+
+    __slots__ = (
+        "nft_id", "label", "symbol0", "symbol1", "network_label", "exchange_label",
+        "value_usd", "amount0", "amount1", "in_range",
+        "price0_usd", "price_lower", "price_upper", "price_current",
+        "total_invested", "deposit_date", "initial_price",
+        "fees_collected_value", "fees_usd", "total_fees", "pending_0", "pending_1",
+        "position_age_days", "net_pnl", "roi_percent", "fee_apr", "total_apr",
+        "il_percent", "il_usd", "price_ratio", "hodl_value", "lp_vs_hodl",
+        "daily_fee", "weekly_fee", "monthly_fee", "yearly_fee",
+        "manual_collected_usdc", "manual_collected_cbbtc", "manual_updated",
+    )
+
+    nft_id: Any
+    label: str
+    symbol0: str
+    symbol1: str
+    network_label: str
+    exchange_label: str
+    value_usd: float
+    amount0: float
+    amount1: float
+    in_range: bool
+    price0_usd: float
+    price_lower: float
+    price_upper: float
+    price_current: float
+    total_invested: float
+    deposit_date: str
+    initial_price: float
+    fees_collected_value: float
+    fees_usd: float
+    total_fees: float
+    pending_0: float
+    pending_1: float
+    position_age_days: float
+    net_pnl: float
+    roi_percent: float
+    fee_apr: float
+    total_apr: float
+    il_percent: float
+    il_usd: float
+    price_ratio: float
+    hodl_value: float
+    lp_vs_hodl: float
+    daily_fee: float
+    weekly_fee: float
+    monthly_fee: float
+    yearly_fee: float
+    manual_collected_usdc: Optional[float]
+    manual_collected_cbbtc: Optional[float]
+    manual_updated: Optional[str]
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            setattr(self, name, values[name])
+
+    def __getitem__(self, name):
+        # Keeps dict-style access (m['value_usd']) used by templates and older callers
+        return getattr(self, name)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+def calculate_fee_apr(total_fees, position_value, days_active):
+    if position_value <= 0 or days_active <= 0: return 0
+    daily_rate = (total_fees / position_value) / days_active
+    return daily_rate * 365 * 100
+
+def token_usd(symbol, price_current):
+    return 1.0 if symbol in STABLECOINS else price_current
+
+# --- price <-> tick in a position's quoting (USD per volatile token) ---------------
+
+def position_decimals(position):
+    return (TOKEN_DECIMALS.get(position.get("symbol0"), 18), TOKEN_DECIMALS.get(position.get("symbol1"), 18))
+
+def quotes_token1(position) -> bool:
+    """True when prices are quoted for token1 (token0 is the stablecoin, e.g. USDC/cbBTC)."""
+    return position.get("symbol0") in STABLECOINS
+
+def price_to_tick(price, position):
+    import numpy as np
+
+    d0, d1 = position_decimals(position)
+    ratio = np.asarray(price, dtype=float) * 10 ** (d0 - d1)
+    return np.log(1 / ratio if quotes_token1(position) else ratio) / math.log(1.0001)
+
+def tick_to_price(tick, position):
+    import numpy as np
+
+    d0, d1 = position_decimals(position)
+    human = 1.0001 ** np.asarray(tick, dtype=float) * 10 ** (d0 - d1)
+    return 1 / human if quotes_token1(position) else human
+
+def _deposit_start(config):
+    if config.get("deposit_timestamp"):
+        return datetime.datetime.fromtimestamp(config["deposit_timestamp"])
+    return datetime.datetime.strptime(config.get("deposit_date", "2025-01-01"), "%Y-%m-%d")
+
+def snapshot_key(pool_entry, pool_data, as_of):
+    """Digest of everything the metrics depend on (history is not an input)."""
+    payload = json.dumps(
+        [pool_entry, pool_data.get("pos"), pool_data.get("config"), pool_data.get("fees"),
+         pool_data.get("manual"), as_of.isoformat()],
+        sort_keys=True, default=str
+    )
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+def compute_metrics(pool_entry: Dict[str, Any], pool_data: Dict[str, Any],
+                    as_of: Optional[datetime.datetime] = None) -> PoolMetrics:
+    """
+    Compute PoolMetrics for a pool registry entry and its raw data bundle
+    ({"pos", "config", "fees", "manual"}). as_of defaults to the current minute;
+    results are memoized on the input snapshot.
+    """
+    as_of = as_of or datetime.datetime.now().replace(second=0, microsecond=0)
+    key = snapshot_key(pool_entry, pool_data, as_of)
+    cached = _memo.get(key)
+    if cached is not None:
+        _memo.move_to_end(key)
+        return cached
+
+    metrics = _compute(pool_entry, pool_data, as_of)
+    _memo[key] = metrics
+    if len(_memo) > _MEMO_SIZE:
+        _memo.popitem(last=False)
+    return metrics
+
+def _compute(pool_entry, pool_data, as_of):
+    pos = pool_data.get("pos") or {}
+    fees_data = pool_data.get("fees") or {}
+    manual = pool_data.get("manual")
+    # Registry entry wins over the per-pool config file
+    config = {**(pool_data.get("config") or {}), **pool_entry}
+
+    nft_id = pool_entry.get("nft_id", pos.get("nft_id"))
+    symbol0 = pos.get('symbol0', 'Token0')
+    symbol1 = pos.get('symbol1', 'Token1')
+    value_usd = pos.get('value_usd', 0)
+    price_current = pos.get('price_current') or pos.get('price_cbbtc', 0)
+    usd0 = token_usd(symbol0, price_current)
+    usd1 = token_usd(symbol1, price_current)
+
+    total_invested = config.get("total_invested_usd", 0)
+    initial_price = config.get("initial_cbbtc_price", 0) or pos.get('price0_usd', 0)
+
+    # Fees: collected totals (legacy field names hold token0/token1) + pending on-chain
+    fees_collected_value = fees_data.get('total_collected_usdc', 0) * usd0 + fees_data.get('total_collected_cbbtc', 0) * usd1
+    pending_0 = pos.get('unclaimed_0', 0) / 10 ** TOKEN_DECIMALS.get(symbol0, 18)
+    pending_1 = pos.get('unclaimed_1', 0) / 10 ** TOKEN_DECIMALS.get(symbol1, 18)
+    fees_usd = pending_0 * usd0 + pending_1 * usd1
+    total_fees = fees_usd + fees_collected_value
+
+    # Position age
+    start_dt = _deposit_start(config)
+    position_age_days = (as_of - start_dt).total_seconds() / 86400
+
+    # PnL / ROI / APR
+    net_pnl = value_usd - total_invested + total_fees
+    roi_percent = (net_pnl / total_invested) * 100 if total_invested > 0 else 0
+    fee_apr = calculate_fee_apr(total_fees, total_invested, position_age_days)
+    total_apr = (roi_percent / position_age_days) * 365 if position_age_days > 0 else 0
+
+    # HODL baseline: 50/50 split at deposit. IL is the divergence from it (fees excluded),
+    # which is what a concentrated position actually loses vs holding.
+    price_ratio = price_current / initial_price if initial_price > 0 else 1
+    initial_volatile = (total_invested * 0.5) / initial_price if initial_price > 0 else 0
+    hodl_value = initial_volatile * price_current + total_invested * 0.5
+    il_usd = value_usd - hodl_value
+    il_percent = (il_usd / hodl_value) * 100 if hodl_value > 0 else 0
+    lp_vs_hodl = (value_usd + total_fees) - hodl_value
+
+    daily_fee = total_fees / max(position_age_days, 1)
+
+    return PoolMetrics(
+        nft_id=nft_id,
+        label=pool_entry.get("label", f"Pool #{nft_id}"),
+        symbol0=symbol0, symbol1=symbol1,
+        network_label=pos.get('network', config.get('network', 'base')).capitalize(),
+        exchange_label=pos.get('exchange', config.get('exchange', 'uniswap_v3')).replace('_', ' ').title(),
+        value_usd=value_usd, amount0=pos.get('amount0', 0), amount1=pos.get('amount1', 0),
+        in_range=pos.get('in_range', False),
+        price0_usd=pos.get('price0_usd', 0),
+        price_lower=pos.get('price_lower', 0), price_upper=pos.get('price_upper', 0),
+        price_current=price_current,
+        total_invested=total_invested,
+        deposit_date=config.get("deposit_date", start_dt.strftime("%Y-%m-%d")),
+        initial_price=initial_price,
+        fees_collected_value=fees_collected_value, fees_usd=fees_usd, total_fees=total_fees,
+        pending_0=pending_0, pending_1=pending_1,
+        position_age_days=position_age_days,
+        net_pnl=net_pnl, roi_percent=roi_percent,
+        fee_apr=fee_apr, total_apr=total_apr,
+        il_percent=il_percent, il_usd=il_usd, price_ratio=price_ratio,
+        hodl_value=hodl_value, lp_vs_hodl=lp_vs_hodl,
+        daily_fee=daily_fee, weekly_fee=daily_fee * 7, monthly_fee=daily_fee * 30, yearly_fee=daily_fee * 365,
+        manual_collected_usdc=manual.get('collected_usdc') if manual else None,
+        manual_collected_cbbtc=manual.get('collected_cbbtc') if manual else None,
+        manual_updated=manual.get('timestamp') if manual else None,
+    )
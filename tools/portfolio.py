@@ -0,0 +1,306 @@
+import argparse
+import datetime
+import os
+import sys
+from typing import Any, Dict, List, Optional, Sequence
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(SCRIPT_DIR))
+from tools import state_db, storage
+from tools.decimate import DEFAULT_TARGET_POINTS, lttb_indices, snapshot_time
+from tools.metrics import TOKEN_DECIMALS, token_usd
+
+# Portfolio engine: every pool's history on one time grid, so the portfolio gets
+# a combined value / fees / PnL history and a per-pool breakdown of it.
+#
+# Pools are snapshotted at different moments and start on different dates, so
+# each pool is joined onto the shared grid "as of" every grid time (searchsorted:
+# its latest snapshot at or before that time, carried forward); before its first
+# snapshot a pool contributes nothing.
+#
+#   fees(t) = pending fees of the snapshot + ledger fees collected by t, at the snapshot's prices
+#   pnl(t)  = value(t) + fees(t) - total_invested
+#
+# Parsed snapshot columns are cached in .cache/portfolio.json with the last
+# snapshot row id of each pool, so a rebuild only parses the snapshots added since.
+#
+#   python tools/portfolio.py [--step 3600] [--since-hours 24]
+
+CACHE_FILE = os.getenv("PORTFOLIO_CACHE", os.path.join(SCRIPT_DIR, ".cache", "portfolio.json"))
+CACHE_VERSION = 2
+GRID_STEP = 3600  # seconds; the sync runs hourly
+MAX_GRID_POINTS = 525_600  # a year of one-minute steps
+COLUMNS = ("t", "value", "pending", "usd0", "usd1", "in_range")
+# Fixed block times: ledger events without a timestamp are dated from their block number
+BLOCK_SECONDS = {"base": 2}
+
+# --- per-pool columns (cached) -----------------------------------------------------
+
+def _snapshot_row(snapshot: Dict[str, Any], position: int, symbols: Sequence[str]):
+    price = snapshot.get("price_current") or snapshot.get("price_cbbtc") or 0
+    prices = snapshot.get("prices") or {}
+    return (snapshot_time(snapshot, position), snapshot.get("value_usd") or 0, snapshot.get("fees_usd") or 0,
+            prices.get(symbols[0]) or token_usd(symbols[0], price), prices.get(symbols[1]) or token_usd(symbols[1], price),
+            snapshot.get("in_range"))
+
+def pool_columns(conn, nft_id: int, cached: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    The pool's snapshots as columns {t, value, pending, usd0, usd1, in_range}. Extends
+    `cached` with the snapshots inserted since; starts over if rows were removed.
+    """
+    count, last_id = state_db.snapshot_count(conn, nft_id)
+    rows = None
+    if cached and cached["last_id"] <= last_id:
+        rows = state_db.snapshots_after(conn, nft_id, cached["last_id"])
+        if not rows and cached["count"] == count:
+            return cached
+        if cached["count"] + len(rows) != count:
+            rows = None  # snapshots were removed or re-imported
+    if rows is None:
+        cached = None
+        rows = state_db.snapshots_after(conn, nft_id)
+
+    columns = {key: list(cached[key]) if cached else [] for key in COLUMNS}
+    symbols = cached["symbols"] if cached else None
+    if symbols is None:
+        latest = rows[-1][1] if rows else {}
+        symbols = [latest.get("symbol0") or "USDC", latest.get("symbol1") or "cbBTC"]
+    offset = len(columns["t"])
+    for i, (_, snapshot) in enumerate(rows):
+        for key, value in zip(COLUMNS, _snapshot_row(snapshot, offset + i, symbols)):
+            columns[key].append(value)
+    return {"count": count, "last_id": last_id, "symbols": symbols, **columns}
+
+def _event_times(events: List[Dict[str, Any]], fees: Dict[str, Any], network: Optional[str]) -> List[float]:
+    """Event timestamps; block-numbered events are dated back from the last fee sync (block, time)."""
+    anchor_block = fees.get("last_synced_block")
+    try:
+        anchor_time = datetime.datetime.strptime(fees.get("last_updated", ""), "%Y-%m-%d %H:%M:%S").timestamp()
+    except ValueError:
+        anchor_time = None
+    seconds = BLOCK_SECONDS.get(network or "base")
+    times = []
+    for e in events:
+        if e.get("timestamp"):
+            times.append(float(e["timestamp"]))
+        elif seconds and anchor_block and anchor_time and e.get("block_number") is not None:
+            times.append(anchor_time - (anchor_block - e["block_number"]) * seconds)
+        else:
+            times.append(anchor_time or 0.0)  # known to be collected by the last fee sync
+    return times
+
+def fee_steps(conn, nft_id: int, symbols: Sequence[str], network: Optional[str] = None):
+    """(times, fee0, fee1): cumulative collected fee income in tokens after each ledger event, or None."""
+    import numpy as np
+
+    events = state_db.fee_events(conn, nft_id)
+    fees = state_db.get_fees(conn, nft_id)
+    if not events:
+        # Pools without a ledger (manual / legacy imports): the fee summary as one step at its sync time
+        if not (fees.get("total_collected_usdc") or fees.get("total_collected_cbbtc")):
+            return None
+        return (np.array(_event_times([{}], fees, None)), np.array([fees.get("total_collected_usdc", 0.0)]),
+                np.array([fees.get("total_collected_cbbtc", 0.0)]))
+
+    times = np.array(_event_times(events, fees, network))
+    order = np.argsort(times, kind="stable")
+    # Collect pays out fees and withdrawn principal together; the difference is the fee income
+    amounts = np.array([[e["fee0"] - e["withdrawn0"], e["fee1"] - e["withdrawn1"]] for e in events], dtype=float)[order]
+    cumulative = np.maximum(np.cumsum(amounts, axis=0), 0)
+    scale = np.array([10 ** TOKEN_DECIMALS.get(s, 18) for s in symbols], dtype=float)
+    cumulative /= scale
+    return times[order], cumulative[:, 0], cumulative[:, 1]
+
+# --- alignment ----------------------------------------------------------------------
+
+def time_grid(times, step: float = GRID_STEP):
+    """Every `step` seconds from the first to the last time (both included); step 0 = the union of the times."""
+    import numpy as np
+
+    times = np.asarray(times, dtype=float)
+    if times.size == 0:
+        return times
+    if not step:
+        return np.unique(times)
+    lo, hi = times.min(), times.max()
+    if not step > 0 or (hi - lo) / step > MAX_GRID_POINTS:
+        raise ValueError(f"grid step {step:g} s gives more than {MAX_GRID_POINTS:,} points over {(hi - lo) / 86400:.0f} days")
+    first = lo - lo % step + (step if lo % step else 0)
+    return np.unique(np.concatenate(([lo], np.arange(first, hi, step), [hi])))
+
+def as_of(times, values, grid, before=0.0):
+    """values[i] of the last times[i] <= each grid time (times ascending); `before` ahead of times[0]."""
+    import numpy as np
+
+    idx = np.searchsorted(times, grid, side="right") - 1
+    return np.where(idx >= 0, np.asarray(values)[np.maximum(idx, 0)], before)
+
+class Portfolio:
+    """Per-pool series aligned on one grid (rows = pools, columns = grid times), and their sums."""
+
+    def __init__(self, timestamps, nft_ids, labels, value, fees, invested):
+        self.timestamps = timestamps
+        self.nft_ids = nft_ids
+        self.labels = labels
+        self.value = value
+        self.fees = fees
+        self.invested = invested
+
+    @property
+    def pnl(self):
+        return self.value + self.fees - self.invested
+
+    def totals(self) -> Dict[str, Any]:
+        return {"value": self.value.sum(axis=0), "fees": self.fees.sum(axis=0),
+                "pnl": self.pnl.sum(axis=0), "invested": self.invested.sum(axis=0)}
+
+    def contributions(self, since: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Each pool's share of the latest totals, and of the PnL change since `since`
+        (default: the start of the grid).
+        """
+        import numpy as np
+
+        if not len(self.timestamps):
+            return []
+        start = 0 if since is None else min(int(np.searchsorted(self.timestamps, since)), len(self.timestamps) - 1)
+        pnl = self.pnl
+        value, fees, latest_pnl = self.value[:, -1], self.fees[:, -1], pnl[:, -1]
+        change = latest_pnl - pnl[:, start]
+
+        def share(part, whole):
+            return float(part / whole * 100) if whole else 0.0
+
+        totals = (value.sum(), fees.sum(), latest_pnl.sum(), change.sum())
+        return [{
+            "nft_id": nft_id, "label": label,
+            "value": float(value[i]), "fees": float(fees[i]), "pnl": float(latest_pnl[i]), "pnl_change": float(change[i]),
+            "value_share": share(value[i], totals[0]), "fees_share": share(fees[i], totals[1]),
+            "pnl_share": share(latest_pnl[i], totals[2]), "pnl_change_share": share(change[i], totals[3]),
+        } for i, (nft_id, label) in enumerate(zip(self.nft_ids, self.labels))]
+
+    def to_dict(self, points: int = DEFAULT_TARGET_POINTS, per_pool: bool = False,
+                since: Optional[float] = None) -> Dict[str, Any]:
+        """
+        JSON-ready series, downsampled to at most `points` grid times (LTTB on the
+        total value, same times for every series); points <= 0 keeps them all.
+        """
+        totals = self.totals()
+        xs = self.timestamps.tolist()
+        keep = lttb_indices(xs, totals["value"].tolist(), points) if points and points > 0 else range(len(xs))
+        keep = list(keep)
+        result = {
+            "timestamps": [xs[i] for i in keep],
+            "dates": [datetime.datetime.fromtimestamp(xs[i]).strftime("%Y-%m-%d %H:%M") for i in keep],
+            **{name: series[keep].tolist() for name, series in totals.items()},
+            "total_points": len(xs),
+            "contributions": self.contributions(since),
+        }
+        if per_pool:
+            pnl = self.pnl
+            result["pools"] = [{"nft_id": nft_id, "label": label, "value": self.value[i, keep].tolist(),
+                                "fees": self.fees[i, keep].tolist(), "pnl": pnl[i, keep].tolist()}
+                               for i, (nft_id, label) in enumerate(zip(self.nft_ids, self.labels))]
+        return result
+
+def align(pools: List[Dict[str, Any]], step: float = GRID_STEP) -> Portfolio:
+    """
+    Join prepared pools ({nft_id, label, invested, columns, fee_steps}) onto one
+    grid spanning all their snapshots.
+    """
+    import numpy as np
+
+    series = []
+    for pool in pools:
+        cols = {key: np.asarray(pool["columns"][key], dtype=float) for key in COLUMNS}
+        if cols["t"].size == 0:
+            continue
+        if np.any(np.diff(cols["t"]) < 0):  # snapshots are appended in time order, but imports may not be
+            order = np.argsort(cols["t"], kind="stable")
+            cols = {key: values[order] for key, values in cols.items()}
+        series.append((pool, cols))
+
+    grid = time_grid(np.concatenate([cols["t"] for _, cols in series]) if series else [], step)
+    shape = (len(series), len(grid))
+    value, fees, invested = np.zeros(shape), np.zeros(shape), np.zeros(shape)
+    for row, (pool, cols) in enumerate(series):
+        t = cols["t"]
+        value[row] = as_of(t, cols["value"], grid)
+        fees[row] = as_of(t, cols["pending"], grid)
+        held = grid >= t[0]
+        invested[row] = np.where(held, pool["invested"], 0.0)
+        steps = pool.get("fee_steps")
+        if steps is not None:
+            # Fees collected after the pool's last snapshot are booked at that snapshot
+            times, fee0, fee1 = steps
+            times = np.minimum(times, t[-1])
+            fees[row] += np.where(held, as_of(times, fee0, grid) * as_of(t, cols["usd0"], grid)
+                                  + as_of(times, fee1, grid) * as_of(t, cols["usd1"], grid), 0.0)
+    return Portfolio(grid, [p["nft_id"] for p, _ in series], [p["label"] for p, _ in series], value, fees, invested)
+
+# --- entry point ---------------------------------------------------------------------
+
+def load_columns(conn, nft_ids: Sequence[int], cache_file: Optional[str] = CACHE_FILE,
+                 prune: bool = False) -> Dict[int, Dict[str, Any]]:
+    """
+    Snapshot columns of each pool, reusing and refreshing the column cache;
+    prune drops the cached pools not in `nft_ids`.
+    """
+    cache = (storage.read_json(cache_file, {}) if cache_file else {}) or {}
+    if cache.get("version") != CACHE_VERSION:
+        cache = {"version": CACHE_VERSION, "pools": {}}
+
+    result, changed = {}, False
+    for nft_id in nft_ids:
+        key = str(nft_id)
+        cached = cache["pools"].get(key)
+        columns = pool_columns(conn, nft_id, cached)
+        if columns is not cached:
+            cache["pools"][key] = columns
+            changed = True
+        result[nft_id] = columns
+
+    stale = set(cache["pools"]) - {str(n) for n in nft_ids} if prune else set()
+    for key in stale:
+        del cache["pools"][key]
+    if cache_file and (changed or stale):
+        storage.write_json(cache_file, cache, indent=None)
+    return result
+
+def build(pools: List[Dict[str, Any]], conn=None, step: float = GRID_STEP, cache_file: Optional[str] = CACHE_FILE) -> Portfolio:
+    """Portfolio of the registry entries `pools`, reusing and refreshing the snapshot column cache."""
+    conn = conn or state_db.connect()
+    columns = load_columns(conn, [e["nft_id"] for e in pools], cache_file, prune=True)
+    prepared = [{
+        "nft_id": entry["nft_id"], "label": entry.get("label", f"Pool #{entry['nft_id']}"),
+        "invested": entry.get("total_invested_usd", 0) or 0,
+        "columns": columns[entry["nft_id"]],
+        "fee_steps": fee_steps(conn, entry["nft_id"], columns[entry["nft_id"]]["symbols"], entry.get("network")),
+    } for entry in pools]
+    return align(prepared, step)
+
+def main():
+    parser = argparse.ArgumentParser(description="Combined portfolio history across all pools")
+    parser.add_argument("--step", type=float, default=GRID_STEP, help="grid spacing in seconds (0 = every snapshot time)")
+    parser.add_argument("--since-hours", type=float, help="PnL contributions over the last N hours (default: whole history)")
+    args = parser.parse_args()
+
+    conn = state_db.connect()
+    portfolio = build(state_db.list_pools(conn), conn, args.step)
+    if not len(portfolio.timestamps):
+        print("No history snapshots yet.")
+        return
+    totals = portfolio.totals()
+    first, last = (datetime.datetime.fromtimestamp(t).strftime("%Y-%m-%d %H:%M") for t in portfolio.timestamps[[0, -1]])
+    print(f"{len(portfolio.nft_ids)} pools, {len(portfolio.timestamps)} grid points ({first} -> {last})")
+    print(f"Value ${totals['value'][-1]:,.2f} | Fees ${totals['fees'][-1]:,.2f} | PnL ${totals['pnl'][-1]:+,.2f}"
+          f" (invested ${totals['invested'][-1]:,.2f})")
+
+    since = portfolio.timestamps[-1] - args.since_hours * 3600 if args.since_hours else None
+    print(f"\n{'pool':<32}{'value':>12}{'share':>8}{'pnl':>12}{'change':>12}{'share':>8}")
+    for c in sorted(portfolio.contributions(since), key=lambda c: abs(c["pnl_change"]), reverse=True):
+        print(f"{c['label'][:31]:<32}{c['value']:>12,.2f}{c['value_share']:>7.1f}%{c['pnl']:>+12,.2f}"
+              f"{c['pnl_change']:>+12,.2f}{c['pnl_change_share']:>7.1f}%")
+
+if __name__ == "__main__":
+    main()
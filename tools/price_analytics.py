@@ -0,0 +1,222 @@
+import datetime
+import math
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(SCRIPT_DIR))
+from tools import portfolio, rpc, state_db, storage, swap_index, tracing
+from tools.clmath import signed_int24, to_signed
+from tools.metrics import quotes_token1, tick_to_price
+
+# Price analytics from the pools themselves, no external price API:
+#
+#   spot       slot0's tick
+#   TWAP       observe([0, w1, w2, ...]): mean tick over each window = (cum[0] - cum[w]) / w, all
+#              windows in one call; shorter fallbacks ride in the same batch in case the pool's
+#              observation buffer does not reach back that far (the call reverts with "OLD")
+#   series     the swap index's ticks as BAR_SECONDS bars (last tick of each bar, carried
+#              forward through bars without trades)
+#   realized   annualized volatility of the bar log returns over each window
+#   drawdown   max and current drawdown of the volatile token's USD price over each window
+#
+# Results are cached per pool in .cache/price_analytics.json for TTL seconds;
+# the sync refreshes them after indexing swaps. range_risk bootstraps its paths
+# from the bar returns, and the rebalance simulator reports them with its results.
+#
+#   python tools/price_analytics.py [pool_address ...]   # default: pools of the tracked V3 positions
+
+CACHE_FILE = os.getenv("PRICE_ANALYTICS_CACHE", os.path.join(SCRIPT_DIR, ".cache", "price_analytics.json"))
+CACHE_VERSION = 1
+TTL = int(os.getenv("PRICE_ANALYTICS_TTL", "300"))
+TWAP_WINDOWS = [int(w) for w in os.getenv("TWAP_WINDOWS", "300,3600,86400").split(",")]
+VOL_WINDOWS = [int(float(h) * 3600) for h in os.getenv("VOL_WINDOWS_HOURS", "24,168").split(",")]
+# 15 min bars: enough returns for a week's estimate, coarse enough that alternating
+# buys and sells (bid-ask bounce) do not pass for volatility
+BAR_SECONDS = int(os.getenv("PRICE_BAR_SECONDS", "900"))
+YEAR_SECONDS = 365 * 86400
+LOG_TICK = math.log(1.0001)
+
+ABI_SLOT0 = "0x3850c7bd"
+ABI_OBSERVE = "0x883bdbfd"
+
+_lock = threading.Lock()
+
+def window_label(seconds: int) -> str:
+    """300 -> "5m", 3600 -> "1h", 604800 -> "7d"."""
+    for unit, size in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds >= size and seconds % size == 0:
+            return f"{seconds // size}{unit}"
+    return f"{seconds}s"
+
+# --- pool reads --------------------------------------------------------------------------
+
+def _observe_data(seconds_ago: Sequence[int]) -> str:
+    words = [32, len(seconds_ago), *seconds_ago]
+    return ABI_OBSERVE + "".join(hex(w)[2:].zfill(64) for w in words)
+
+def _decode_cumulatives(result: str) -> List[int]:
+    """tickCumulatives (int56[]) of an observe() result."""
+    raw = result[2:]
+    offset = int(raw[:64], 16) * 2
+    count = int(raw[offset:offset + 64], 16)
+    return [to_signed(int(raw[offset + 64 * (i + 1):offset + 64 * (i + 2)], 16), 56) for i in range(count)]
+
+def read_twaps(pool: str, windows: Sequence[int] = TWAP_WINDOWS, rpc_url: Optional[str] = None):
+    """
+    (spot tick, {window: mean tick}) from one batched round trip: slot0, then
+    observe() over all windows and over each shorter prefix; the longest
+    observe() that did not revert wins. (None, {}) if the pool is unreadable.
+    """
+    windows = sorted(set(windows))
+    prefixes = [windows[:k] for k in range(len(windows), 0, -1)]
+    results = rpc.eth_call_batch([(pool, ABI_SLOT0)] + [(pool, _observe_data([0, *w])) for w in prefixes], rpc_url=rpc_url)
+    slot0 = results[0]
+    spot = signed_int24(slot0[2 + 64:2 + 128]) if slot0 and slot0 != "0x" else None
+    for prefix, result in zip(prefixes, results[1:]):
+        if result and result != "0x":
+            cumulatives = _decode_cumulatives(result)
+            return spot, {w: (cumulatives[0] - c) / w for w, c in zip(prefix, cumulatives[1:])}
+    return spot, {}
+
+# --- swap series -------------------------------------------------------------------------
+
+def bars(times, ticks, step: int = BAR_SECONDS, end: Optional[float] = None):
+    """(bar end times, last tick at each) from the first swap to `end` (default: the last swap)."""
+    import numpy as np
+
+    times = np.asarray(times, dtype=float)
+    if times.size == 0:
+        return times, np.asarray(ticks, dtype=float)
+    end = times[-1] if end is None else end
+    grid = np.arange(times[0] - times[0] % step + step, end + step, step)
+    return grid, portfolio.as_of(times, np.asarray(ticks, dtype=float), grid)
+
+def _quote_sign(position: Dict[str, Any]) -> int:
+    """+1 if the USD price of the volatile token rises with the tick, -1 if it falls (token0 is the stablecoin)."""
+    return -1 if quotes_token1(position) else 1
+
+def standardized_returns(conn, pool: str, position: Dict[str, Any], since: Optional[float] = None):
+    """
+    Bar log returns of the volatile token's USD price from the swap index, divided
+    by sqrt(bar length in years): the unit-time shocks range_risk bootstraps.
+    """
+    import numpy as np
+
+    swaps = swap_index.load(conn, pool, since)
+    _, ticks = bars(swaps["timestamp"], swaps["tick"])
+    return np.diff(ticks) * (_quote_sign(position) * LOG_TICK) / math.sqrt(BAR_SECONDS / YEAR_SECONDS)
+
+def _window_stats(grid, ticks, position: Dict[str, Any], windows: Sequence[int]):
+    """{label: annualized vol %}, {label: max drawdown %}, {label: current drawdown %} over the trailing windows."""
+    import numpy as np
+
+    vol, max_dd, current_dd = {}, {}, {}
+    if len(grid) < 2:
+        return vol, max_dd, current_dd
+    log_price = ticks * (_quote_sign(position) * LOG_TICK)
+    for w in windows:
+        label = window_label(w)
+        keep = grid > grid[-1] - w
+        if keep.sum() < 2:
+            continue
+        lp = log_price[keep]
+        vol[label] = float(np.diff(lp).std() * math.sqrt(YEAR_SECONDS / BAR_SECONDS)) * 100
+        drawdown = np.exp(lp - np.maximum.accumulate(lp)) - 1
+        max_dd[label] = float(drawdown.min()) * 100
+        current_dd[label] = float(drawdown[-1]) * 100
+    return vol, max_dd, current_dd
+
+def analyze(conn, pool: str, position: Dict[str, Any], rpc_url: Optional[str] = None) -> Dict[str, Any]:
+    """Spot, TWAPs, realized volatility and drawdowns of the pool, in USD per volatile token."""
+    pool = pool.lower()
+    symbol = position.get("symbol1") if quotes_token1(position) else position.get("symbol0")
+
+    def price(tick):
+        return float(tick_to_price(tick, position))
+
+    with tracing.span("analytics.pool", pool=pool):
+        spot, twaps = read_twaps(pool, rpc_url=rpc_url)
+        swaps = swap_index.load(conn, pool, since=time.time() - max(VOL_WINDOWS) - BAR_SECONDS)
+        grid, ticks = bars(swaps["timestamp"], swaps["tick"])
+        vol, max_dd, current_dd = _window_stats(grid, ticks, position, VOL_WINDOWS)
+    return {
+        "pool": pool, "symbol": symbol,
+        "spot_tick": spot, "spot_price": price(spot) if spot is not None else None,
+        "twap": {window_label(w): {"seconds": w, "tick": t, "price": price(t)} for w, t in sorted(twaps.items())},
+        "realized_vol": vol, "max_drawdown": max_dd, "current_drawdown": current_dd,
+        "swaps": int(len(swaps["tick"])), "bars": int(len(grid)), "bar_seconds": BAR_SECONDS,
+        "last_swap": int(swaps["timestamp"].max()) if len(swaps["timestamp"]) else None,
+        "computed_at": time.time(),
+    }
+
+# --- cache / entry points ----------------------------------------------------------------
+
+def cached(cache_file: str = CACHE_FILE) -> Dict[str, Dict[str, Any]]:
+    """Last analytics per pool address, whatever their age."""
+    cache = storage.read_json(cache_file, {}) or {}
+    return cache.get("pools", {}) if cache.get("version") == CACHE_VERSION else {}
+
+def _store(results: Dict[str, Dict[str, Any]], cache_file: str = CACHE_FILE):
+    with _lock:
+        pools = cached(cache_file)
+        pools.update(results)
+        storage.write_json(cache_file, {"version": CACHE_VERSION, "pools": pools}, indent=None)
+
+def pool_positions(conn) -> Dict[str, Dict[str, Any]]:
+    """One stored position per tracked V3 pool address (for its token symbols and quoting)."""
+    positions = {}
+    for entry in state_db.list_pools(conn, include_closed=False):
+        position = state_db.get_position(conn, entry["nft_id"]) or {}
+        if position.get("pool_address") and entry.get("exchange", "uniswap_v3") == "uniswap_v3":
+            positions.setdefault(position["pool_address"].lower(), position)
+    return positions
+
+def get(pool: str, conn=None, max_age: float = TTL, position: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """The pool's analytics from the cache while younger than `max_age`, else recomputed."""
+    pool = pool.lower()
+    result = cached().get(pool)
+    if result and time.time() - result["computed_at"] < max_age:
+        return result
+    conn = conn or state_db.connect()
+    position = position or pool_positions(conn).get(pool)
+    if position is None:
+        return result
+    result = analyze(conn, pool, position)
+    _store({pool: result})
+    return result
+
+def refresh(conn=None) -> Dict[str, Dict[str, Any]]:
+    """Recompute the analytics of every tracked V3 pool."""
+    conn = conn or state_db.connect()
+    results = {pool: analyze(conn, pool, position) for pool, position in pool_positions(conn).items()}
+    if results:
+        _store(results)
+    return results
+
+def main():
+    conn = state_db.connect()
+    positions = pool_positions(conn)
+    pools = [p.lower() for p in sys.argv[1:]] or sorted(positions)
+    if not pools:
+        print("No V3 pools to analyze.")
+        return
+    for pool in pools:
+        if pool not in positions:
+            print(f"{pool}: no tracked position in this pool")
+            continue
+        a = analyze(conn, pool, positions[pool])
+        _store({pool: a})
+        last = datetime.datetime.fromtimestamp(a["last_swap"]).strftime("%Y-%m-%d %H:%M") if a["last_swap"] else "-"
+        spot = f"${a['spot_price']:,.2f}" if a["spot_price"] is not None else "n/a"
+        print(f"{pool} ({a['symbol']}): spot {spot} | {a['swaps']} swaps in {a['bars']} bars of {BAR_SECONDS // 60} min, last {last}")
+        print("  TWAP  " + (" | ".join(f"{k} ${v['price']:,.2f}" for k, v in a["twap"].items()) or "unavailable"))
+        for label in a["realized_vol"]:
+            print(f"  {label:<5} vol {a['realized_vol'][label]:.1f}% | max drawdown {a['max_drawdown'][label]:.2f}%"
+                  f" | from peak {a['current_drawdown'][label]:.2f}%")
+
+if __name__ == "__main__":
+    main()
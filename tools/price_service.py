@@ -0,0 +1,188 @@
+import json
+import os
+import time
+from typing import Dict, Iterable, Optional
+from tools import storage, tracing
+
+# Price oracle shared by every script in a sync run.
+# Quotes are fetched in one batched CoinGecko request, cached on disk with a TTL
+# (each sync stage is a separate process), and fall back to the pool's own slot0
+# when the HTTP source fails. A symbol that cannot be priced is simply missing
+# from the result: callers must never substitute a hard-coded number.
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_FILE = os.path.join(SCRIPT_DIR, ".cache", "prices.json")
+PRICE_TTL = int(os.getenv("PRICE_TTL", "300"))
+RPC_URL = os.getenv("RPC_URL", "https://mainnet.base.org")
+COINGECKO_URL = os.getenv("COINGECKO_URL", "https://api.coingecko.com/api/v3/simple/price")
+
+COINGECKO_IDS = {
+    "cbBTC": "coinbase-wrapped-btc",
+    "WBTC": "wrapped-bitcoin",
+    "WETH": "weth",
+    "SOL": "solana",
+    "USDC": "usd-coin",
+}
+
+# Stablecoins are valued at $1 everywhere else in the tracker; used only when
+# neither CoinGecko nor a cache entry is available, and tagged as such.
+PEGGED = {"USDC": 1.0, "USDbC": 1.0, "USDT": 1.0, "DAI": 1.0}
+
+# On-chain fallback: Uniswap V3 pool of <symbol>/USDC on Base
+V3_FACTORY_ADDRESS = "0x33128a8fC17869897dcE68Ed026d694621f6FDfD"
+USDC_BASE = {"address": "0x833589fcd6edb6e08f4c7c32d4f71b54bda02913", "decimals": 6}
+REFERENCE_POOLS = {
+    "cbBTC": {"address": "0xcbb7c0000ab88b473b1f5afd9ef808440eed33bf", "decimals": 8, "fee": 500},
+}
+
+ABI_SLOT0 = "0x3850c7bd"
+ABI_GET_POOL = "0x1698ee82"
+
+class PriceService:
+    def __init__(self, ttl: int = PRICE_TTL, cache_file: str = CACHE_FILE, rpc_url: str = RPC_URL):
+        self.ttl = ttl
+        self.cache_file = cache_file
+        self.rpc_url = rpc_url
+        self.requests_made = 0
+        self._cache = self._load_cache()
+
+    def _load_cache(self) -> Dict:
+        try:
+            with open(self.cache_file, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {"quotes": {}, "pools": {}}
+
+    def _save_cache(self):
+        storage.write_json(self.cache_file, self._cache)
+
+    def _fresh(self, symbol: str) -> Optional[Dict]:
+        quote = self._cache["quotes"].get(symbol)
+        if not quote:
+            return None
+        # A sync run pins its quotes: anything fetched since the run started is reused
+        # by every stage, however long the run takes.
+        run_start = float(os.getenv("PRICE_RUN_STARTED", "inf"))
+        if time.time() - quote["timestamp"] < self.ttl or quote["timestamp"] >= run_start:
+            return quote
+        return None
+
+    def get_prices(self, symbols: Iterable[str], pool_hints: Optional[Dict[str, Dict]] = None) -> Dict[str, Dict]:
+        """
+        Return {symbol: {"price", "source", "timestamp"}} for every symbol that could be priced.
+        pool_hints maps symbol -> {"pool_address", "token0_is_quote", "decimals0", "decimals1"} for
+        the on-chain fallback (e.g. the position's own pool).
+        """
+        symbols = list(dict.fromkeys(symbols))
+        result = {s: q for s in symbols if (q := self._fresh(s))}
+        # Symbols nobody could price earlier in this sync run are not retried by every stage
+        run_start = float(os.getenv("PRICE_RUN_STARTED", "inf"))
+        failures = self._cache.setdefault("failures", {})
+        missing = [s for s in symbols if s not in result and failures.get(s, -1) < run_start]
+        if not missing:
+            return result
+
+        now = time.time()
+        for symbol, price in self._fetch_coingecko(missing).items():
+            result[symbol] = {"price": price, "source": "coingecko", "timestamp": now}
+
+        for symbol in [s for s in missing if s not in result]:
+            price = self._fetch_slot0(symbol, (pool_hints or {}).get(symbol))
+            if price:
+                result[symbol] = {"price": price, "source": "pool_slot0", "timestamp": now}
+            elif symbol in PEGGED:
+                result[symbol] = {"price": PEGGED[symbol], "source": "peg", "timestamp": now}
+
+        for symbol in missing:
+            if symbol in result:
+                self._cache["quotes"][symbol] = result[symbol]
+                failures.pop(symbol, None)
+            else:
+                failures[symbol] = now
+        self._save_cache()
+        return result
+
+    def get_price(self, symbol: str, pool_hint: Optional[Dict] = None) -> Optional[Dict]:
+        return self.get_prices([symbol], {symbol: pool_hint} if pool_hint else None).get(symbol)
+
+    def _fetch_coingecko(self, symbols) -> Dict[str, float]:
+        ids = {COINGECKO_IDS[s]: s for s in symbols if s in COINGECKO_IDS}
+        if not ids:
+            return {}
+        import requests
+
+        with tracing.span("prices.coingecko", ids=",".join(ids)) as span_:
+            try:
+                self.requests_made += 1
+                res = requests.get(COINGECKO_URL, params={"ids": ",".join(ids), "vs_currencies": "usd"}, timeout=5)
+                res.raise_for_status()
+                data = res.json()
+            except Exception as e:
+                span_.error = f"{type(e).__name__}: {e}"
+                print(f"CoinGecko error: {e}")
+                return {}
+        prices = {}
+        for cg_id, symbol in ids.items():
+            price = data.get(cg_id, {}).get("usd")
+            if price:
+                prices[symbol] = float(price)
+        return prices
+
+    def _eth_call(self, to_addr, data) -> Optional[str]:
+        from tools import rpc
+        return rpc.eth_call(to_addr, data, rpc_url=self.rpc_url)
+
+    def _reference_hint(self, symbol) -> Optional[Dict]:
+        ref = REFERENCE_POOLS.get(symbol)
+        if not ref:
+            return None
+        pool_address = self._cache["pools"].get(symbol)
+        if not pool_address:
+            t0, t1 = sorted([ref["address"].lower(), USDC_BASE["address"].lower()])
+            data = ABI_GET_POOL + t0[2:].zfill(64) + t1[2:].zfill(64) + hex(ref["fee"])[2:].zfill(64)
+            res = self._eth_call(V3_FACTORY_ADDRESS, data)
+            if not res or len(res) < 42 or int(res, 16) == 0:
+                return None
+            pool_address = "0x" + res[-40:]
+            self._cache["pools"][symbol] = pool_address
+        token0_is_quote = USDC_BASE["address"].lower() < ref["address"].lower()
+        return {
+            "pool_address": pool_address,
+            "token0_is_quote": token0_is_quote,
+            "decimals0": USDC_BASE["decimals"] if token0_is_quote else ref["decimals"],
+            "decimals1": ref["decimals"] if token0_is_quote else USDC_BASE["decimals"],
+        }
+
+    def _fetch_slot0(self, symbol, hint=None) -> Optional[float]:
+        hint = hint or self._reference_hint(symbol)
+        if not hint or not hint.get("pool_address"):
+            return None
+        res = self._eth_call(hint["pool_address"], ABI_SLOT0)
+        if not res or len(res) < 66:
+            return None
+        sqrt_price_x96 = int(res[2:66], 16)
+        if sqrt_price_x96 == 0:
+            return None
+        # token1 per token0, decimal-adjusted
+        price1_per_0 = (sqrt_price_x96 / 2**96) ** 2 * 10 ** (hint["decimals0"] - hint["decimals1"])
+        return 1 / price1_per_0 if hint["token0_is_quote"] else price1_per_0
+
+def hints_from_position(pos: Dict) -> Dict[str, Dict]:
+    """Build a slot0 fallback hint from a position snapshot that recorded its pool address."""
+    from tools.metrics import TOKEN_DECIMALS
+
+    pool_address = pos.get("pool_address")
+    symbol0, symbol1 = pos.get("symbol0"), pos.get("symbol1")
+    if not pool_address or not symbol0 or not symbol1:
+        return {}
+    token0_is_quote = symbol0 in PEGGED
+    if token0_is_quote == (symbol1 in PEGGED):
+        return {}
+    return {
+        symbol1 if token0_is_quote else symbol0: {
+            "pool_address": pool_address,
+            "token0_is_quote": token0_is_quote,
+            "decimals0": TOKEN_DECIMALS.get(symbol0, 18),
+            "decimals1": TOKEN_DECIMALS.get(symbol1, 18),
+        }
+    }
@@ -0,0 +1,248 @@
+import contextlib
+import os
+import shutil
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+# Profiling mode for sync.py and dashboard_gen_v3.py (--profile[=mode]) and for
+# syncs the server starts (POST /api/sync?profile=1, or SYNC_PROFILE=sample).
+#
+#   cprofile  cProfile of the main thread + wall-clock stack sampling of every thread
+#   sample    stack sampling only (a few % overhead; fine for a production sync)
+#
+# A run writes .cache/profiles/<run_id>/, one pair of files per process, since
+# the sync stages are separate interpreters launched through `profiling.py run`:
+#
+#   <process>-<pid>.prof        pstats (snakeviz, `python -m pstats`)    [cprofile]
+#   <process>-<pid>.collapsed   folded stacks ("a;b;c 12") for flamegraph.pl / speedscope
+#   run.prof / run.collapsed    all processes merged, written by the process that started the run
+#
+#   python tools/profiling.py list               # recent runs
+#   python tools/profiling.py show [run_id]      # top functions of a run (default: latest)
+#   python tools/profiling.py run <script> [args...]
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(SCRIPT_DIR, ".cache", "profiles"))
+MODES = ("cprofile", "sample")
+SAMPLE_INTERVAL = 0.005
+MAX_RUNS = 20
+TOP = 15
+
+def cli_mode(argv: Optional[Sequence[str]] = None) -> Optional[str]:
+    """Mode requested by --profile / --profile=<mode> on the command line, else None."""
+    for arg in (sys.argv[1:] if argv is None else argv):
+        if arg == "--profile":
+            return "cprofile"
+        if arg.startswith("--profile="):
+            mode = arg.split("=", 1)[1]
+            if mode not in MODES:
+                raise SystemExit(f"--profile: unknown mode {mode!r} (choose from {', '.join(MODES)})")
+            return mode
+    return None
+
+def new_run_id() -> str:
+    return time.strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}"
+
+def active() -> bool:
+    return os.getenv("PROFILE") in MODES
+
+def wrap_command(cmd: List[str]) -> List[str]:
+    """[python, script, ...] -> [python, profiling.py, run, script, ...] while a profiled run is active."""
+    if not active() or len(cmd) < 2:
+        return cmd
+    return [cmd[0], os.path.abspath(__file__), "run", *cmd[1:]]
+
+_RUNNER_FILES = {os.path.abspath(__file__), __file__, "<frozen runpy>"}
+
+class Sampler:
+    """Wall-clock sampler: folds the stack of every thread each interval into collapsed-stack counts."""
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.counts: Dict[str, int] = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiling-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    if code.co_filename in _RUNNER_FILES:
+                        break  # `profiling.py run` / runpy frames below the script's <module>
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                key = ";".join(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+            self.samples += 1
+
+    def write(self, path: str):
+        with open(path, "w") as f:
+            for stack, count in sorted(self.counts.items()):
+                f.write(f"{stack} {count}\n")
+
+@contextlib.contextmanager
+def profile(name: str, mode: Optional[str] = None):
+    """
+    Profile the block as process `name`. An explicit mode (from --profile) starts a
+    run that the stages launched via wrap_command() join; without one, profiles
+    only if this process was launched into an active run.
+    """
+    started_run = mode is not None
+    mode = mode or os.getenv("PROFILE")
+    if mode not in MODES:
+        yield None
+        return
+    if os.getenv("PROFILE_PID") == str(os.getpid()):
+        # Already profiled by an outer profile() in this process (a script launched via
+        # `profiling.py run` that also profiles itself): a second cProfile would replace
+        # the first hook and both would write the same files. The pid is kept in the
+        # environment because runpy loads this module a second time for the script.
+        yield os.path.join(PROFILE_DIR, os.environ["PROFILE_RUN"])
+        return
+
+    run_id = os.getenv("PROFILE_RUN") or new_run_id()
+    run_dir = os.path.join(PROFILE_DIR, run_id)
+    os.makedirs(run_dir, exist_ok=True)
+    saved_env = {k: os.environ.get(k) for k in ("PROFILE", "PROFILE_RUN", "PROFILE_PID")}
+    os.environ.update(PROFILE=mode, PROFILE_RUN=run_id, PROFILE_PID=str(os.getpid()))
+    if started_run:
+        print(f"Profiling ({mode}) into {run_dir}")
+
+    profiler = None
+    if mode == "cprofile":
+        import cProfile
+        profiler = cProfile.Profile()
+    sampler = Sampler().start()
+    if profiler:
+        profiler.enable()
+    try:
+        yield run_dir
+    finally:
+        if profiler:
+            profiler.disable()
+        sampler.stop()
+        for key, value in saved_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+        base = os.path.join(run_dir, f"{name}-{os.getpid()}")
+        if profiler:
+            profiler.dump_stats(base + ".prof")
+        sampler.write(base + ".collapsed")
+        if started_run:
+            merge(run_dir)
+            print_top(run_dir)
+            _prune()
+        else:
+            print(f"Profile: {base}.* ({sampler.samples} samples)")
+
+def merge(run_dir: str):
+    """run.prof / run.collapsed over every process of the run; collapsed stacks get the process as root frame."""
+    files = sorted(f for f in os.listdir(run_dir) if not f.startswith("run."))
+    profs = [os.path.join(run_dir, f) for f in files if f.endswith(".prof")]
+    if profs:
+        import pstats
+        pstats.Stats(*profs).dump_stats(os.path.join(run_dir, "run.prof"))
+    with open(os.path.join(run_dir, "run.collapsed"), "w") as out:
+        for filename in files:
+            if filename.endswith(".collapsed"):
+                process = filename[:-len(".collapsed")]
+                with open(os.path.join(run_dir, filename), "r") as f:
+                    for line in f:
+                        out.write(f"{process};{line}")
+
+def top_functions(run_dir: str, limit: int = TOP):
+    """[(label, self_seconds_or_samples, total, unit)] hottest first: pstats when available, else samples."""
+    prof = os.path.join(run_dir, "run.prof")
+    if os.path.exists(prof):
+        import pstats
+        stats = pstats.Stats(prof).stats
+        rows = [(f"{func} ({os.path.basename(filename)}:{line})", tt, ct)
+                for (filename, line, func), (_cc, _nc, tt, ct, _callers) in stats.items()]
+        return [(label, tt, ct, "s") for label, tt, ct in sorted(rows, key=lambda r: r[1], reverse=True)[:limit]]
+
+    own: Dict[str, int] = {}
+    total: Dict[str, int] = {}
+    with open(os.path.join(run_dir, "run.collapsed"), "r") as f:
+        for line in f:
+            stack, _, count = line.rstrip("\n").rpartition(" ")
+            frames = stack.split(";")[2:]  # drop process and thread roots
+            if not frames:
+                continue
+            own[frames[-1]] = own.get(frames[-1], 0) + int(count)
+            for frame in set(frames):
+                total[frame] = total.get(frame, 0) + int(count)
+    hottest = sorted(own.items(), key=lambda kv: kv[1], reverse=True)[:limit]
+    return [(label, n, total[label], "samples") for label, n in hottest]
+
+def print_top(run_dir: str, limit: int = TOP):
+    rows = top_functions(run_dir, limit)
+    if not rows:
+        return
+    unit = rows[0][3]
+    print(f"\nTop {len(rows)} functions by self time ({unit}; cProfile covers each process's main thread):"
+          if unit == "s" else f"\nTop {len(rows)} frames by self samples (every {SAMPLE_INTERVAL * 1000:g} ms, wall clock):")
+    print(f"{'self':>10} {'total':>10}  function")
+    for label, own, total, _ in rows:
+        fmt = "{:>10.3f} {:>10.3f}" if unit == "s" else "{:>10} {:>10}"
+        print(f"{fmt.format(own, total)}  {label}")
+    print(f"Flamegraph: flamegraph.pl {os.path.join(run_dir, 'run.collapsed')} > flame.svg (or load it in speedscope)")
+
+def recent() -> List[str]:
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    return sorted((d for d in os.listdir(PROFILE_DIR) if os.path.isdir(os.path.join(PROFILE_DIR, d))), reverse=True)
+
+def _prune():
+    for run_id in recent()[MAX_RUNS:]:
+        shutil.rmtree(os.path.join(PROFILE_DIR, run_id), ignore_errors=True)
+
+def run_script(argv: List[str]):
+    """Run a script as __main__ under profile(), for stages launched into a profiled run."""
+    import runpy
+    script = argv[0]
+    sys.argv = list(argv)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+    with profile(os.path.splitext(os.path.basename(script))[0]):
+        runpy.run_path(script, run_name="__main__")
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else "show"
+    if command == "run" and len(sys.argv) > 2:
+        run_script(sys.argv[2:])
+        return
+    runs = recent()
+    if command == "list":
+        for run_id in runs:
+            files = os.listdir(os.path.join(PROFILE_DIR, run_id))
+            print(f"{run_id}  {sum(f.endswith('.collapsed') and not f.startswith('run.') for f in files):>3} processes")
+        return
+    run_id = sys.argv[2] if len(sys.argv) > 2 else (runs[0] if runs else None)
+    if not run_id:
+        print(f"No profiles in {PROFILE_DIR}")
+        return
+    print(f"Profile run {run_id}")
+    print_top(os.path.join(PROFILE_DIR, run_id))
+
+if __name__ == "__main__":
+    main()
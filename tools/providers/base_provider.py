@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
 
 class BaseProvider(ABC):
     """
@@ -28,6 +28,57 @@ class BaseProvider(ABC):
         """
         pass
 
+    async def fetch_position_data_async(self) -> Optional[Dict[str, Any]]:
+        """Async variant; providers without native async I/O run the sync call in a worker thread."""
+        import asyncio
+        return await asyncio.to_thread(self.fetch_position_data)
+
+    async def fetch_fees_data_async(self) -> Optional[Dict[str, Any]]:
+        import asyncio
+        return await asyncio.to_thread(self.fetch_fees_data)
+
+    @classmethod
+    def group_key(cls, config: Dict[str, Any]) -> Tuple:
+        """Configs with the same key can be served together by fetch_many."""
+        return (config.get("exchange", "uniswap_v3"), config.get("network", "base"), config.get("rpc_url"))
+
+    @classmethod
+    def fetch_many(cls, configs: List[Dict[str, Any]]) -> Dict[Any, Optional[Dict[str, Any]]]:
+        """
+        Position data for many configs of this provider, keyed by nft_id.
+        The default fans out per position; providers override it to batch
+        all positions into as few RPC round trips as possible.
+        """
+        import asyncio
+
+        async def gather():
+            providers = [cls(c) for c in configs]
+            results = await asyncio.gather(*(p.fetch_position_data_async() for p in providers),
+                                           return_exceptions=True)
+            return {p.nft_id: (None if isinstance(r, BaseException) else r) for p, r in zip(providers, results)}
+        return asyncio.run(gather())
+
+    @classmethod
+    async def fetch_many_async(cls, configs: List[Dict[str, Any]]) -> Dict[Any, Optional[Dict[str, Any]]]:
+        import asyncio
+        return await asyncio.to_thread(cls.fetch_many, configs)
+
+    def usd_prices(self, symbol0: str, symbol1: str, price0_in_1: float) -> Tuple[float, float, bool]:
+        """
+        USD price of each token from the pool price (token0 in token1).
+        The stable side is $1; pairs without a stablecoin use the shared price service.
+        Returns (usd0, usd1, token0_is_quote).
+        """
+        from tools.metrics import STABLECOINS
+
+        if symbol0 in STABLECOINS:
+            return 1.0, (1 / price0_in_1 if price0_in_1 else 0), True
+        if symbol1 in STABLECOINS:
+            return price0_in_1, 1.0, False
+        from tools.price_service import PriceService
+        quotes = PriceService().get_prices([symbol0, symbol1])
+        return quotes.get(symbol0, {}).get("price", 0), quotes.get(symbol1, {}).get("price", 0), False
+
     def get_pool_dir(self) -> str:
         """Helper to get the directory for this pool's data."""
         return f"tools/pools/{self.nft_id}"
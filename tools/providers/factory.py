@@ -1,24 +1,95 @@
-from typing import Dict, Any, Type
+import importlib
+from typing import Any, Dict, List, Optional, Type
+from tools import tracing
 from tools.providers.base_provider import BaseProvider
-from tools.providers.uniswap_v3_provider import UniswapV3Provider
-from tools.providers.byreal_provider import ByRealProvider
+
+class ProviderGroup:
+    """
+    Positions that one provider class can serve together (same exchange,
+    network and RPC endpoint); fetch() runs them as a single batched request.
+    """
+
+    def __init__(self, provider_class: Type[BaseProvider], configs: List[Dict[str, Any]]):
+        self.provider_class = provider_class
+        self.configs = configs
+
+    @property
+    def label(self) -> str:
+        exchange, network, _ = self.provider_class.group_key(self.configs[0])
+        return f"{exchange}@{network} ({len(self.configs)} position(s))"
+
+    def fetch(self) -> Dict[Any, Optional[Dict[str, Any]]]:
+        with tracing.span("provider.fetch_many", group=self.label):
+            return self.provider_class.fetch_many(self.configs)
+
+    async def fetch_async(self) -> Dict[Any, Optional[Dict[str, Any]]]:
+        # Each gathered group runs in its own task context, so the spans don't interleave
+        with tracing.span("provider.fetch_many", group=self.label):
+            return await self.provider_class.fetch_many_async(self.configs)
 
 class ProviderFactory:
     """
     Registry and factory for specialized pool providers.
+    Providers are registered by import path and loaded on first use, so a
+    Base-only portfolio never imports the Solana stack (and vice versa).
     """
-    
-    _providers: Dict[str, Type[BaseProvider]] = {
-        "uniswap_v3": UniswapV3Provider,
-        "byreal": ByRealProvider
+
+    _providers: Dict[str, str] = {
+        "uniswap_v3": "tools.providers.uniswap_v3_provider:UniswapV3Provider",
+        "uniswap_v4": "tools.providers.uniswap_v4_provider:UniswapV4Provider",
+        "byreal": "tools.providers.byreal_provider:ByRealProvider",
     }
+    _loaded: Dict[str, Type[BaseProvider]] = {}
 
     @classmethod
-    def create(cls, config: Dict[str, Any]) -> BaseProvider:
-        exchange = config.get("exchange", "uniswap_v3")
-        provider_class = cls._providers.get(exchange)
-        
-        if not provider_class:
+    def register(cls, exchange: str, path: str):
+        cls._providers[exchange] = path
+        cls._loaded.pop(exchange, None)
+
+    @classmethod
+    def get_class(cls, exchange: str) -> Type[BaseProvider]:
+        provider_class = cls._loaded.get(exchange)
+        if provider_class:
+            return provider_class
+        path = cls._providers.get(exchange)
+        if not path:
             raise ValueError(f"No provider found for exchange: {exchange}")
-            
-        return provider_class(config)
+        module_name, class_name = path.split(":")
+        provider_class = getattr(importlib.import_module(module_name), class_name)
+        cls._loaded[exchange] = provider_class
+        return provider_class
+
+    @classmethod
+    def create(cls, config: Dict[str, Any]) -> BaseProvider:
+        return cls.get_class(config.get("exchange", "uniswap_v3"))(config)
+
+    @classmethod
+    def group(cls, configs: List[Dict[str, Any]]) -> List[ProviderGroup]:
+        """Split pool configs into per-provider batches, preserving registry order."""
+        groups: Dict[tuple, ProviderGroup] = {}
+        for config in configs:
+            provider_class = cls.get_class(config.get("exchange", "uniswap_v3"))
+            key = (provider_class,) + provider_class.group_key(config)
+            if key not in groups:
+                groups[key] = ProviderGroup(provider_class, [])
+            groups[key].configs.append(config)
+        return list(groups.values())
+
+    @classmethod
+    async def fetch_all_async(cls, configs: List[Dict[str, Any]]) -> Dict[Any, Optional[Dict[str, Any]]]:
+        """Position data for every config; groups (e.g. Base and Solana) run concurrently."""
+        import asyncio
+        groups = cls.group(configs)
+        results = await asyncio.gather(*(g.fetch_async() for g in groups), return_exceptions=True)
+        merged: Dict[Any, Optional[Dict[str, Any]]] = {}
+        for group, result in zip(groups, results):
+            if isinstance(result, BaseException):
+                print(f"!!! Provider group {group.label} failed: {result}")
+                result = {c.get("nft_id"): None for c in group.configs}
+            merged.update(result)
+        return merged
+
+    @classmethod
+    def fetch_all(cls, configs: List[Dict[str, Any]]) -> Dict[Any, Optional[Dict[str, Any]]]:
+        import asyncio
+        return asyncio.run(cls.fetch_all_async(configs))
@@ -1,14 +1,11 @@
-import requests
-import json
 import os
-from decimal import Decimal, getcontext
+from decimal import Decimal
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
+from tools import rpc
+from tools.clmath import signed_int24, tick_to_sqrt_ratio, get_amounts
 from tools.providers.base_provider import BaseProvider
 
-# Set high precision for V3 math
-getcontext().prec = 50
-
 class UniswapV3Provider(BaseProvider):
     """
     Provider for Uniswap V3 pools on EVM chains (Base, Ethereum, etc).
@@ -32,63 +29,67 @@ class UniswapV3Provider(BaseProvider):
         self.rpc_url = config.get("rpc_url", os.getenv("RPC_URL", "https://mainnet.base.org"))
         self.token_id = int(self.nft_id)
 
-    def _call_rpc(self, to_addr: str, data: str) -> Optional[str]:
-        payload = {"jsonrpc": "2.0", "method": "eth_call", "params": [{"to": to_addr, "data": data}, "latest"], "id": 1}
-        try:
-            res = requests.post(self.rpc_url, json=payload, timeout=15)
-            return res.json().get('result')
-        except Exception as e:
-            print(f"[{self.exchange}] RPC Error: {e}")
+    @staticmethod
+    def _decode_position(res_pos: Optional[str]) -> Optional[Dict[str, Any]]:
+        if not res_pos or res_pos == "0x":
             return None
+        raw = res_pos[2:]
+        words = [raw[i:i+64] for i in range(0, len(raw), 64)]
+        return {
+            "token0": "0x" + words[2][-40:].lower(),
+            "token1": "0x" + words[3][-40:].lower(),
+            "fee": int(words[4], 16),
+            "tick_lower": signed_int24(words[5]),
+            "tick_upper": signed_int24(words[6]),
+            "liquidity": int(words[7], 16),
+            "tokens_owed0": int(words[10], 16),
+            "tokens_owed1": int(words[11], 16),
+        }
 
-    def _signed_int24(self, hex_str: str) -> int:
-        val = int(hex_str[-6:], 16)
-        if val >= 2**23:
-            return val - 2**24
-        return val
+    @classmethod
+    def fetch_many(cls, configs: List[Dict[str, Any]]) -> Dict[Any, Optional[Dict[str, Any]]]:
+        """
+        All positions in three batched round trips: positions(), factory getPool()
+        per distinct (token0, token1, fee), then slot0() per distinct pool.
+        """
+        providers = [cls(c) for c in configs]
+        if not providers:
+            return {}
+        rpc_url = providers[0].rpc_url
+        print(f"[uniswap_v3] Fetching {len(providers)} position(s)...")
 
-    def _tick_to_sqrt_ratio(self, tick: int) -> Decimal:
-        base = Decimal("1.0001")
-        return base ** (Decimal(tick) / 2)
+        results = rpc.eth_call_batch(
+            [(cls.MANAGER_ADDRESS, cls.ABI_POSITIONS + hex(p.token_id)[2:].zfill(64)) for p in providers],
+            rpc_url=rpc_url)
+        positions = {p.token_id: cls._decode_position(res) for p, res in zip(providers, results)}
 
-    def _get_amounts(self, liquidity, sqrt_price, tick_lower, tick_upper, current_tick):
-        L = Decimal(liquidity)
-        sqrt_ratio_a = self._tick_to_sqrt_ratio(tick_lower)
-        sqrt_ratio_b = self._tick_to_sqrt_ratio(tick_upper)
-        
-        if current_tick < tick_lower:
-            amount0 = L * (1/sqrt_ratio_a - 1/sqrt_ratio_b)
-            amount1 = Decimal(0)
-        elif current_tick >= tick_upper:
-            amount0 = Decimal(0)
-            amount1 = L * (sqrt_ratio_b - sqrt_ratio_a)
-        else:
-            amount0 = L * (1/sqrt_price - 1/sqrt_ratio_b)
-            amount1 = L * (sqrt_price - sqrt_ratio_a)
-        
-        return float(amount0), float(amount1)
+        pool_keys = sorted({(d["token0"], d["token1"], d["fee"]) for d in positions.values() if d})
+        results = rpc.eth_call_batch(
+            [(cls.FACTORY_ADDRESS, cls.ABI_GET_POOL + t0[2:].zfill(64) + t1[2:].zfill(64) + hex(fee)[2:].zfill(64))
+             for t0, t1, fee in pool_keys], rpc_url=rpc_url) if pool_keys else []
+        pools = {key: "0x" + res[-40:] for key, res in zip(pool_keys, results)
+                 if res and res != "0x" and len(res) > 42 and int(res, 16) != 0}
+
+        pool_addresses = sorted(set(pools.values()))
+        results = rpc.eth_call_batch([(addr, cls.ABI_SLOT0) for addr in pool_addresses], rpc_url=rpc_url) if pool_addresses else []
+        slot0s = dict(zip(pool_addresses, results))
+
+        output = {}
+        for p in providers:
+            pos = positions[p.token_id]
+            pool_address = pools.get((pos["token0"], pos["token1"], pos["fee"])) if pos else None
+            output[p.token_id] = p._build_output(pos, pool_address, slot0s.get(pool_address)) if pos else None
+        return output
 
     def fetch_position_data(self) -> Optional[Dict[str, Any]]:
         # This mirrors the logic in fetch_pool_data.py but returns a dict
-        print(f"[{self.exchange}] Fetching data for NFT #{self.token_id}...")
-        
-        data_str = self.ABI_POSITIONS + hex(self.token_id)[2:].zfill(64)
-        res_pos = self._call_rpc(self.MANAGER_ADDRESS, data_str)
-        
-        if not res_pos or res_pos == "0x":
-            return None
+        return self.fetch_many([self.config]).get(self.token_id)
 
-        raw = res_pos[2:]
-        words = [raw[i:i+64] for i in range(0, len(raw), 64)]
-        
-        token0_addr = "0x" + words[2][-40:].lower()
-        token1_addr = "0x" + words[3][-40:].lower()
-        fee = int(words[4], 16)
-        tick_lower = self._signed_int24(words[5])
-        tick_upper = self._signed_int24(words[6])
-        liquidity = int(words[7], 16)
-        tokens_owed0 = int(words[10], 16)
-        tokens_owed1 = int(words[11], 16)
+    def _build_output(self, pos: Dict[str, Any], pool_address: Optional[str], res_slot0: Optional[str]) -> Dict[str, Any]:
+        token0_addr, token1_addr = pos["token0"], pos["token1"]
+        tick_lower, tick_upper = pos["tick_lower"], pos["tick_upper"]
+        liquidity = pos["liquidity"]
+        tokens_owed0, tokens_owed1 = pos["tokens_owed0"], pos["tokens_owed1"]
 
         t0_info = self.KNOWN_TOKENS.get(token0_addr, {"symbol": "Token0", "decimals": 18})
         t1_info = self.KNOWN_TOKENS.get(token1_addr, {"symbol": "Token1", "decimals": 18})
@@ -96,30 +97,20 @@ class UniswapV3Provider(BaseProvider):
         symbol0, dec0 = t0_info["symbol"], t0_info["decimals"]
         symbol1, dec1 = t1_info["symbol"], t1_info["decimals"]
 
-        # 2. Pool address & Current Tick
-        padded_t0 = token0_addr[2:].zfill(64)
-        padded_t1 = token1_addr[2:].zfill(64)
-        padded_fee = hex(fee)[2:].zfill(64)
-        data_pool = self.ABI_GET_POOL + padded_t0 + padded_t1 + padded_fee
-        res_pool = self._call_rpc(self.FACTORY_ADDRESS, data_pool)
-        
-        if res_pool and res_pool != "0x" and len(res_pool) > 42:
-            pool_address = "0x" + res_pool[-40:]
-            res_slot0 = self._call_rpc(pool_address, self.ABI_SLOT0)
-            if res_slot0 and len(res_slot0) > 130:
-                slot0_raw = res_slot0[2:]
-                sqrt_price_x96 = int(slot0_raw[:64], 16)
-                current_tick = self._signed_int24(slot0_raw[64:128])
-                sqrt_price = Decimal(sqrt_price_x96) / Decimal(2**96)
-            else:
-                current_tick = (tick_lower + tick_upper) // 2
-                sqrt_price = self._tick_to_sqrt_ratio(current_tick)
+        # Current tick from the pool's slot0, or the range midpoint if unavailable
+        price_source = "range_midpoint"
+        if res_slot0 and len(res_slot0) > 130:
+            slot0_raw = res_slot0[2:]
+            sqrt_price_x96 = int(slot0_raw[:64], 16)
+            current_tick = signed_int24(slot0_raw[64:128])
+            sqrt_price = Decimal(sqrt_price_x96) / Decimal(2**96)
+            price_source = "pool_slot0"
         else:
             current_tick = (tick_lower + tick_upper) // 2
-            sqrt_price = self._tick_to_sqrt_ratio(current_tick)
+            sqrt_price = tick_to_sqrt_ratio(current_tick)
 
         in_range = tick_lower <= current_tick < tick_upper
-        amount0_raw, amount1_raw = self._get_amounts(liquidity, sqrt_price, tick_lower, tick_upper, current_tick)
+        amount0_raw, amount1_raw = get_amounts(liquidity, sqrt_price, tick_lower, tick_upper, current_tick)
         amount0 = amount0_raw / (10 ** dec0)
         amount1 = amount1_raw / (10 ** dec1)
         
@@ -137,8 +128,11 @@ class UniswapV3Provider(BaseProvider):
 
         return {
             "nft_id": self.token_id,
-            "symbol0": symbol0, "symbol1": symbol1,
-            "liquidity": liquidity, "in_range": in_range,
+            "pool_address": pool_address, "price_source": price_source,
+            "token0": token0_addr, "token1": token1_addr,
+            "symbol0": symbol0, "symbol1": symbol1, "fee": pos["fee"],
+            "liquidity": liquidity, "tick_lower": tick_lower, "tick_upper": tick_upper,
+            "current_tick": current_tick, "in_range": in_range,
             "amount0": amount0, "amount1": amount1,
             "value_usd": value_usd, "fees_usd": fees_usd,
             "price_current": 1/price_t0_in_t1 if symbol0 == "USDC" else price_t0_in_t1,
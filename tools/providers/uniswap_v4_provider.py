@@ -0,0 +1,298 @@
+import json
+import os
+from decimal import Decimal
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+from tools import rpc, storage
+from tools.clmath import to_signed, get_amounts, tick_to_price, fee_growth_inside, uncollected_fees
+from tools.providers.base_provider import BaseProvider
+
+SCRIPT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_FILE = os.path.join(SCRIPT_DIR, ".cache", "v4_positions.json")
+
+ZERO_ADDRESS = "0x" + "0" * 40
+
+def keccak_hex(data: bytes) -> str:
+    from eth_utils import keccak  # web3 dependency; only needed when deriving ids/slots
+    return "0x" + keccak(data).hex()
+
+def _word(value: int) -> bytes:
+    return (value % 2**256).to_bytes(32, "big")
+
+def pool_key_id(pool_key: Dict[str, Any]) -> str:
+    """PoolId = keccak256(abi.encode(currency0, currency1, fee, tickSpacing, hooks))"""
+    encoded = b"".join([
+        _word(int(pool_key["currency0"], 16)), _word(int(pool_key["currency1"], 16)),
+        _word(pool_key["fee"]), _word(pool_key["tick_spacing"]), _word(int(pool_key["hooks"], 16)),
+    ])
+    return keccak_hex(encoded)
+
+class UniswapV4Provider(BaseProvider):
+    """
+    Provider for Uniswap V4 positions (PositionManager NFTs).
+    V4 pools live inside the singleton PoolManager, so pool state is read
+    StateView-style: raw storage slots through extsload(bytes32[]) in one call.
+
+    Round trips: getPoolAndPositionInfo once per NFT (cached on disk with the
+    PoolKey -> PoolId mapping), then a single batched read per refresh,
+    shared by every position passed to fetch_many.
+    """
+
+    POSITION_MANAGER_ADDRESS = "0x7c5f5a4bbd8fd63184577525326123b519429bdc"
+    POOL_MANAGER_ADDRESS = "0x498581fF718922c3f8e6A244956aF099B2652b2b"
+
+    KNOWN_TOKENS = {
+        ZERO_ADDRESS: {"symbol": "ETH", "decimals": 18},
+        "0x4200000000000000000000000000000000000006": {"symbol": "WETH", "decimals": 18},
+        "0x833589fcd6edb6e08f4c7c32d4f71b54bda02913": {"symbol": "USDC", "decimals": 6},
+        "0xcbb7c0000ab88b473b1f5afd9ef808440eed33bf": {"symbol": "cbBTC", "decimals": 8},
+    }
+
+    ABI_GET_POOL_AND_POSITION_INFO = "0x7ba03aad"
+    ABI_EXTSLOAD_MANY = "0xdbd035ff"
+    ABI_SYMBOL = "0x95d89b41"
+    ABI_DECIMALS = "0x313ce567"
+
+    # PoolManager storage layout (StateLibrary)
+    POOLS_SLOT = 6
+    FEE_GROWTH_GLOBAL0_OFFSET = 1
+    FEE_GROWTH_GLOBAL1_OFFSET = 2
+    LIQUIDITY_OFFSET = 3
+    TICKS_OFFSET = 4
+    POSITIONS_OFFSET = 6
+
+    def __init__(self, config: Dict[str, Any]):
+        super().__init__(config)
+        self.rpc_url = config.get("rpc_url", os.getenv("RPC_URL", "https://mainnet.base.org"))
+        self.token_id = int(self.nft_id)
+        self.cache_file = config.get("cache_file", CACHE_FILE)
+
+    # --- cache -------------------------------------------------------------
+
+    def _load_cache(self) -> Dict[str, Any]:
+        try:
+            with open(self.cache_file, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {"positions": {}, "pool_ids": {}, "tokens": {}}
+
+    def _save_cache(self, cache: Dict[str, Any]):
+        storage.write_json(self.cache_file, cache)
+
+    @staticmethod
+    def _pool_key_str(pool_key: Dict[str, Any]) -> str:
+        return f"{pool_key['currency0']}:{pool_key['currency1']}:{pool_key['fee']}:{pool_key['tick_spacing']}:{pool_key['hooks']}"
+
+    # --- decoding ----------------------------------------------------------
+
+    def _decode_pool_and_position_info(self, res: str) -> Optional[Dict[str, Any]]:
+        raw = res[2:]
+        words = [raw[i:i+64] for i in range(0, len(raw), 64)]
+        if len(words) < 6:
+            return None
+        info = int(words[5], 16)
+        pool_key = {
+            "currency0": "0x" + words[0][-40:].lower(),
+            "currency1": "0x" + words[1][-40:].lower(),
+            "fee": int(words[2], 16),
+            "tick_spacing": to_signed(int(words[3], 16), 24),
+            "hooks": "0x" + words[4][-40:].lower(),
+        }
+        if info == 0 and pool_key["currency1"] == ZERO_ADDRESS:
+            return None  # unminted / burned token
+        # PositionInfo: poolId(200) | tickUpper(24) | tickLower(24) | hasSubscriber(8)
+        return {
+            "pool_key": pool_key,
+            "tick_lower": to_signed(info >> 8, 24),
+            "tick_upper": to_signed(info >> 32, 24),
+        }
+
+    @staticmethod
+    def _decode_string(res: Optional[str]) -> Optional[str]:
+        if not res or len(res) < 66:
+            return None
+        raw = bytes.fromhex(res[2:])
+        try:
+            if len(raw) >= 96:
+                length = int.from_bytes(raw[32:64], "big")
+                return raw[64:64 + length].decode("utf-8")
+            return raw.rstrip(b"\x00").decode("utf-8")  # bytes32 symbols
+        except (UnicodeDecodeError, ValueError):
+            return None
+
+    # --- storage slots -----------------------------------------------------
+
+    def _state_slot(self, pool_id: str) -> int:
+        return int(keccak_hex(bytes.fromhex(pool_id[2:]) + _word(self.POOLS_SLOT)), 16)
+
+    def _tick_info_slot(self, state_slot: int, tick: int) -> int:
+        return int(keccak_hex(_word(tick) + _word(state_slot + self.TICKS_OFFSET)), 16)
+
+    def _position_slot(self, state_slot: int, tick_lower: int, tick_upper: int) -> int:
+        # Position.calculatePositionKey(owner=PositionManager, tickLower, tickUpper, salt=tokenId)
+        packed = (bytes.fromhex(self.POSITION_MANAGER_ADDRESS[2:])
+                  + (tick_lower % 2**24).to_bytes(3, "big")
+                  + (tick_upper % 2**24).to_bytes(3, "big")
+                  + _word(self.token_id))
+        position_key = keccak_hex(packed)
+        return int(keccak_hex(bytes.fromhex(position_key[2:]) + _word(state_slot + self.POSITIONS_OFFSET)), 16)
+
+    def _extsload_call(self, slots: List[int]) -> Tuple[str, str]:
+        data = self.ABI_EXTSLOAD_MANY + "20".zfill(64) + hex(len(slots))[2:].zfill(64)
+        data += "".join(hex(s % 2**256)[2:].zfill(64) for s in slots)
+        return self.POOL_MANAGER_ADDRESS, data
+
+    # --- provider API ------------------------------------------------------
+
+    def _store_static(self, res: Optional[str], cache: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if not res or res == "0x":
+            return None
+        static = self._decode_pool_and_position_info(res)
+        if not static:
+            return None
+        key_str = self._pool_key_str(static["pool_key"])
+        pool_id = cache["pool_ids"].get(key_str) or pool_key_id(static["pool_key"])
+        cache["pool_ids"][key_str] = pool_id
+        static["pool_id"] = pool_id
+        cache["positions"][str(self.token_id)] = static
+        return static
+
+    def _slots(self, static: Dict[str, Any]) -> List[int]:
+        tick_lower, tick_upper = static["tick_lower"], static["tick_upper"]
+        state_slot = self._state_slot(static["pool_id"])
+        lower_slot = self._tick_info_slot(state_slot, tick_lower)
+        upper_slot = self._tick_info_slot(state_slot, tick_upper)
+        position_slot = self._position_slot(state_slot, tick_lower, tick_upper)
+        return [
+            state_slot,
+            state_slot + self.FEE_GROWTH_GLOBAL0_OFFSET,
+            state_slot + self.FEE_GROWTH_GLOBAL1_OFFSET,
+            state_slot + self.LIQUIDITY_OFFSET,
+            lower_slot + 1, lower_slot + 2,
+            upper_slot + 1, upper_slot + 2,
+            position_slot, position_slot + 1, position_slot + 2,
+        ]
+
+    @classmethod
+    def fetch_many(cls, configs: List[Dict[str, Any]]) -> Dict[Any, Optional[Dict[str, Any]]]:
+        """
+        All positions in two batched round trips at most: getPoolAndPositionInfo for
+        NFTs not yet cached, then one batch of extsload reads (plus ERC20 metadata
+        for currencies seen for the first time).
+        """
+        providers = [cls(c) for c in configs]
+        if not providers:
+            return {}
+        rpc_url = providers[0].rpc_url
+        print(f"[uniswap_v4] Fetching {len(providers)} position(s)...")
+        cache = providers[0]._load_cache()
+        for section in ("positions", "pool_ids", "tokens"):
+            cache.setdefault(section, {})
+        dirty = False
+
+        missing = [p for p in providers if str(p.token_id) not in cache["positions"]]
+        if missing:
+            results = rpc.eth_call_batch(
+                [(cls.POSITION_MANAGER_ADDRESS, cls.ABI_GET_POOL_AND_POSITION_INFO + hex(p.token_id)[2:].zfill(64))
+                 for p in missing], rpc_url=rpc_url)
+            for p, res in zip(missing, results):
+                dirty |= p._store_static(res, cache) is not None
+
+        live = [p for p in providers if str(p.token_id) in cache["positions"]]
+        calls = [p._extsload_call(p._slots(cache["positions"][str(p.token_id)])) for p in live]
+        unknown = sorted({c for p in live for c in (cache["positions"][str(p.token_id)]["pool_key"]["currency0"],
+                                                     cache["positions"][str(p.token_id)]["pool_key"]["currency1"])
+                          if c not in cls.KNOWN_TOKENS and c not in cache["tokens"]})
+        for currency in unknown:
+            calls += [(currency, cls.ABI_SYMBOL), (currency, cls.ABI_DECIMALS)]
+        results = rpc.eth_call_batch(calls, rpc_url=rpc_url) if calls else []
+
+        for i, currency in enumerate(unknown):
+            symbol_res, decimals_res = results[len(live) + 2 * i], results[len(live) + 2 * i + 1]
+            cache["tokens"][currency] = {
+                "symbol": cls._decode_string(symbol_res) or currency[:8],
+                "decimals": int(decimals_res, 16) if decimals_res and decimals_res != "0x" else 18,
+            }
+            dirty = True
+        if dirty:
+            providers[0]._save_cache(cache)
+
+        output = {p.token_id: None for p in providers}
+        for p, res in zip(live, results):
+            output[p.token_id] = p._build_output(cache["positions"][str(p.token_id)], res, cache)
+        return output
+
+    def fetch_position_data(self) -> Optional[Dict[str, Any]]:
+        return self.fetch_many([self.config]).get(self.token_id)
+
+    def _build_output(self, static: Dict[str, Any], res: Optional[str], cache: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        pool_key = static["pool_key"]
+        tick_lower, tick_upper = static["tick_lower"], static["tick_upper"]
+        n_slots = 11
+        if not res or len(res) < 130 + 64 * n_slots:
+            print(f"[{self.exchange}] extsload failed for NFT #{self.token_id}")
+            return None
+        raw = res[2 + 128:]
+        values = [int(raw[i:i+64], 16) for i in range(0, 64 * n_slots, 64)]
+        (slot0, global0, global1, pool_liquidity,
+         lower_out0, lower_out1, upper_out0, upper_out1,
+         liquidity, inside0_last, inside1_last) = values
+
+        sqrt_price_x96 = slot0 & (2**160 - 1)
+        if sqrt_price_x96 == 0:
+            print(f"[{self.exchange}] Pool {static['pool_id']} not initialized")
+            return None
+        current_tick = to_signed(slot0 >> 160, 24)
+        liquidity &= 2**128 - 1
+
+        inside0 = fee_growth_inside(current_tick, tick_lower, tick_upper, global0, lower_out0, upper_out0)
+        inside1 = fee_growth_inside(current_tick, tick_lower, tick_upper, global1, lower_out1, upper_out1)
+        unclaimed_0 = uncollected_fees(liquidity, inside0, inside0_last)
+        unclaimed_1 = uncollected_fees(liquidity, inside1, inside1_last)
+
+        t0_info = self.KNOWN_TOKENS.get(pool_key["currency0"]) or cache["tokens"].get(pool_key["currency0"])
+        t1_info = self.KNOWN_TOKENS.get(pool_key["currency1"]) or cache["tokens"].get(pool_key["currency1"])
+        symbol0, dec0 = t0_info["symbol"], t0_info["decimals"]
+        symbol1, dec1 = t1_info["symbol"], t1_info["decimals"]
+
+        in_range = tick_lower <= current_tick < tick_upper
+        sqrt_price = Decimal(sqrt_price_x96) / Decimal(2**96)
+        amount0_raw, amount1_raw = get_amounts(liquidity, sqrt_price, tick_lower, tick_upper, current_tick)
+        amount0 = amount0_raw / (10 ** dec0)
+        amount1 = amount1_raw / (10 ** dec1)
+        fees0 = unclaimed_0 / (10 ** dec0)
+        fees1 = unclaimed_1 / (10 ** dec1)
+
+        usd0, usd1, token0_is_quote = self.usd_prices(symbol0, symbol1, tick_to_price(current_tick, dec0, dec1))
+
+        # Price of the volatile side in the stable side (same convention as the V3 fetcher)
+        def quote_price(tick):
+            p = tick_to_price(tick, dec0, dec1)
+            return (1 / p if p else 0) if token0_is_quote else p
+
+        price_current = quote_price(current_tick)
+
+        return {
+            "nft_id": self.token_id,
+            "pool_id": static["pool_id"], "pool_key": pool_key,
+            "pool_address": None, "price_source": "pool_slot0",
+            "token0": pool_key["currency0"], "token1": pool_key["currency1"],
+            "symbol0": symbol0, "symbol1": symbol1,
+            "fee": pool_key["fee"], "tick_spacing": pool_key["tick_spacing"], "hooks": pool_key["hooks"],
+            "liquidity": liquidity, "pool_liquidity": pool_liquidity & (2**128 - 1),
+            "tick_lower": tick_lower, "tick_upper": tick_upper,
+            "current_tick": current_tick, "in_range": in_range,
+            "amount0": amount0, "amount1": amount1,
+            "price_cbbtc": usd1 if token0_is_quote else usd0,
+            "value_usd": amount0 * usd0 + amount1 * usd1,
+            "fees_usd": fees0 * usd0 + fees1 * usd1,
+            "unclaimed_0": unclaimed_0, "unclaimed_1": unclaimed_1,
+            "price_lower": quote_price(tick_lower),
+            "price_upper": quote_price(tick_upper),
+            "price_current": price_current,
+            "network": self.network, "exchange": self.exchange,
+            "last_updated": datetime.now().isoformat()
+        }
+
+    def fetch_fees_data(self) -> Optional[Dict[str, Any]]:
+        return {"status": "pending_migration"}
@@ -0,0 +1,351 @@
+import argparse
+import datetime
+import json
+import math
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(SCRIPT_DIR))
+from tools import portfolio, price_analytics, state_db, storage, tracing
+from tools.metrics import STABLECOINS, TOKEN_DECIMALS, compute_metrics
+
+# Forward-looking range risk: Monte Carlo price paths of each pool's volatile
+# token (e.g. cbBTC in USD) over a horizon, against the position's range.
+#
+#   gbm         log-normal paths with the realized volatility
+#   bootstrap   observed log returns, standardized by their time step and resampled
+#               (keeps fat tails); both models are driftless (price is a martingale)
+#
+# Returns come from the pool itself when its swap index has enough of them
+# (price_analytics bars), else from the stored history's snapshot prices.
+#
+# Per pool, over all paths:
+#
+#   exit            P(price is outside [price_a, price_b) at some step), and the median time to it
+#   time in range   expected fraction of the horizon spent in range
+#   fee yield       observed fee yield per in-range day x days in range, as % of value
+#   IL              range position vs holding its current amounts at the horizon price
+#   net             position value change + fees, as % of value
+#
+# Pools trading the same token share one set of paths. Paths are simulated in
+# chunks of CHUNK_PATHS (bounded memory); with workers > 1 the chunks run in a
+# process pool. Seeds are spawned per chunk, so results do not depend on the
+# number of workers. Results are cached in .cache/range_risk.json and refreshed
+# after each sync.
+#
+#   python tools/range_risk.py [--paths 100000] [--horizon-days 30] [--model gbm|bootstrap] [--workers 4]
+
+CACHE_FILE = os.getenv("RANGE_RISK_CACHE", os.path.join(SCRIPT_DIR, ".cache", "range_risk.json"))
+CACHE_VERSION = 1
+PATHS = int(os.getenv("RANGE_RISK_PATHS", "100000"))
+HORIZON_DAYS = float(os.getenv("RANGE_RISK_HORIZON_DAYS", "30"))
+STEP_HOURS = float(os.getenv("RANGE_RISK_STEP_HOURS", "4"))
+MODEL = os.getenv("RANGE_RISK_MODEL", "bootstrap")
+WORKERS = int(os.getenv("RANGE_RISK_WORKERS", "1"))
+DEFAULT_VOL = float(os.getenv("RANGE_RISK_DEFAULT_VOL", "0.6"))  # annualized, when the history is too short
+CHUNK_PATHS = 10_000
+MAX_HORIZON_DAYS = 365
+MAX_STEPS = 2190  # a year of 4 h steps: ~90 MB per float32 array of a chunk
+MIN_RETURNS = 48  # history returns needed to estimate (or bootstrap) volatility
+MIN_INTERVAL = 600  # seconds between the history prices used for returns
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+YEAR_SECONDS = 365 * 86400
+
+# --- inputs ----------------------------------------------------------------------------
+
+def _volatile_index(symbols) -> Optional[int]:
+    """Index of the volatile token of a stablecoin pair, None otherwise."""
+    stable = [s in STABLECOINS for s in symbols]
+    if stable == [True, False]:
+        return 1
+    if stable == [False, True]:
+        return 0
+    return None
+
+def _range_prices(pos: Dict[str, Any], volatile: int):
+    """The range as (price_a, price_b) in USD per volatile token; ticks first, stored bounds otherwise."""
+    if pos.get("tick_lower") is not None and pos.get("tick_upper") is not None:
+        d0 = TOKEN_DECIMALS.get(pos.get("symbol0"), 18)
+        d1 = TOKEN_DECIMALS.get(pos.get("symbol1"), 18)
+        bounds = [1.0001 ** pos[k] * 10 ** (d0 - d1) for k in ("tick_lower", "tick_upper")]
+        if volatile == 1:
+            bounds = [1 / b for b in bounds]
+    else:
+        bounds = [pos.get("price_lower") or 0, pos.get("price_upper") or 0]
+    return min(bounds), max(bounds)
+
+def standardized_returns(columns: Dict[str, Any], volatile: int):
+    """Log returns between consecutive snapshots divided by sqrt(years elapsed): shocks with unit time."""
+    import numpy as np
+
+    t = np.asarray(columns["t"], dtype=float)
+    price = np.asarray(columns["usd0" if volatile == 0 else "usd1"], dtype=float)
+    order = np.argsort(t, kind="stable")
+    t, price = t[order], price[order]
+    ok = price > 0
+    t, price = t[ok], price[ok]
+    # Snapshots closer than MIN_INTERVAL to the previous kept one (re-runs, manual syncs) are dropped:
+    # tiny steps would turn price-feed noise into huge standardized shocks
+    keep, last = [], None
+    for i, ti in enumerate(t):
+        if last is None or ti - last >= MIN_INTERVAL:
+            keep.append(i)
+            last = ti
+    t, price = t[keep], price[keep]
+    return np.diff(np.log(price)) / np.sqrt(np.diff(t) / YEAR_SECONDS)
+
+def _fee_yield_per_day(m: Dict[str, Any], columns: Dict[str, Any]) -> float:
+    """Fee income per in-range day as a fraction of value: the observed daily fees, scaled up by time out of range."""
+    if not m.get("value_usd"):
+        return 0.0
+    flags = [bool(f) for f in columns["in_range"] if f is not None]
+    share = sum(flags) / len(flags) if flags else 1.0
+    return m["daily_fee"] / m["value_usd"] / max(share, 0.05)
+
+def prepare(conn, pools: List[Dict[str, Any]], columns: Dict[int, Any]) -> List[Dict[str, Any]]:
+    """Simulation inputs of each pool with a stablecoin pair and a known range; others are skipped."""
+    prepared, pool_returns = [], {}
+    for entry in pools:
+        nft_id = entry["nft_id"]
+        data = state_db.load_pool_data(conn, nft_id, with_history=False)
+        pos = data.get("pos") or {}
+        symbols = (pos.get("symbol0"), pos.get("symbol1"))
+        volatile = _volatile_index(symbols)
+        if volatile is None:
+            continue
+        price = pos.get("price_current") or pos.get("price_cbbtc") or 0
+        price_a, price_b = _range_prices(pos, volatile)
+        if not (price > 0 and 0 < price_a < price_b):
+            continue
+        m = compute_metrics(entry, data).to_dict()
+        returns, source = standardized_returns(columns[nft_id], volatile), "history"
+        address = (pos.get("pool_address") or "").lower()
+        if address:
+            if address not in pool_returns:
+                pool_returns[address] = price_analytics.standardized_returns(conn, address, pos)
+            if len(pool_returns[address]) >= MIN_RETURNS:
+                returns, source = pool_returns[address], "pool swaps"
+        prepared.append({
+            "nft_id": nft_id, "label": entry.get("label", f"Pool #{nft_id}"), "symbol": symbols[volatile],
+            "price": float(price), "price_a": float(price_a), "price_b": float(price_b),
+            "value_usd": m["value_usd"], "fee_yield_per_day": _fee_yield_per_day(m, columns[nft_id]),
+            "returns": returns, "returns_source": source,
+        })
+    return prepared
+
+# --- simulation ------------------------------------------------------------------------
+
+def _il(ratio, a: float, b: float):
+    """Range position value vs holding its current amounts, for price ratios (new/now) and bounds a < b (ratios)."""
+    import numpy as np
+
+    def amounts(r):
+        s = np.sqrt(np.clip(r, a, b))
+        return 1 / s - 1 / math.sqrt(b), s - math.sqrt(a)  # volatile, stable per unit of liquidity
+
+    x0, y0 = amounts(1.0)
+    x, y = amounts(ratio)
+    position, hold = x * ratio + y, x0 * ratio + y0
+    return position / hold - 1, position / (x0 + y0) - 1
+
+def simulate_chunk(task) -> List[Dict[str, Any]]:
+    """
+    One chunk of paths for one token: (seed, paths, steps, step_years, sigma,
+    shocks or None, [(lo, hi, fee_per_step)]) with bounds as log price ratios.
+    Returns per-path arrays for each range. Module-level so process pools can pickle it.
+    """
+    import numpy as np
+
+    seed, n, steps, step_years, sigma, shocks, ranges = task
+    rng = np.random.default_rng(seed)
+    # float32 paths: half the memory traffic, ample precision for 1e-4-scale log steps
+    if shocks is not None:
+        z = rng.choice(shocks.astype(np.float32), size=(n, steps)) * np.float32(math.sqrt(step_years))
+    else:
+        z = rng.standard_normal((n, steps), dtype=np.float32) * np.float32(sigma * math.sqrt(step_years))
+    z -= np.float32(0.5 * sigma * sigma * step_years)  # martingale price
+    x = np.cumsum(z, axis=1)
+    end = np.exp(x[:, -1].astype(float))
+
+    rows = np.arange(n)
+    results = []
+    for lo, hi, fee_per_step in ranges:
+        outside = (x < lo) | (x >= hi)
+        steps_in = steps - np.count_nonzero(outside, axis=1)
+        # Step of the first exit (1-based); paths that never leave get steps + 1
+        first = outside.argmax(axis=1)
+        first_exit = np.where(outside[rows, first], first + 1, steps + 1)
+        il, change = _il(end, math.exp(lo), math.exp(hi))
+        fees = steps_in * fee_per_step
+        results.append({"steps_in": steps_in.astype(np.int32), "first_exit": first_exit.astype(np.int32),
+                        "fees": fees.astype(np.float32), "il": il.astype(np.float32),
+                        "net": (change + fees).astype(np.float32)})
+    return results
+
+def _quantiles(values, scale: float = 100.0) -> Dict[str, float]:
+    import numpy as np
+
+    return {f"p{int(q * 100)}": float(v) * scale for q, v in zip(QUANTILES, np.quantile(values, QUANTILES))}
+
+def summarize(pool: Dict[str, Any], parts: List[Dict[str, Any]], steps: int, step_hours: float) -> Dict[str, Any]:
+    import numpy as np
+
+    cols = {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+    exit_steps = cols["first_exit"]
+    exited = exit_steps <= steps
+    exit_probability = float(exited.mean())
+    # Median time to exit exists when at least half of the paths leave the range
+    median_exit = float(np.quantile(exit_steps, 0.5)) * step_hours / 24 if exit_probability >= 0.5 else None
+    return {
+        "nft_id": pool["nft_id"], "label": pool["label"], "symbol": pool["symbol"],
+        "price": pool["price"], "price_a": pool["price_a"], "price_b": pool["price_b"],
+        "in_range_now": pool["price_a"] <= pool["price"] < pool["price_b"],
+        "fee_yield_per_day": pool["fee_yield_per_day"] * 100,
+        "exit_probability": exit_probability * 100,
+        "median_days_to_exit": median_exit,
+        "time_in_range": float(cols["steps_in"].mean()) / steps * 100,
+        "days_in_range": float(cols["steps_in"].mean()) * step_hours / 24,
+        "fee_yield": _quantiles(cols["fees"]), "il": _quantiles(cols["il"]), "net": _quantiles(cols["net"]),
+    }
+
+def run(pools: List[Dict[str, Any]], paths: int = PATHS, horizon_days: float = HORIZON_DAYS,
+        step_hours: float = STEP_HOURS, model: str = MODEL, workers: int = WORKERS, seed: int = 0) -> List[Dict[str, Any]]:
+    """Simulate prepared pools; pools of the same token are evaluated on the same paths."""
+    import numpy as np
+
+    steps = max(int(round(horizon_days * 24 / step_hours)), 1)
+    step_years = step_hours * 3600 / YEAR_SECONDS
+    by_symbol: Dict[str, List[Dict[str, Any]]] = {}
+    for pool in pools:
+        by_symbol.setdefault(pool["symbol"], []).append(pool)
+
+    tasks, owners = [], []
+    for symbol, group in sorted(by_symbol.items()):
+        # The longest history of the token drives its volatility
+        returns = max((p["returns"] for p in group), key=len)
+        if len(returns) >= MIN_RETURNS:
+            shocks = returns - returns.mean()
+            sigma = float(shocks.std())
+        else:
+            shocks, sigma = None, DEFAULT_VOL
+        for p in group:
+            p["sigma"], p["model"] = sigma, model if shocks is not None else "gbm"
+        ranges = [(math.log(p["price_a"] / p["price"]), math.log(p["price_b"] / p["price"]),
+                   p["fee_yield_per_day"] * step_hours / 24) for p in group]
+        # Seeded per token: a pool gets the same paths whichever other pools run with it
+        root = np.random.SeedSequence([seed, *symbol.encode()])
+        chunk_seeds = root.spawn(math.ceil(paths / CHUNK_PATHS))
+        for i, chunk_seed in enumerate(chunk_seeds):
+            n = min(CHUNK_PATHS, paths - i * CHUNK_PATHS)
+            tasks.append((chunk_seed, n, steps, step_years, sigma, shocks if model == "bootstrap" else None, ranges))
+            owners.append(group)
+
+    if workers > 1 and len(tasks) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            outputs = list(executor.map(simulate_chunk, tasks))
+    else:
+        outputs = [simulate_chunk(task) for task in tasks]
+
+    parts: Dict[int, List[Dict[str, Any]]] = {}
+    for group, output in zip(owners, outputs):
+        for pool, result in zip(group, output):
+            parts.setdefault(pool["nft_id"], []).append(result)
+    results = []
+    for pool in pools:
+        summary = summarize(pool, parts[pool["nft_id"]], steps, step_hours)
+        summary.update(model=pool["model"], volatility=pool["sigma"] * 100,
+                       volatility_source=pool["returns_source"] if len(pool["returns"]) >= MIN_RETURNS else "default",
+                       paths=paths,
+                       horizon_days=horizon_days, step_hours=step_hours)
+        results.append(summary)
+    return results
+
+# --- entry points ----------------------------------------------------------------------
+
+def _input_key(pool: Dict[str, Any], params) -> str:
+    # The fee yield drifts with the position's age every minute; 3 significant digits is what moves the results
+    fee_yield = float(f"{pool['fee_yield_per_day']:.3g}")
+    return json.dumps([pool["price"], pool["price_a"], pool["price_b"], fee_yield, len(pool["returns"]), params])
+
+def refresh(conn=None, pools: Optional[List[Dict[str, Any]]] = None, paths: int = PATHS,
+            horizon_days: float = HORIZON_DAYS, step_hours: float = STEP_HOURS, model: str = MODEL,
+            workers: int = WORKERS, cache_file: Optional[str] = CACHE_FILE) -> Dict[str, Dict[str, Any]]:
+    """Risk of every registry pool (default: all open ones), recomputing only pools whose inputs changed."""
+    conn = conn or state_db.connect()
+    pools = pools if pools is not None else state_db.list_pools(conn, include_closed=False)
+    cache = (storage.read_json(cache_file, {}) if cache_file else {}) or {}
+    if cache.get("version") != CACHE_VERSION:
+        cache = {"version": CACHE_VERSION, "pools": {}}
+
+    # Every open pool of a token contributes its price history, so a token's volatility does not depend
+    # on which pools are requested; the columns come from the portfolio engine's incremental cache
+    universe = {p["nft_id"]: p for p in state_db.list_pools(conn, include_closed=False)}
+    universe.update({p["nft_id"]: p for p in pools})
+    everything = prepare(conn, list(universe.values()), portfolio.load_columns(conn, list(universe)))
+    # Per token: returns from a pool's swaps beat snapshot history, then the longest series wins
+    token_returns: Dict[str, Any] = {}
+    for p in everything:
+        rank = (p["returns_source"] == "pool swaps", len(p["returns"]))
+        best = token_returns.get(p["symbol"])
+        if best is None or rank > (best["returns_source"] == "pool swaps", len(best["returns"])):
+            token_returns[p["symbol"]] = p
+    requested = {p["nft_id"] for p in pools}
+    prepared = [{**p, "returns": token_returns[p["symbol"]]["returns"],
+                 "returns_source": token_returns[p["symbol"]]["returns_source"]}
+                for p in everything if p["nft_id"] in requested]
+    params = [paths, horizon_days, step_hours, model]
+    stale = [p for p in prepared if (cache["pools"].get(str(p["nft_id"])) or {}).get("key") != _input_key(p, params)]
+
+    if stale:
+        start = time.perf_counter()
+        with tracing.span("range_risk.run", pools=len(stale), paths=paths):
+            results = run(stale, paths, horizon_days, step_hours, model, workers)
+        elapsed = time.perf_counter() - start
+        computed_at = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        for pool, result in zip(stale, results):
+            result.update(seconds=elapsed, computed_at=computed_at)
+            cache["pools"][str(pool["nft_id"])] = {"key": _input_key(pool, params), "result": result}
+        if cache_file:
+            storage.write_json(cache_file, cache, indent=None)
+    return {str(p["nft_id"]): cache["pools"][str(p["nft_id"])]["result"] for p in prepared}
+
+def cached(cache_file: str = CACHE_FILE) -> Dict[str, Dict[str, Any]]:
+    """Last computed risk per pool (nft_id as string), without simulating."""
+    cache = storage.read_json(cache_file, {}) or {}
+    if cache.get("version") != CACHE_VERSION:
+        return {}
+    return {key: entry["result"] for key, entry in cache.get("pools", {}).items()}
+
+def main():
+    parser = argparse.ArgumentParser(description="Monte Carlo range risk of the open positions")
+    parser.add_argument("--paths", type=int, default=PATHS)
+    parser.add_argument("--horizon-days", type=float, default=HORIZON_DAYS)
+    parser.add_argument("--step-hours", type=float, default=STEP_HOURS)
+    parser.add_argument("--model", choices=("gbm", "bootstrap"), default=MODEL)
+    parser.add_argument("--workers", type=int, default=WORKERS, help="processes (chunks of %d paths each)" % CHUNK_PATHS)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = refresh(paths=args.paths, horizon_days=args.horizon_days, step_hours=args.step_hours,
+                      model=args.model, workers=args.workers)
+    if not results:
+        print("No open positions with a stablecoin pair and a known range.")
+        return
+    print(f"{len(results)} pools, {args.paths:,} paths, {args.horizon_days:g} days in {args.step_hours:g}h steps "
+          f"({time.perf_counter() - start:.2f}s)\n")
+    for r in results.values():
+        exit_days = f"{r['median_days_to_exit']:.1f}d" if r["median_days_to_exit"] is not None else "-"
+        print(f"{r['label'][:31]:<32}{r['symbol']} ${r['price']:,.0f} in [{r['price_a']:,.0f}, {r['price_b']:,.0f})"
+              f" | vol {r['volatility']:.0f}% ({r['model']}, {r['volatility_source']})")
+        print(f"  exit {r['exit_probability']:.1f}% (median {exit_days}) | in range {r['time_in_range']:.1f}%"
+              f" | fees p5/p50/p95 {r['fee_yield']['p5']:.2f}/{r['fee_yield']['p50']:.2f}/{r['fee_yield']['p95']:.2f}%"
+              f" | IL p5/p50 {r['il']['p5']:.2f}/{r['il']['p50']:.2f}% | net p5/p50/p95"
+              f" {r['net']['p5']:+.2f}/{r['net']['p50']:+.2f}/{r['net']['p95']:+.2f}%")
+
+if __name__ == "__main__":
+    main()
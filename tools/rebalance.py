@@ -0,0 +1,240 @@
+import math
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional, Sequence
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tools import liquidity, price_analytics, state_db, swap_index
+from tools.metrics import position_decimals, price_to_tick, tick_to_price, token_usd
+
+# What-if engine for moving a live V3 position to a new range [a, b] now:
+#
+#   amounts      what the position's current value buys in the new range at the current price
+#   swap         the trade that gets there, priced against the pool's tick table (fee + price impact)
+#   fees/day     every indexed swap of the window that traded inside the new range paid
+#                fee x our share of the liquidity active at that swap (others' liquidity = the
+#                swap's liquidity minus ours if the old range covered it), averaged per day
+#   breakeven    days of that fee income to pay back the swap cost and gas; payback also
+#                compares against the fees the current range earned over the same swaps
+#
+# Everything is vectorized over candidate ranges. The tick table and the swap
+# arrays are loaded once per pool and kept for MARKET_TTL seconds, so a
+# dashboard slider only pays for the arithmetic. Swaps are indexed by the sync
+# (or tools/swap_index.py), never on a request.
+#
+#   python tools/rebalance.py <nft_id> <price_a> <price_b>
+
+GAS_USD = float(os.getenv("REBALANCE_GAS_USD", "0.15"))  # remove + swap + mint on Base
+MARKET_TTL = int(os.getenv("REBALANCE_MARKET_TTL", "300"))
+MAX_CANDIDATES = 256
+SWAP_SOLVER_ROUNDS = 4
+
+_markets: Dict[str, "Market"] = {}
+_pool_locks: Dict[str, threading.Lock] = {}
+_lock = threading.Lock()
+
+class Market:
+    """A pool's tick table plus its indexed swaps, sorted by tick with their fees in raw token units."""
+
+    def __init__(self, table: "liquidity.TickTable", swaps: Dict[str, Any]):
+        import numpy as np
+
+        self.table = table
+        self.loaded_at = time.time()
+        order = np.argsort(swaps["tick"], kind="stable")
+        self.tick = swaps["tick"][order]
+        self.swap_liquidity = swaps["liquidity"][order]
+        # Swap amounts are pool deltas: the positive one is the input, which pays the fee
+        rate = table.fee / 1e6
+        self.fee0 = np.maximum(swaps["amount0"][order], 0) * rate
+        self.fee1 = np.maximum(swaps["amount1"][order], 0) * rate
+        times = swaps["timestamp"]
+        self.window_days = float(times.max() - times.min()) / 86400 if len(times) > 1 else 0.0
+
+def market(pool: str, conn=None, refresh: bool = False) -> Optional[Market]:
+    """
+    The pool's Market, rebuilt from the swaps indexed so far (the sync keeps the index
+    current) and a reloaded tick table once MARKET_TTL has passed. One rebuild per pool at a time.
+    """
+    pool = pool.lower()
+    with _lock:
+        pool_lock = _pool_locks.setdefault(pool, threading.Lock())
+    with pool_lock:
+        cached = _markets.get(pool)
+        if cached and not refresh and time.time() - cached.loaded_at < MARKET_TTL:
+            return cached
+        conn = conn or state_db.connect()
+        table = liquidity.load(pool, ttl=0 if refresh else MARKET_TTL)
+        if table is None:
+            return cached
+        built = Market(table, swap_index.load(conn, pool, since=time.time() - swap_index.WINDOW_DAYS * 86400))
+        _markets[pool] = built
+    return built
+
+def snap_range(tick_a, tick_b, spacing: int):
+    """(lower, upper) ticks on the spacing grid, widened outwards; at least one spacing apart."""
+    import numpy as np
+
+    lo, hi = np.minimum(tick_a, tick_b), np.maximum(tick_a, tick_b)
+    lower = np.floor(lo / spacing).astype(np.int64) * spacing
+    upper = np.ceil(hi / spacing).astype(np.int64) * spacing
+    return lower, np.maximum(upper, lower + spacing)
+
+# --- simulation ------------------------------------------------------------------------
+
+def _unit_amounts(s, sa, sb):
+    """Raw token amounts per unit of liquidity for ranges [sa, sb] at sqrt price s."""
+    import numpy as np
+
+    below, above = s <= sa, s >= sb
+    u0 = np.where(below, 1 / sa - 1 / sb, np.where(above, 0.0, 1 / s - 1 / sb))
+    u1 = np.where(below, 0.0, np.where(above, sb - sa, s - sa))
+    return u0, u1
+
+def _fees_per_swap(m: Market, w0: float, w1: float, liquidity_new, own_liquidity: float, old_range, lower, upper):
+    """(fee USD earned over the window, fee USD paid inside the range) per candidate."""
+    import numpy as np
+
+    fee_usd = m.fee0 * w0 + m.fee1 * w1
+    in_old = (m.tick >= old_range[0]) & (m.tick < old_range[1])
+    others = np.maximum(m.swap_liquidity - own_liquidity * in_old, 0.0)
+    # Swaps are sorted by tick, so each range is one contiguous slice
+    starts, ends = np.searchsorted(m.tick, lower), np.searchsorted(m.tick, upper)
+    earned, paid = np.zeros(len(lower)), np.zeros(len(lower))
+    for i, (a, b) in enumerate(zip(starts, ends)):
+        share = liquidity_new[i] / (others[a:b] + liquidity_new[i])
+        earned[i] = np.dot(share, fee_usd[a:b])
+        paid[i] = fee_usd[a:b].sum()
+    return earned, paid
+
+def simulate(position: Dict[str, Any], m: Market, tick_lower, tick_upper) -> Dict[str, Any]:
+    """
+    Rebalance `position` (state_db position: liquidity, tick_lower/upper, symbols)
+    into each [tick_lower[i], tick_upper[i]) (snapped outward to the tick spacing).
+    Returns column arrays per candidate plus the current position's own numbers.
+    """
+    import numpy as np
+
+    t = m.table
+    lower, upper = snap_range(np.atleast_1d(tick_lower), np.atleast_1d(tick_upper), t.tick_spacing)
+    d0, d1 = position_decimals(position)
+    price = float(tick_to_price(t.current_tick, position))
+    w0 = token_usd(position.get("symbol0"), price) / 10 ** d0  # USD per raw unit
+    w1 = token_usd(position.get("symbol1"), price) / 10 ** d1
+
+    # Current holdings, revalued at the table's price
+    own_liquidity = float(position.get("liquidity") or 0)
+    old = (position.get("tick_lower"), position.get("tick_upper"))
+    s = t.sqrt_price
+    h0, h1 = (float(v) * own_liquidity for v in _unit_amounts(s, 1.0001 ** (old[0] / 2), 1.0001 ** (old[1] / 2)))
+    value = h0 * w0 + h1 * w1
+
+    sa, sb = 1.0001 ** (lower / 2), 1.0001 ** (upper / 2)
+    u0, u1 = _unit_amounts(s, sa, sb)
+    unit_value = u0 * w0 + u1 * w1
+    cost = np.zeros(len(lower))
+    for _ in range(SWAP_SOLVER_ROUNDS):
+        # The swap cost lowers the value to deploy, which changes the swap: a few rounds converge
+        L = (value - cost) / unit_value
+        sell0, sell1 = np.maximum(h0 - L * u0, 0.0), np.maximum(h1 - L * u1, 0.0)
+        out1, out0 = t.swap(sell0, zero_for_one=True), t.swap(sell1, zero_for_one=False)
+        cost = (sell0 * w0 - out1 * w1) + (sell1 * w1 - out0 * w0)
+    gross = sell0 * w0 + sell1 * w1
+    fee_cost = gross * t.fee / 1e6
+
+    days = m.window_days
+    earned, paid = _fees_per_swap(m, w0, w1, L, own_liquidity, old, lower, upper)
+    own_earned, _ = _fees_per_swap(m, w0, w1, np.array([own_liquidity]), own_liquidity, old,
+                                   np.array([old[0]]), np.array([old[1]]))
+    fees_per_day = earned / days if days else np.full(len(lower), np.nan)
+    current_per_day = own_earned[0] / days if days else float("nan")
+    total_paid = (m.fee0 * w0 + m.fee1 * w1).sum()
+
+    others_now = t.active_liquidity - own_liquidity * (old[0] <= t.current_tick < old[1])
+    total_cost = cost + GAS_USD
+    gain = fees_per_day - current_per_day
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return {
+            "price": price, "value_usd": value, "gas_usd": GAS_USD, "window_days": days, "swaps": len(m.tick),
+            "current": {"tick_lower": old[0], "tick_upper": old[1], "amount0": h0 / 10 ** d0, "amount1": h1 / 10 ** d1,
+                        "in_range": bool(old[0] <= t.current_tick < old[1]), "fees_per_day": current_per_day},
+            "tick_lower": lower, "tick_upper": upper,
+            "price_a": np.minimum(tick_to_price(lower, position), tick_to_price(upper, position)),
+            "price_b": np.maximum(tick_to_price(lower, position), tick_to_price(upper, position)),
+            "liquidity": L, "amount0": L * u0 / 10 ** d0, "amount1": L * u1 / 10 ** d1,
+            "sell_token0": sell0 > 0, "amount_in": np.where(sell0 > 0, sell0 / 10 ** d0, sell1 / 10 ** d1),
+            "amount_out": np.where(sell0 > 0, out1 / 10 ** d1, out0 / 10 ** d0),
+            "swap_usd": gross, "fee_usd": fee_cost, "impact_usd": cost - fee_cost, "cost_usd": total_cost,
+            "spot_share": L / (max(others_now, 0.0) + L),
+            "fee_share": np.where(paid > 0, earned / paid, np.nan),
+            "volume_in_range": paid / total_paid if total_paid else np.full(len(lower), np.nan),
+            "fees_per_day": fees_per_day,
+            "breakeven_days": total_cost / fees_per_day,
+            "payback_days": np.where(gain > 0, total_cost / gain, np.nan),
+        }
+
+def _json_value(value):
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+def to_rows(result: Dict[str, Any]) -> Dict[str, Any]:
+    """simulate() output as JSON-ready data: one dict per candidate, NaN/inf as null."""
+    columns = {k: v for k, v in result.items() if hasattr(v, "tolist")}
+    rows = [{k: _json_value(v) for k, v in zip(columns, values)} for values in zip(*(c.tolist() for c in columns.values()))]
+    scalars = {k: _json_value(v) if not isinstance(v, dict) else {kk: _json_value(vv) for kk, vv in v.items()}
+               for k, v in result.items() if k not in columns}
+    return {**scalars, "candidates": rows}
+
+def simulate_position(nft_id: int, price_a: Optional[Sequence[float]] = None, price_b: Optional[Sequence[float]] = None,
+                      tick_a: Optional[Sequence[int]] = None, tick_b: Optional[Sequence[int]] = None,
+                      conn=None) -> Dict[str, Any]:
+    """What-if for a stored V3 position over candidate ranges given as prices (USD per volatile token) or ticks."""
+    conn = conn or state_db.connect()
+    position = state_db.get_position(conn, nft_id)
+    if not position or not position.get("pool_address") or position.get("tick_lower") is None:
+        raise ValueError(f"no V3 position data with ticks for pool {nft_id}")
+    if tick_a is None or tick_b is None:
+        if price_a is None or price_b is None:
+            raise ValueError("give a range as prices (lower, upper) or ticks (tick_lower, tick_upper)")
+        tick_a, tick_b = price_to_tick(price_a, position), price_to_tick(price_b, position)
+    if len(tick_a) != len(tick_b) or not 0 < len(tick_a) <= MAX_CANDIDATES:
+        raise ValueError(f"need 1-{MAX_CANDIDATES} ranges with matching lower/upper bounds")
+    m = market(position["pool_address"], conn)
+    if m is None:
+        raise ValueError(f"tick table for {position['pool_address']} unavailable")
+    return {"nft_id": nft_id, "pool": m.table.pool, "symbol0": position.get("symbol0"), "symbol1": position.get("symbol1"),
+            "analytics": price_analytics.get(m.table.pool, conn, position=position),
+            **to_rows(simulate(position, m, tick_a, tick_b))}
+
+def main():
+    if len(sys.argv) < 4:
+        print("Usage: python tools/rebalance.py <nft_id> <price_a> <price_b>")
+        return
+    result = simulate_position(int(sys.argv[1]), [float(sys.argv[2])], [float(sys.argv[3])])
+    c, cur = result["candidates"][0], result["current"]
+    sold, bought = (result["symbol0"], result["symbol1"]) if c["sell_token0"] else (result["symbol1"], result["symbol0"])
+
+    def fmt(value, spec=",.2f"):
+        return "n/a" if value is None else format(value, spec)
+
+    print(f"Position value ${result['value_usd']:,.2f} at {result['price']:,.2f} "
+          f"({result['swaps']} swaps over {result['window_days']:.1f} days)")
+    a = result["analytics"] or {}
+    if a.get("twap") or a.get("realized_vol"):
+        print("Pool prices    " + " | ".join([f"TWAP {k} ${v['price']:,.2f}" for k, v in a["twap"].items()]
+                                            + [f"vol {k} {v:.0f}%" for k, v in a["realized_vol"].items()]))
+    print(f"Current range  fees/day ${fmt(cur['fees_per_day'])}")
+    print(f"New range      {c['price_a']:,.2f} - {c['price_b']:,.2f} (ticks {c['tick_lower']}..{c['tick_upper']})")
+    print(f"  amounts      {c['amount0']:.6f} {result['symbol0']} + {c['amount1']:.8f} {result['symbol1']}")
+    print(f"  swap         {fmt(c['amount_in'], '.8f')} {sold} -> {fmt(c['amount_out'], '.8f')} {bought}"
+          f" (fee ${fmt(c['fee_usd'], ',.4f')}, impact ${fmt(c['impact_usd'], ',.4f')}, gas ${result['gas_usd']:.2f})")
+    print(f"  share        {fmt(c['spot_share'] and c['spot_share'] * 100)}% of active liquidity now, "
+          f"{fmt(c['fee_share'] and c['fee_share'] * 100)}% of in-range fees")
+    print(f"  fees/day     ${fmt(c['fees_per_day'])} | breakeven {fmt(c['breakeven_days'], '.1f')} days"
+          f" | payback vs current {fmt(c['payback_days'], '.1f')} days")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import os
+import time
+from typing import Any, List, Optional, Sequence, Tuple, Union
+from urllib.parse import urlparse
+
+from tools import instrumentation, tracing
+
+# Minimal JSON-RPC client shared by the fetchers and providers.
+# Plain requests + hex payloads (no web3 contract objects), with JSON-RPC
+# batching so several reads cost one HTTP round trip.
+
+RPC_URL = os.getenv("RPC_URL", "https://mainnet.base.org")
+BATCH_SIZE = int(os.getenv("RPC_BATCH_SIZE", "50"))
+MAX_RETRIES = 4
+
+REQUESTS = instrumentation.counter(
+    "rpc_requests_total", "JSON-RPC HTTP requests by outcome", ("method", "endpoint", "status"))
+LATENCY = instrumentation.histogram("rpc_request_seconds", "JSON-RPC HTTP request latency", ("method", "endpoint"))
+RATE_LIMITED = instrumentation.counter("rpc_rate_limited_total", "Requests rejected with HTTP 429", ("endpoint",))
+RETRIES = instrumentation.counter("rpc_retries_total", "Requests retried after a failure", ("method", "endpoint"))
+BATCHED_CALLS = instrumentation.counter("rpc_batched_calls_total", "Calls sent inside JSON-RPC batches", ("method",))
+ERRORS = instrumentation.counter("rpc_errors_total", "JSON-RPC error responses", ("method",))
+LOG_BLOCKS = instrumentation.counter("log_scan_blocks_total", "Blocks covered by completed eth_getLogs ranges", ("endpoint",))
+LOG_BISECTIONS = instrumentation.counter(
+    "log_scan_bisections_total", "eth_getLogs ranges split after a too-large error", ("endpoint",))
+
+def endpoint_label(rpc_url: str) -> str:
+    # Host only: provider API keys often sit in the URL path
+    return urlparse(rpc_url).hostname or rpc_url
+
+def _post(rpc_url, payload, timeout):
+    import requests  # deferred: keeps `import tools.rpc` (and every CLI importing it) cheap
+    method = payload.get("method") if isinstance(payload, dict) else "batch"
+    endpoint = endpoint_label(rpc_url)
+    with tracing.span("rpc.request", method=method, endpoint=endpoint, calls=len(payload) if isinstance(payload, list) else 1) as span_:
+        for attempt in range(MAX_RETRIES):
+            if attempt:
+                RETRIES.inc(method=method, endpoint=endpoint)
+            span_.set(attempts=attempt + 1)
+            start = time.perf_counter()
+            try:
+                res = requests.post(rpc_url, json=payload, timeout=timeout)
+                LATENCY.observe(time.perf_counter() - start, method=method, endpoint=endpoint)
+                if res.status_code == 429:
+                    RATE_LIMITED.inc(endpoint=endpoint)
+                    span_.set(status=429)
+                    REQUESTS.inc(method=method, endpoint=endpoint, status="429")
+                    time.sleep(1 + attempt * 2)
+                    continue
+                REQUESTS.inc(method=method, endpoint=endpoint, status=str(res.status_code))
+                span_.set(status=res.status_code)
+                return res.json()
+            except Exception as e:
+                REQUESTS.inc(method=method, endpoint=endpoint, status="error")
+                if attempt == MAX_RETRIES - 1:
+                    print(f"RPC Error: {e}")
+                    span_.error = f"{type(e).__name__}: {e}"
+                    return None
+                time.sleep(2 ** min(attempt, 3))
+        print("RPC Error: rate limited")
+        span_.error = "rate limited"
+        return None
+
+def call(method: str, params: list, rpc_url: Optional[str] = None, timeout: int = 15) -> Any:
+    """Single JSON-RPC call. Returns the result, or None on transport/RPC error."""
+    data = _post(rpc_url or RPC_URL, {"jsonrpc": "2.0", "method": method, "params": params, "id": 1}, timeout)
+    if not data:
+        return None
+    if "error" in data:
+        ERRORS.inc(method=method)
+        print(f"RPC Error ({method}): {data['error'].get('message', data['error'])}")
+        return None
+    return data.get("result")
+
+def batch(calls: Sequence[Tuple[str, list]], rpc_url: Optional[str] = None, timeout: int = 30,
+          batch_size: int = BATCH_SIZE) -> List[Any]:
+    """
+    Send many (method, params) calls as JSON-RPC batches of batch_size.
+    Results come back in call order; failed entries are None.
+    """
+    results: List[Any] = [None] * len(calls)
+    for start in range(0, len(calls), batch_size):
+        chunk = calls[start:start + batch_size]
+        payload = [
+            {"jsonrpc": "2.0", "method": method, "params": params, "id": start + i}
+            for i, (method, params) in enumerate(chunk)
+        ]
+        data = _post(rpc_url or RPC_URL, payload, timeout)
+        if not isinstance(data, list):
+            # Endpoint without batch support: degrade to sequential calls
+            for i, (method, params) in enumerate(chunk):
+                results[start + i] = call(method, params, rpc_url, timeout)
+            continue
+        for method, _ in chunk:
+            BATCHED_CALLS.inc(method=method)
+        for item in data:
+            idx = item.get("id")
+            if isinstance(idx, int) and 0 <= idx < len(results) and "result" in item:
+                results[idx] = item["result"]
+    return results
+
+def eth_call(to_addr: str, data: str, block: str = "latest", rpc_url: Optional[str] = None) -> Optional[str]:
+    return call("eth_call", [{"to": to_addr, "data": data}, block], rpc_url)
+
+def eth_call_batch(calls: Sequence[Tuple[str, str]], block: str = "latest", rpc_url: Optional[str] = None) -> List[Optional[str]]:
+    """Batch of (to, data) eth_calls in one round trip."""
+    return batch([("eth_call", [{"to": to, "data": data}, block]) for to, data in calls], rpc_url)
+
+def get_logs(address: str, topics: list, from_block: int, to_block: int,
+             rpc_url: Optional[str] = None, timeout: int = 60) -> Optional[List[dict]]:
+    """
+    eth_getLogs over [from_block, to_block], bisecting the range when the node
+    rejects it as too large. Returns None if any part could not be fetched, so
+    callers never mistake a failed scan for an empty one.
+    """
+    payload = {"jsonrpc": "2.0", "method": "eth_getLogs", "params": [{
+        "address": address, "topics": topics,
+        "fromBlock": hex(from_block), "toBlock": hex(to_block),
+    }], "id": 1}
+    for attempt in range(MAX_RETRIES):
+        data = _post(rpc_url or RPC_URL, payload, timeout)
+        if data is None:
+            return None
+        if "error" not in data:
+            result = data.get("result")
+            if not isinstance(result, list):
+                return None
+            LOG_BLOCKS.inc(to_block - from_block + 1, endpoint=endpoint_label(rpc_url or RPC_URL))
+            return result
+        ERRORS.inc(method="eth_getLogs")
+        message = str(data["error"].get("message", "")).lower()
+        if "rate limit" in message or "429" in message:
+            RATE_LIMITED.inc(endpoint=endpoint_label(rpc_url or RPC_URL))
+            time.sleep(3 + attempt * 2)
+            continue
+        if "limit" in message or "too many" in message or "range" in message:
+            if from_block >= to_block:
+                return None
+            LOG_BISECTIONS.inc(endpoint=endpoint_label(rpc_url or RPC_URL))
+            mid = (from_block + to_block) // 2
+            left = get_logs(address, topics, from_block, mid, rpc_url, timeout)
+            right = get_logs(address, topics, mid + 1, to_block, rpc_url, timeout) if left is not None else None
+            return left + right if right is not None else None
+        time.sleep(2 + attempt * 2)
+    return None
+
+def block_hashes(blocks: Sequence[Union[int, str]], rpc_url: Optional[str] = None) -> List[Optional[Tuple[int, str]]]:
+    """(number, hash) of each block number or tag ("latest", "safe", ...) in one batch; None where unavailable."""
+    results = batch([("eth_getBlockByNumber", [b if isinstance(b, str) else hex(b), False]) for b in blocks], rpc_url)
+    return [(int(r["number"], 16), r["hash"]) if isinstance(r, dict) and r.get("hash") else None for r in results]
+
+def block_timestamps(blocks: Sequence[Union[int, str]], rpc_url: Optional[str] = None) -> List[Optional[Tuple[int, int]]]:
+    """(number, unix timestamp) of each block number or tag in one batch; None where unavailable."""
+    results = batch([("eth_getBlockByNumber", [b if isinstance(b, str) else hex(b), False]) for b in blocks], rpc_url)
+    return [(int(r["number"], 16), int(r["timestamp"], 16)) if isinstance(r, dict) and r.get("timestamp") else None
+            for r in results]
+
+def block_number(rpc_url: Optional[str] = None) -> int:
+    result = call("eth_blockNumber", [], rpc_url, timeout=10)
+    return int(result, 16) if result else 0
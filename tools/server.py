@@ -5,26 +5,48 @@ import json
 import os
 import sys
 import threading
+from urllib.parse import urlparse, parse_qs
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tools import instrumentation, profiling, state_db, storage, tracing
+from tools.decimate import DEFAULT_TARGET_POINTS, history_series
 
 PORT = 3333
 DIRECTORY = "."
 
 # Track sync state
-sync_status = {"running": False, "last_result": None}
+sync_status = {"running": False, "last_result": None, "trace_id": None, "profile_run": None}
+
+# One Monte Carlo run at a time; concurrent /api/risk requests queue behind it
+risk_lock = threading.Lock()
 
-def run_sync_background():
+# Profile every background sync ("cprofile" or "sample"); POST /api/sync?profile=<mode> profiles one
+SYNC_PROFILE = os.getenv("SYNC_PROFILE") or None
+
+def run_sync_background(profile=None):
     """Run sync.py in a background thread."""
     global sync_status
     sync_status["running"] = True
     sync_status["last_result"] = None
     print("Starting sync in background...")
+    cmd, env_extra = [sys.executable, "tools/sync.py"], {}
+    sync_status["profile_run"] = None
+    if profile:
+        # Fetch the result with GET /api/profiles/<run_id>/run.collapsed
+        sync_status["profile_run"] = env_extra["PROFILE_RUN"] = profiling.new_run_id()
+        cmd.append(f"--profile={profile}")
+    # Root span of the run; sync.py and its stages attach to it via TRACEPARENT
+    # (sync_status exposes the trace id: `python tools/tracing.py show <id>`)
+    sync_span = tracing.start_span("server.sync")
+    sync_status["trace_id"] = sync_span.trace_id
     
     try:
         result = subprocess.run(
-            [sys.executable, "tools/sync.py"],
+            cmd,
             capture_output=True,
             text=True,
-            timeout=1800  # 30 min hard limit
+            timeout=1800,  # 30 min hard limit
+            env={**tracing.child_env(parent=sync_span), **env_extra},
         )
         
         if result.returncode == 0:
@@ -41,11 +63,24 @@ def run_sync_background():
         print(f"Sync exception: {e}")
         sync_status["last_result"] = {"success": False, "message": str(e)}
     finally:
+        if not (sync_status["last_result"] or {}).get("success"):
+            sync_span.error = (sync_status["last_result"] or {}).get("message", "interrupted")
+        sync_span.end()
         sync_status["running"] = False
 
 class Handler(http.server.SimpleHTTPRequestHandler):
     def do_POST(self):
-        if self.path == '/api/sync':
+        if urlparse(self.path).path == '/api/sync':
+            profile = parse_qs(urlparse(self.path).query).get('profile', [SYNC_PROFILE])[0]
+            if profile in ('1', 'true'):
+                profile = 'cprofile'
+            if profile not in (None, '0', *profiling.MODES):
+                self.send_response(400)
+                self.send_header('Content-type', 'application/json')
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.end_headers()
+                self.wfile.write(json.dumps({"success": False, "message": f"unknown profile mode {profile}"}).encode())
+                return
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
             self.send_header('Access-Control-Allow-Origin', '*')
@@ -55,7 +90,7 @@ class Handler(http.server.SimpleHTTPRequestHandler):
                 response = {"success": True, "message": "Sync already in progress, please wait..."}
             else:
                 # Start sync in background thread
-                thread = threading.Thread(target=run_sync_background, daemon=True)
+                thread = threading.Thread(target=run_sync_background, args=(None if profile == '0' else profile,), daemon=True)
                 thread.start()
                 response = {"success": True, "message": "Sync started! Dashboard will update in a few minutes."}
             
@@ -72,14 +107,9 @@ class Handler(http.server.SimpleHTTPRequestHandler):
                 if not nft_id:
                     raise ValueError("nft_id is required")
                 
-                # Create pool dir if not exists
-                pool_dir = f"tools/pools/{nft_id}"
-                os.makedirs(pool_dir, exist_ok=True)
-                
-                # Save manual data
-                manual_file = f"{pool_dir}/manual_data.json"
-                with open(manual_file, "w", encoding="utf-8") as f:
-                    json.dump(data, f, indent=2)
+                # Save manual data (atomic: the dashboard may be reading it right now)
+                storage.write_json(f"tools/pools/{nft_id}/manual_data.json", data)
+                state_db.set_manual(state_db.connect(), nft_id, data)
                 
                 # Regenerate dashboard immediately
                 subprocess.run([sys.executable, "tools/dashboard_gen_v3.py"], check=False)
@@ -121,6 +151,15 @@ class Handler(http.server.SimpleHTTPRequestHandler):
             self.send_error(404)
 
     def do_GET(self):
+        if self.path == '/metrics':
+            # Prometheus scrape: this process plus every sync/dashboard job's flushed metrics
+            body = instrumentation.render().encode()
+            self.send_response(200)
+            self.send_header('Content-type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
         if self.path == '/api/sync/status':
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
@@ -129,10 +168,166 @@ class Handler(http.server.SimpleHTTPRequestHandler):
             
             response = {
                 "running": sync_status["running"],
-                "last_result": sync_status["last_result"]
+                "last_result": sync_status["last_result"],
+                "trace_id": sync_status["trace_id"],
+                "profile_run": sync_status["profile_run"]
             }
             self.wfile.write(json.dumps(response).encode())
             return
+        if self.path.startswith('/api/profiles'):
+            # /api/profiles lists runs; /api/profiles/<run_id>/<file> downloads a profile file
+            parts = [p for p in urlparse(self.path).path.split('/')[3:] if p]
+            if not parts:
+                body = json.dumps({"runs": {run: sorted(os.listdir(os.path.join(profiling.PROFILE_DIR, run)))
+                                            for run in profiling.recent()}}).encode()
+                content_type = 'application/json'
+            else:
+                path = os.path.join(profiling.PROFILE_DIR, *map(os.path.basename, parts[:2]))
+                if len(parts) != 2 or not os.path.isfile(path):
+                    self.send_error(404, "profile not found")
+                    return
+                with open(path, "rb") as f:
+                    body = f.read()
+                content_type = 'text/plain; charset=utf-8' if path.endswith('.collapsed') else 'application/octet-stream'
+            self.send_response(200)
+            self.send_header('Content-type', content_type)
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if self.path.startswith('/api/history'):
+            # Chart series for one pool; points=0 returns full resolution
+            query = parse_qs(urlparse(self.path).query)
+            try:
+                nft_id = int(query.get('nft_id', [''])[0])
+                points = int(query.get('points', [DEFAULT_TARGET_POINTS])[0])
+                method = query.get('method', ['lttb'])[0]
+                history = state_db.history(state_db.connect(), nft_id)
+                if not history:
+                    raise ValueError(f"no history for pool {nft_id}")
+                response = {"success": True, **history_series(history, points=points, method=method)}
+                status = 200
+            except (ValueError, FileNotFoundError) as e:
+                response = {"success": False, "message": str(e)}
+                status = 400
+            self.send_response(status)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            self.wfile.write(json.dumps(response).encode())
+            return
+        if self.path.startswith('/api/rebalance'):
+            # What-if for moving a position to candidate ranges: ?nft_id=&lower=a,b&upper=c,d (prices) or tick_lower=&tick_upper=
+            from tools import rebalance
+            query = parse_qs(urlparse(self.path).query)
+
+            def numbers(name, cast):
+                raw = query.get(name, [''])[0]
+                return [cast(v) for v in raw.split(',')] if raw else None
+
+            try:
+                nft_id = int(query.get('nft_id', [''])[0])
+                with tracing.span("rebalance.simulate", pool=nft_id):
+                    response = {"success": True, **rebalance.simulate_position(
+                        nft_id, numbers('lower', float), numbers('upper', float),
+                        numbers('tick_lower', int), numbers('tick_upper', int))}
+                status = 200
+            except ValueError as e:
+                response = {"success": False, "message": str(e)}
+                status = 400
+            self.send_response(status)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            self.wfile.write(json.dumps(response).encode())
+            return
+        if self.path.startswith('/api/analytics'):
+            # Pool-derived TWAPs, realized volatility and drawdowns: ?pool=0x... or ?nft_id=, refresh=1 skips the cache
+            from tools import price_analytics
+            query = parse_qs(urlparse(self.path).query)
+            try:
+                conn = state_db.connect()
+                pool = query.get('pool', [''])[0].lower()
+                nft_id = query.get('nft_id', [''])[0]
+                if nft_id:
+                    pool = ((state_db.get_position(conn, int(nft_id)) or {}).get("pool_address") or "").lower()
+                if not pool:
+                    raise ValueError("give a V3 pool address (pool) or a position (nft_id)")
+                max_age = 0 if query.get('refresh', ['0'])[0] == '1' else price_analytics.TTL
+                result = price_analytics.get(pool, conn, max_age)
+                if result is None:
+                    raise ValueError(f"no tracked position in pool {pool}")
+                response = {"success": True, **result}
+                status = 200
+            except ValueError as e:
+                response = {"success": False, "message": str(e)}
+                status = 400
+            self.send_response(status)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            self.wfile.write(json.dumps(response).encode())
+            return
+        if self.path.startswith('/api/risk'):
+            # Monte Carlo range risk; default parameters are served from the cache, others computed on demand
+            from tools import range_risk
+            query = parse_qs(urlparse(self.path).query)
+            try:
+                conn = state_db.connect()
+                nft_id = query.get('nft_id', [''])[0]
+                pools = [p for p in state_db.list_pools(conn, include_closed=False) if not nft_id or p["nft_id"] == int(nft_id)]
+                params = {
+                    "paths": min(int(query.get('paths', [range_risk.PATHS])[0]), range_risk.PATHS),
+                    "horizon_days": float(query.get('horizon_days', [range_risk.HORIZON_DAYS])[0]),
+                    "step_hours": float(query.get('step_hours', [range_risk.STEP_HOURS])[0]),
+                    "model": query.get('model', [range_risk.MODEL])[0],
+                }
+                if params["model"] not in ("gbm", "bootstrap") or params["paths"] <= 0 \
+                        or not 0 < params["horizon_days"] <= range_risk.MAX_HORIZON_DAYS or not params["step_hours"] > 0:
+                    raise ValueError("invalid simulation parameters")
+                if params["horizon_days"] * 24 / params["step_hours"] > range_risk.MAX_STEPS:
+                    raise ValueError(f"at most {range_risk.MAX_STEPS} steps per path (horizon_days * 24 / step_hours)")
+                defaults = params == {"paths": range_risk.PATHS, "horizon_days": range_risk.HORIZON_DAYS,
+                                      "step_hours": range_risk.STEP_HOURS, "model": range_risk.MODEL}
+                with risk_lock, tracing.span("risk.request", pools=len(pools), paths=params["paths"]):
+                    results = range_risk.refresh(conn, pools, cache_file=range_risk.CACHE_FILE if defaults else None, **params)
+                if nft_id and not results:
+                    raise ValueError(f"no open stablecoin-pair position with a range for pool {nft_id}")
+                response = {"success": True, "pools": list(results.values())}
+                status = 200
+            except ValueError as e:
+                response = {"success": False, "message": str(e)}
+                status = 400
+            self.send_response(status)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            self.wfile.write(json.dumps(response).encode())
+            return
+        if self.path.startswith('/api/portfolio'):
+            # Combined history of all pools on one time grid, with per-pool contributions
+            from tools import portfolio
+            query = parse_qs(urlparse(self.path).query)
+            try:
+                points = int(query.get('points', [DEFAULT_TARGET_POINTS])[0])
+                step = float(query.get('step', [portfolio.GRID_STEP])[0])
+                if not step > 0:
+                    raise ValueError("step must be a positive number of seconds")
+                since_hours = query.get('since_hours', [''])[0]
+                conn = state_db.connect()
+                combined = portfolio.build(state_db.list_pools(conn), conn, step)
+                since = combined.timestamps[-1] - float(since_hours) * 3600 if since_hours and len(combined.timestamps) else None
+                response = {"success": True, **combined.to_dict(points, per_pool=query.get('pools', ['0'])[0] == '1', since=since)}
+                status = 200
+            except ValueError as e:
+                response = {"success": False, "message": str(e)}
+                status = 400
+            self.send_response(status)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            self.wfile.write(json.dumps(response).encode())
+            return
         return http.server.SimpleHTTPRequestHandler.do_GET(self)
 
 if __name__ == "__main__":
@@ -140,8 +335,10 @@ if __name__ == "__main__":
     cwd = os.getcwd()
     print(f"Serving at port {PORT} from {cwd}")
     
-    socketserver.TCPServer.allow_reuse_address = True
-    with socketserver.TCPServer(("", PORT), Handler) as httpd:
+    # Threaded so a long /api/risk simulation doesn't block /metrics, /api/sync or static pages
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    socketserver.ThreadingTCPServer.daemon_threads = True
+    with socketserver.ThreadingTCPServer(("", PORT), Handler) as httpd:
         print(f"Local dashboard server running at http://localhost:{PORT}")
         print("Press Ctrl+C to stop.")
         try:
@@ -0,0 +1,451 @@
+import json
+import os
+import sqlite3
+import sys
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Allow importing from the project root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tools import storage
+
+# Unified pool state store: one SQLite database (WAL, so the dashboard, API and
+# Streamlit readers never block the sync writer) replacing the per-pool JSON
+# files as the source the UIs read from.
+#
+#   pools             registry entry, config, latest position and fee summary
+#   snapshots         history (one row per update_history run)
+#   fee_events        decoded collect/decrease events, exact integer amounts (append-only ledger)
+#   fee_totals        running sums of each pool's ledger, maintained as events are added
+#   checkpoints       block/slot cursors of the incremental scanners (with block hash, for reorg checks)
+#   swaps             Swap events of the tracked V3 pools (tick, price, active liquidity, amounts), rolling window
+#   manual_overrides  values entered through /api/manual
+#
+# The writers still export the JSON files for the legacy scripts and VPS checks.
+#
+#   python tools/state_db.py import [--force]   # seed from tools/pools.json + per-pool files
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+DB_FILE = os.getenv("STATE_DB", os.path.join(SCRIPT_DIR, "state.db"))
+SCHEMA_VERSION = 4
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pools (
+    nft_id INTEGER PRIMARY KEY,
+    exchange TEXT NOT NULL DEFAULT 'uniswap_v3',
+    network TEXT,
+    label TEXT,
+    status TEXT,
+    entry TEXT,
+    config TEXT,
+    position TEXT,
+    fees TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_pools_exchange ON pools (exchange, status);
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    nft_id INTEGER NOT NULL,
+    timestamp REAL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_snapshots_pool_time ON snapshots (nft_id, timestamp);
+CREATE TABLE IF NOT EXISTS fee_events (
+    nft_id INTEGER NOT NULL,
+    tx_hash TEXT NOT NULL,
+    log_index INTEGER NOT NULL,
+    block_number INTEGER,
+    timestamp INTEGER,
+    kind TEXT NOT NULL,
+    fee0 TEXT NOT NULL,
+    fee1 TEXT NOT NULL,
+    withdrawn0 TEXT NOT NULL,
+    withdrawn1 TEXT NOT NULL,
+    block_hash TEXT,
+    PRIMARY KEY (nft_id, tx_hash, log_index)
+);
+CREATE INDEX IF NOT EXISTS idx_fee_events_pool_block ON fee_events (nft_id, block_number);
+CREATE TABLE IF NOT EXISTS fee_totals (
+    nft_id INTEGER PRIMARY KEY,
+    fee0 TEXT NOT NULL,
+    fee1 TEXT NOT NULL,
+    withdrawn0 TEXT NOT NULL,
+    withdrawn1 TEXT NOT NULL,
+    events INTEGER NOT NULL,
+    last_block INTEGER
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    name TEXT PRIMARY KEY,
+    block_number INTEGER NOT NULL,
+    block_hash TEXT
+);
+CREATE TABLE IF NOT EXISTS swaps (
+    pool TEXT NOT NULL,
+    block_number INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    timestamp INTEGER NOT NULL,
+    tick INTEGER NOT NULL,
+    sqrt_price_x96 TEXT NOT NULL,
+    liquidity TEXT NOT NULL,
+    amount0 TEXT NOT NULL,
+    amount1 TEXT NOT NULL,
+    PRIMARY KEY (pool, block_number, log_index)
+);
+CREATE INDEX IF NOT EXISTS idx_swaps_pool_time ON swaps (pool, timestamp);
+CREATE TABLE IF NOT EXISTS manual_overrides (
+    nft_id INTEGER PRIMARY KEY,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+def connect(db_file: str = DB_FILE, seed: bool = True) -> sqlite3.Connection:
+    """
+    Open the store (WAL, 5s busy timeout). A new database is seeded from the
+    JSON files on first open, so readers work before the first sync.
+    """
+    os.makedirs(os.path.dirname(db_file) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_file, timeout=5)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version < SCHEMA_VERSION:
+        if 0 < version < 3:
+            # v3: block hashes on ledger events and checkpoints
+            for table in ("fee_events", "checkpoints"):
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN block_hash TEXT")
+        conn.executescript(SCHEMA)
+        conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        if version == 0 and seed:
+            import_files(conn)
+        elif version == 1:
+            rebuild_fee_totals(conn)  # v2 added fee_totals over the existing ledger
+    return conn
+
+def _dumps(value: Any) -> Optional[str]:
+    return None if value is None else json.dumps(value)
+
+def _loads(value: Optional[str], default: Any = None) -> Any:
+    return default if value is None else json.loads(value)
+
+def _touch(conn: sqlite3.Connection, nft_id: int):
+    conn.execute("INSERT OR IGNORE INTO pools (nft_id, updated_at) VALUES (?, ?)", (int(nft_id), time.time()))
+
+# --- pools -------------------------------------------------------------------
+
+def upsert_pool(conn: sqlite3.Connection, entry: Dict[str, Any]):
+    """Mirror a pools.json registry entry (pools.json stays the file people edit)."""
+    nft_id = int(entry["nft_id"])
+    with conn:
+        _touch(conn, nft_id)
+        conn.execute(
+            "UPDATE pools SET exchange = ?, network = ?, label = ?, status = ?, entry = ?, updated_at = ? WHERE nft_id = ?",
+            (entry.get("exchange", "uniswap_v3"), entry.get("network"), entry.get("label"), entry.get("status"),
+             json.dumps(entry), time.time(), nft_id))
+
+def list_pools(conn: sqlite3.Connection, include_closed: bool = True) -> List[Dict[str, Any]]:
+    query = "SELECT entry FROM pools WHERE entry IS NOT NULL"
+    if not include_closed:
+        query += " AND (status IS NULL OR status != 'closed')"
+    return [json.loads(r["entry"]) for r in conn.execute(query + " ORDER BY nft_id")]
+
+def _set_column(conn: sqlite3.Connection, nft_id: int, column: str, value: Any):
+    with conn:
+        _touch(conn, nft_id)
+        conn.execute(f"UPDATE pools SET {column} = ?, updated_at = ? WHERE nft_id = ?",
+                     (_dumps(value), time.time(), int(nft_id)))
+
+def save_config(conn: sqlite3.Connection, nft_id: int, config: Dict[str, Any]):
+    _set_column(conn, nft_id, "config", config)
+
+def save_position(conn: sqlite3.Connection, nft_id: int, position: Dict[str, Any]):
+    _set_column(conn, nft_id, "position", position)
+
+def save_fees(conn: sqlite3.Connection, nft_id: int, fees: Dict[str, Any]):
+    _set_column(conn, nft_id, "fees", fees)
+
+def get_position(conn: sqlite3.Connection, nft_id: int) -> Optional[Dict[str, Any]]:
+    row = conn.execute("SELECT position FROM pools WHERE nft_id = ?", (int(nft_id),)).fetchone()
+    return _loads(row["position"]) if row else None
+
+def get_fees(conn: sqlite3.Connection, nft_id: int) -> Dict[str, Any]:
+    row = conn.execute("SELECT fees FROM pools WHERE nft_id = ?", (int(nft_id),)).fetchone()
+    return _loads(row["fees"], {}) if row else {}
+
+def pool_version(conn: sqlite3.Connection, nft_id: int) -> float:
+    """Last write time of anything belonging to the pool; a cheap cache key for readers."""
+    row = conn.execute(
+        "SELECT MAX(COALESCE(p.updated_at, 0), COALESCE(m.updated_at, 0)) AS v FROM pools p"
+        " LEFT JOIN manual_overrides m ON m.nft_id = p.nft_id WHERE p.nft_id = ?", (int(nft_id),)).fetchone()
+    return row["v"] if row and row["v"] is not None else 0.0
+
+# --- history -----------------------------------------------------------------
+
+def append_snapshot(conn: sqlite3.Connection, nft_id: int, snapshot: Dict[str, Any]):
+    with conn:
+        _touch(conn, nft_id)
+        conn.execute("INSERT INTO snapshots (nft_id, timestamp, data) VALUES (?, ?, ?)",
+                     (int(nft_id), snapshot.get("timestamp"), json.dumps(snapshot)))
+        conn.execute("UPDATE pools SET updated_at = ? WHERE nft_id = ?", (time.time(), int(nft_id)))
+
+def history(conn: sqlite3.Connection, nft_id: int, since: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Snapshots in insertion order, optionally only those taken at or after `since`."""
+    if since is None:
+        rows = conn.execute("SELECT data FROM snapshots WHERE nft_id = ? ORDER BY id", (int(nft_id),))
+    else:
+        rows = conn.execute("SELECT data FROM snapshots WHERE nft_id = ? AND timestamp >= ? ORDER BY id",
+                            (int(nft_id), since))
+    return [json.loads(r["data"]) for r in rows]
+
+def snapshots_after(conn: sqlite3.Connection, nft_id: int, after_id: int = 0) -> List[Tuple[int, Dict[str, Any]]]:
+    """(row id, snapshot) pairs inserted after row `after_id`; lets readers cache parsed history."""
+    rows = conn.execute("SELECT id, data FROM snapshots WHERE nft_id = ? AND id > ? ORDER BY id",
+                        (int(nft_id), int(after_id)))
+    return [(r["id"], json.loads(r["data"])) for r in rows]
+
+def snapshot_count(conn: sqlite3.Connection, nft_id: int) -> Tuple[int, int]:
+    """(number of snapshots, highest row id) of the pool."""
+    row = conn.execute("SELECT COUNT(*) AS n, COALESCE(MAX(id), 0) AS last FROM snapshots WHERE nft_id = ?",
+                       (int(nft_id),)).fetchone()
+    return row["n"], row["last"]
+
+# --- fee events, checkpoints, manual overrides --------------------------------
+
+AMOUNT_FIELDS = ("fee0", "fee1", "withdrawn0", "withdrawn1")
+
+def add_fee_events(conn: sqlite3.Connection, nft_id: int, events: Iterable[Dict[str, Any]],
+                   checkpoints: Iterable[Tuple] = ()) -> int:
+    """
+    Append events to the pool's ledger, keyed by (tx_hash, log_index): events
+    already recorded (overlapping or repeated scans) are ignored. The pool's
+    fee_totals advance by the new events only, in the same transaction, as do
+    the scanner `checkpoints` ((name, block[, block_hash]) tuples). Returns the number of events added.
+    """
+    nft_id = int(nft_id)
+    added, sums, last_block = 0, [0, 0, 0, 0], None
+    with conn:
+        for e in events:
+            amounts = [int(e.get(key, 0)) for key in AMOUNT_FIELDS]
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO fee_events (nft_id, tx_hash, log_index, block_number, timestamp, kind,"
+                " fee0, fee1, withdrawn0, withdrawn1, block_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (nft_id, e["tx_hash"], int(e["log_index"]), e.get("block_number"), e.get("timestamp"),
+                 e["kind"], *map(str, amounts), e.get("block_hash")))
+            if cur.rowcount:
+                added += 1
+                sums = [a + b for a, b in zip(sums, amounts)]
+                if e.get("block_number") is not None:
+                    last_block = max(last_block or 0, e["block_number"])
+        if added:
+            _add_to_totals(conn, nft_id, sums, added, last_block)
+        for checkpoint in checkpoints:
+            set_checkpoint(conn, *checkpoint)
+    return added
+
+def rollback_fee_events(conn: sqlite3.Connection, nft_id: int, after_block: int,
+                        checkpoints: Iterable[Tuple] = ()) -> int:
+    """
+    Drop the pool's ledger events above `after_block` (orphaned by a reorg) and
+    take them out of fee_totals, together with resetting `checkpoints`. Returns the number removed.
+    """
+    nft_id = int(nft_id)
+    with conn:
+        removed = fee_events(conn, nft_id, since_block=after_block + 1)
+        if removed:
+            conn.execute("DELETE FROM fee_events WHERE nft_id = ? AND block_number > ?", (nft_id, after_block))
+            row = conn.execute("SELECT MAX(block_number) AS b FROM fee_events WHERE nft_id = ?", (nft_id,)).fetchone()
+            totals = fee_totals(conn, nft_id)
+            conn.execute("INSERT OR REPLACE INTO fee_totals VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (nft_id, *(str(totals[key] - sum(e[key] for e in removed)) for key in AMOUNT_FIELDS),
+                          totals["events"] - len(removed), row["b"]))
+        for checkpoint in checkpoints:
+            set_checkpoint(conn, *checkpoint)
+    return len(removed)
+
+def _add_to_totals(conn: sqlite3.Connection, nft_id: int, sums: List[int], count: int, last_block: Optional[int]):
+    row = conn.execute("SELECT * FROM fee_totals WHERE nft_id = ?", (nft_id,)).fetchone()
+    if row is not None:
+        sums = [a + int(row[key]) for a, key in zip(sums, AMOUNT_FIELDS)]
+        count += row["events"]
+        blocks = [b for b in (last_block, row["last_block"]) if b is not None]
+        last_block = max(blocks) if blocks else None
+    conn.execute("INSERT OR REPLACE INTO fee_totals VALUES (?, ?, ?, ?, ?, ?, ?)",
+                 (nft_id, *map(str, sums), count, last_block))
+
+def fee_events(conn: sqlite3.Connection, nft_id: int, since_block: Optional[int] = None) -> List[Dict[str, Any]]:
+    """The pool's ledger in chain order, amounts as ints; optionally only events at or after `since_block`."""
+    query = "SELECT * FROM fee_events WHERE nft_id = ?"
+    params: Tuple = (int(nft_id),)
+    if since_block is not None:
+        query += " AND block_number >= ?"
+        params += (since_block,)
+    events = []
+    for r in conn.execute(query + " ORDER BY block_number, log_index", params):
+        event = dict(r)
+        for key in AMOUNT_FIELDS:
+            event[key] = int(event[key])
+        events.append(event)
+    return events
+
+def fee_totals(conn: sqlite3.Connection, nft_id: int) -> Dict[str, int]:
+    """Exact sums of the pool's ledger: fee0/fee1/withdrawn0/withdrawn1, events, last_block."""
+    row = conn.execute("SELECT * FROM fee_totals WHERE nft_id = ?", (int(nft_id),)).fetchone()
+    if row is None:
+        return {**{key: 0 for key in AMOUNT_FIELDS}, "events": 0, "last_block": None}
+    return {**{key: int(row[key]) for key in AMOUNT_FIELDS}, "events": row["events"], "last_block": row["last_block"]}
+
+def rebuild_fee_totals(conn: sqlite3.Connection, nft_id: Optional[int] = None):
+    """Recompute fee_totals from the ledger (one pool, or all); no RPC involved."""
+    pools = [int(nft_id)] if nft_id is not None else [
+        r["nft_id"] for r in conn.execute("SELECT DISTINCT nft_id FROM fee_events")]
+    with conn:
+        for pool in pools:
+            conn.execute("DELETE FROM fee_totals WHERE nft_id = ?", (pool,))
+            events = fee_events(conn, pool)
+            if events:
+                _add_to_totals(conn, pool, [sum(e[key] for e in events) for key in AMOUNT_FIELDS], len(events),
+                               max((e["block_number"] for e in events if e["block_number"] is not None), default=None))
+
+def get_checkpoint(conn: sqlite3.Connection, name: str, default: Optional[int] = None) -> Optional[int]:
+    row = conn.execute("SELECT block_number FROM checkpoints WHERE name = ?", (name,)).fetchone()
+    return row["block_number"] if row else default
+
+def get_checkpoint_hash(conn: sqlite3.Connection, name: str) -> Optional[str]:
+    """Hash of the checkpoint's block as recorded when it was set (None if not recorded)."""
+    row = conn.execute("SELECT block_hash FROM checkpoints WHERE name = ?", (name,)).fetchone()
+    return row["block_hash"] if row else None
+
+def set_checkpoint(conn: sqlite3.Connection, name: str, block_number: int, block_hash: Optional[str] = None):
+    """Not committed on its own: call inside the transaction that stores the data it covers."""
+    conn.execute("INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?)", (name, block_number, block_hash))
+
+# --- pool swaps ------------------------------------------------------------------
+
+SWAP_FIELDS = ("block_number", "log_index", "timestamp", "tick", "sqrt_price_x96", "liquidity", "amount0", "amount1")
+
+def add_swaps(conn: sqlite3.Connection, pool: str, swaps: Iterable[Tuple], checkpoint: Optional[Tuple] = None,
+              keep_after: Optional[int] = None) -> int:
+    """
+    Append (block, log_index, timestamp, tick, sqrt_price_x96, liquidity, amount0, amount1)
+    rows of one pool, ignoring rows already stored; the big integers are kept as text.
+    Rows older than `keep_after` (unix time) are dropped in the same transaction.
+    """
+    pool = pool.lower()
+    with conn:
+        cur = conn.executemany(
+            "INSERT OR IGNORE INTO swaps VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            ((pool, block, log_index, timestamp, tick, str(sqrt_price), str(liquidity), str(amount0), str(amount1))
+             for block, log_index, timestamp, tick, sqrt_price, liquidity, amount0, amount1 in swaps))
+        added = cur.rowcount
+        if keep_after is not None:
+            conn.execute("DELETE FROM swaps WHERE pool = ? AND timestamp < ?", (pool, keep_after))
+        if checkpoint:
+            set_checkpoint(conn, *checkpoint)
+    return added
+
+def swaps(conn: sqlite3.Connection, pool: str, since: Optional[float] = None) -> List[Tuple]:
+    """The pool's swaps in chain order as SWAP_FIELDS tuples (big integers as text), optionally from `since` on."""
+    query = "SELECT " + ", ".join(SWAP_FIELDS) + " FROM swaps WHERE pool = ?"
+    params: Tuple = (pool.lower(),)
+    if since is not None:
+        query += " AND timestamp >= ?"
+        params += (since,)
+    return [tuple(r) for r in conn.execute(query + " ORDER BY block_number, log_index", params)]
+
+def set_manual(conn: sqlite3.Connection, nft_id: int, data: Dict[str, Any]):
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO manual_overrides VALUES (?, ?, ?)",
+                     (int(nft_id), json.dumps(data), time.time()))
+
+# --- reads for the UIs ---------------------------------------------------------
+
+def load_pool_data(conn: sqlite3.Connection, nft_id: int, with_history: bool = True) -> Dict[str, Any]:
+    """
+    Everything the dashboard needs for one pool, in the shape the per-pool files
+    had: {"pos", "config", "fees", "history", "manual"}. Two queries, one read
+    transaction, so the parts are consistent with each other. with_history=False
+    leaves "history" empty.
+    """
+    with conn:
+        conn.execute("BEGIN")
+        row = conn.execute(
+            "SELECT p.config, p.position, p.fees, m.data AS manual FROM pools p"
+            " LEFT JOIN manual_overrides m ON m.nft_id = p.nft_id WHERE p.nft_id = ?", (int(nft_id),)).fetchone()
+        snapshots = history(conn, nft_id) if with_history else []
+    if row is None:
+        return {"pos": None, "config": {}, "fees": {}, "history": snapshots, "manual": None}
+    return {
+        "pos": _loads(row["position"]),
+        "config": _loads(row["config"], {}),
+        "fees": _loads(row["fees"], {}),
+        "history": snapshots,
+        "manual": _loads(row["manual"]),
+    }
+
+# --- importer ------------------------------------------------------------------
+
+def _legacy_file(nft_id, name: str) -> Optional[Any]:
+    """A pool file from tools/pools/<id>/, else from the older data/pools trees."""
+    short = {"position_data": "position", "fees_data": "fees"}.get(name, name)
+    for path in (os.path.join(SCRIPT_DIR, "pools", str(nft_id), f"{name}.json"),
+                 os.path.join(PROJECT_ROOT, "data", "pools", str(nft_id), f"{name}.json"),
+                 os.path.join(PROJECT_ROOT, "data", "pools", f"{nft_id}_{short}.json")):
+        data = storage.read_json(path)
+        if data is not None:
+            return data
+    return None
+
+def solana_events(nft_id) -> List[Dict[str, Any]]:
+    """Events already decoded into a ByReal pool's transaction cache."""
+    state = storage.read_json(os.path.join(SCRIPT_DIR, "pools", str(nft_id), "solana_tx_cache.json"), {})
+    events = []
+    for signature, tx in (state.get("transactions") or {}).items():
+        for i, event in enumerate(tx.get("events", [])):
+            events.append({**event, "tx_hash": signature, "log_index": i,
+                           "block_number": tx.get("slot"), "timestamp": tx.get("block_time")})
+    return events
+
+def import_files(conn: sqlite3.Connection, force: bool = False) -> Dict[str, int]:
+    """
+    Load pools.json and every pool's JSON files. Pools that already have
+    history in the database keep it unless force=True.
+    """
+    registry = storage.read_json(os.path.join(SCRIPT_DIR, "pools.json"), {})
+    entries = registry.get("pools", []) if isinstance(registry, dict) else registry
+    counts = {"pools": 0, "snapshots": 0, "fee_events": 0}
+    for entry in entries:
+        nft_id = int(entry["nft_id"])
+        upsert_pool(conn, entry)
+        for name, save in (("config", save_config), ("position_data", save_position), ("fees_data", save_fees)):
+            data = _legacy_file(nft_id, name)
+            if data is not None:
+                save(conn, nft_id, data)
+        manual = _legacy_file(nft_id, "manual_data")
+        if manual is not None:
+            set_manual(conn, nft_id, manual)
+
+        has_history = conn.execute("SELECT 1 FROM snapshots WHERE nft_id = ? LIMIT 1", (nft_id,)).fetchone()
+        if force or not has_history:
+            snapshots = _legacy_file(nft_id, "history") or []
+            with conn:
+                conn.execute("DELETE FROM snapshots WHERE nft_id = ?", (nft_id,))
+                conn.executemany("INSERT INTO snapshots (nft_id, timestamp, data) VALUES (?, ?, ?)",
+                                 [(nft_id, s.get("timestamp"), json.dumps(s)) for s in snapshots])
+            counts["snapshots"] += len(snapshots)
+        counts["fee_events"] += add_fee_events(conn, nft_id, solana_events(nft_id))
+        counts["pools"] += 1
+    return counts
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] != "import":
+        print("Usage: python tools/state_db.py import [--force]")
+        return
+    conn = connect(seed=False)
+    counts = import_files(conn, force="--force" in sys.argv)
+    print(f"Imported {counts['pools']} pool(s), {counts['snapshots']} snapshot(s), "
+          f"{counts['fee_events']} fee event(s) into {DB_FILE}")
+
+if __name__ == "__main__":
+    main()
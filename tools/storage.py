@@ -0,0 +1,87 @@
+import contextlib
+import json
+import os
+import threading
+from typing import Any
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: writes stay atomic, locks become no-ops
+    fcntl = None
+
+# Shared access to the JSON state under tools/ (pools.json, pools/<id>/*.json,
+# history.json, caches). The sync container, the VPS API and the Streamlit app
+# all write these on one volume, so:
+#   - every write goes to a temp file in the same directory and is renamed over
+#     the target (os.replace), so a reader sees the old file or the new one,
+#     never a truncated one;
+#   - read-modify-write sequences (history append, registry updates) hold an
+#     advisory flock on a sidecar "<file>.lock", so concurrent writers queue
+#     instead of losing each other's updates.
+# The lock lives in a sidecar because os.replace swaps the data file's inode.
+
+def _lock_file(path: str) -> str:
+    return f"{path}.lock"
+
+@contextlib.contextmanager
+def locked(path: str, shared: bool = False):
+    """Advisory lock for `path`: exclusive for writers, shared for readers."""
+    directory = os.path.dirname(path) or "."
+    if fcntl is None or (shared and not os.path.isdir(directory)):
+        yield  # nothing to read there, and readers should not create directories
+        return
+    os.makedirs(directory, exist_ok=True)
+    fd = os.open(_lock_file(path), os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)  # releases the lock
+
+@contextlib.contextmanager
+def atomic_open(path: str, mode: str = "w", encoding: str = "utf-8"):
+    """
+    File object whose content replaces `path` only when the block completes.
+    On error the temp file is removed and the previous content is left as is.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, mode, encoding=None if "b" in mode else encoding) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp)
+        raise
+
+def read_json(path: str, default: Any = None) -> Any:
+    """Parsed file, or `default` if it is missing or unreadable. Writes are atomic, so no lock is needed."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return default
+
+def write_json(path: str, data: Any, indent: int = 2, lock: bool = True):
+    """Atomically replace `path` with `data`, serialised against other writers unless lock=False."""
+    with locked(path) if lock else contextlib.nullcontext():
+        with atomic_open(path) as f:
+            json.dump(data, f, indent=indent)
+
+@contextlib.contextmanager
+def update_json(path: str, default: Any = None):
+    """
+    Read-modify-write under an exclusive lock:
+
+        with update_json("tools/pools/1/history.json", []) as history:
+            history.append(snapshot)
+
+    The yielded object is written back when the block exits without error.
+    """
+    with locked(path):
+        data = read_json(path, default)
+        yield data
+        write_json(path, data, lock=False)
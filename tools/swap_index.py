@@ -0,0 +1,106 @@
+import os
+import sys
+from typing import Any, Dict, List, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tools import rpc, state_db, tracing
+from tools.clmath import to_signed
+
+# Index of the Swap events of the tracked Uniswap V3 pools, kept in the state
+# store's swaps table: tick, sqrtPriceX96, active liquidity and amounts of every
+# swap over a rolling window. The rebalance simulator reads from it which ticks
+# the pool's fees were paid at, and against how much liquidity.
+#
+# Scans are incremental (checkpoint "swaps:<pool>") and stop CONFIRMATIONS
+# blocks behind the head, so indexed swaps are not reorged away. Timestamps are
+# derived from the head block and Base's fixed 2 s block time.
+#
+#   python tools/swap_index.py [pool_address ...]   # default: pools of the tracked V3 positions
+
+# keccak("Swap(address,address,int256,int256,uint160,uint128,int24)")
+SWAP_TOPIC = "0xc42079f94a6350d7e6235f29174924f928cc2ac818eb64fed8004e115fbcca67"
+CONFIRMATIONS = int(os.getenv("SWAP_CONFIRMATIONS", "64"))
+WINDOW_DAYS = float(os.getenv("SWAP_WINDOW_DAYS", "7"))
+BLOCK_SECONDS = 2
+SCAN_CHUNK = 10_000  # blocks per eth_getLogs request; rpc.get_logs bisects further if the node insists
+INT_FIELDS = ("block_number", "log_index", "timestamp", "tick")
+
+def checkpoint_name(pool: str) -> str:
+    return f"swaps:{pool.lower()}"
+
+def decode_swaps(logs: List[dict], head_block: int, head_time: int) -> List[tuple]:
+    """Swap logs -> state_db.add_swaps rows in chain order; other and removed logs are skipped."""
+    rows = []
+    for log in logs:
+        topics = log.get("topics") or []
+        data = log.get("data") or "0x"
+        if not topics or topics[0].lower() != SWAP_TOPIC or log.get("removed") or len(data) < 2 + 5 * 64:
+            continue
+        # data: amount0 (int256), amount1 (int256), sqrtPriceX96, liquidity, tick (int24)
+        words = [int(data[2 + i * 64:2 + (i + 1) * 64], 16) for i in range(5)]
+        block = int(log["blockNumber"], 16)
+        rows.append((block, int(log["logIndex"], 16), head_time - (head_block - block) * BLOCK_SECONDS,
+                     to_signed(words[4], 24), words[2], words[3], to_signed(words[0], 256), to_signed(words[1], 256)))
+    rows.sort()
+    return rows
+
+def sync_pool(conn, pool: str, rpc_url: Optional[str] = None) -> Optional[int]:
+    """Index the pool's swaps up to CONFIRMATIONS blocks behind the head. Returns the number added, None if the head is unavailable."""
+    head = rpc.block_timestamps(["latest"], rpc_url)[0]
+    if head is None:
+        print(f"Swap index: no head block for {pool}")
+        return None
+    head_block, head_time = head
+    to_block = head_block - CONFIRMATIONS
+    window_start = head_block - int(WINDOW_DAYS * 86400 / BLOCK_SECONDS)
+    last = state_db.get_checkpoint(conn, checkpoint_name(pool))
+    from_block = max(last + 1, window_start) if last is not None else window_start
+
+    added = 0
+    with tracing.span("swaps.scan", pool=pool, blocks=max(to_block - from_block + 1, 0)) as span_:
+        for start in range(from_block, to_block + 1, SCAN_CHUNK):
+            end = min(start + SCAN_CHUNK - 1, to_block)
+            logs = rpc.get_logs(pool, [SWAP_TOPIC], start, end, rpc_url)
+            if logs is None:
+                # The checkpoint stays at the last complete chunk; the next run resumes there
+                span_.error = f"eth_getLogs failed for {start}-{end}"
+                print(f"Swap index: scan of {pool} stopped at block {start} (RPC error)")
+                break
+            added += state_db.add_swaps(conn, pool, decode_swaps(logs, head_block, head_time),
+                                        checkpoint=(checkpoint_name(pool), end),
+                                        keep_after=int(head_time - WINDOW_DAYS * 86400))
+        span_.set(added=added)
+    return added
+
+def load(conn, pool: str, since: Optional[float] = None) -> Dict[str, Any]:
+    """The pool's indexed swaps as column arrays (ints for block/log/time/tick, floats for the rest)."""
+    import numpy as np
+
+    rows = state_db.swaps(conn, pool, since)
+    columns = list(zip(*rows)) if rows else [()] * len(state_db.SWAP_FIELDS)
+    return {name: np.array(column, dtype=np.int64 if name in INT_FIELDS else float)
+            for name, column in zip(state_db.SWAP_FIELDS, columns)}
+
+def tracked_pools(conn) -> List[str]:
+    """Pool addresses of the open Uniswap V3 positions."""
+    pools = set()
+    for entry in state_db.list_pools(conn, include_closed=False):
+        if entry.get("exchange", "uniswap_v3") != "uniswap_v3":
+            continue
+        position = state_db.get_position(conn, entry["nft_id"]) or {}
+        if position.get("pool_address"):
+            pools.add(position["pool_address"].lower())
+    return sorted(pools)
+
+def main():
+    conn = state_db.connect()
+    pools = [p.lower() for p in sys.argv[1:]] or tracked_pools(conn)
+    if not pools:
+        print("No V3 pools to index.")
+        return
+    for pool in pools:
+        added = sync_pool(conn, pool)
+        print(f"{pool}: {added if added is not None else 'failed'} new swap(s), {len(state_db.swaps(conn, pool))} indexed")
+
+if __name__ == "__main__":
+    main()
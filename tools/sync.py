@@ -6,27 +6,55 @@ import os
 
 # Allow importing from the project root
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tools import instrumentation, profiling, state_db, storage, swap_index, tracing
 from tools.providers.factory import ProviderFactory
+from tools.price_service import COINGECKO_IDS, PriceService
 
 POOLS_FILE = "tools/pools.json"
 
+STAGE_SECONDS = instrumentation.histogram("sync_stage_seconds", "Duration of each sync stage", ("pool", "stage"))
+POOL_SYNCS = instrumentation.counter("sync_pools_total", "Pool syncs by result", ("pool", "result"))
+RUN_SECONDS = instrumentation.histogram("sync_run_seconds", "Duration of a full sync run")
+LAST_RUN = instrumentation.gauge("sync_last_run_timestamp_seconds", "Unix time the last full sync run finished")
+
 def run_script(script_name, args=None):
     cmd = [sys.executable, f"tools/{script_name}"]
     if args:
         cmd.extend([str(a) for a in args])
+    cmd = profiling.wrap_command(cmd)  # with --profile, each stage profiles itself into the same run
     
     print(f"--- Running {script_name} {' '.join(str(a) for a in (args or []))} ---")
     try:
-        result = subprocess.run(cmd, check=True, text=True)
+        # The child's spans nest under the current stage span (TRACEPARENT)
+        result = subprocess.run(cmd, check=True, text=True, env=tracing.child_env())
         print(f"--- {script_name} completed ---")
         return True
     except subprocess.CalledProcessError as e:
         print(f"!!! Error running {script_name}: {e}")
         return False
 
-def sync_pool(pool_config):
+def sync_pool(pool_config, on_stage=None, pos_data=None):
+    """
+    Sync one pool; on_stage(name) is called before each stage so callers can report progress.
+    pos_data is the position already fetched by a batched provider call, if any.
+    """
     nft_id = pool_config["nft_id"]
     exchange = pool_config.get("exchange", "uniswap_v3")
+    pool_span = tracing.start_span("sync.pool", activate=True, pool=nft_id, exchange=exchange)
+    current = []  # [(stage, start, span)] of the stage in progress
+
+    def end_stage():
+        if current:
+            stage, start, stage_span = current.pop()
+            stage_span.end()
+            STAGE_SECONDS.observe(time.perf_counter() - start, pool=nft_id, stage=stage)
+
+    def report(stage):
+        end_stage()
+        current.append((stage, time.perf_counter(), tracing.start_span(f"sync.{stage}", activate=True, pool=nft_id)))
+        if on_stage:
+            on_stage(stage)
+
     label = pool_config.get("label", f"Pool #{nft_id}")
     
     print(f"\n{'='*50}")
@@ -35,36 +63,65 @@ def sync_pool(pool_config):
 
     try:
         provider = ProviderFactory.create(pool_config)
+        conn = state_db.connect()
+        failed = []  # stages whose script exited non-zero
         
         # 1. Fetch position data
-        print(f"--> Fetching position data via {exchange} provider...")
-        pos_data = provider.fetch_position_data()
+        report("position")
+        if pos_data is None:
+            print(f"--> Fetching position data via {exchange} provider...")
+            pos_data = provider.fetch_position_data()
         
         if pos_data:
             pool_dir = f"tools/pools/{nft_id}"
-            os.makedirs(pool_dir, exist_ok=True)
-            with open(f"{pool_dir}/position_data.json", "w") as f:
-                json.dump(pos_data, f, indent=2)
+            storage.write_json(f"{pool_dir}/position_data.json", pos_data)
+            state_db.save_position(conn, nft_id, pos_data)
             print(f"    ✓ Position data saved to {pool_dir}/position_data.json")
-        else:
+        elif exchange == "uniswap_v3":
             # Fallback to legacy script if provider returns nothing (for safety during migration)
             print(f"    ! Provider returned no data, falling back to legacy script...")
-            run_script("fetch_pool_data.py", [nft_id])
+            if not run_script("fetch_pool_data.py", [nft_id]):
+                failed.append("position")
+        else:
+            print(f"    ! Provider returned no data, keeping previous snapshot")
 
         # 2. Fetch fees data
         # Note: Historical fee sync still uses scripts for now, will be moved to providers in STORY-004 fix
+        report("fees")
         if exchange == "uniswap_v3":
-            run_script("fetch_collected_fees.py", [nft_id])
+            if not run_script("fetch_collected_fees.py", [nft_id]):
+                failed.append("fees")
         else:
-            print(f"    > Fee sync for {exchange} not yet fully implemented, skipping script.")
+            fees_data = provider.fetch_fees_data()
+            if fees_data and "events_count" in fees_data:
+                storage.write_json(f"tools/pools/{nft_id}/fees_data.json", fees_data)
+                state_db.save_fees(conn, nft_id, fees_data)
+                # The ledger (portfolio fees) takes the decoded events; already recorded ones are ignored
+                added = state_db.add_fee_events(conn, nft_id, state_db.solana_events(nft_id))
+                print(f"    ✓ Fees data saved ({fees_data['events_count']} events, {added} new in the ledger)")
+            else:
+                print(f"    > Fee sync for {exchange} not yet fully implemented, skipping.")
 
         # 3. Update history
-        run_script("update_history.py", [nft_id])
+        report("history")
+        if not run_script("update_history.py", [nft_id]):
+            failed.append("history")
+        if failed:
+            POOL_SYNCS.inc(pool=nft_id, result="error")
+            pool_span.error = f"failed stage(s): {', '.join(failed)}"
+            print(f"!!! {label}: {', '.join(failed)} stage(s) failed")
+            return False
+        POOL_SYNCS.inc(pool=nft_id, result="ok")
         return True
         
     except Exception as e:
+        POOL_SYNCS.inc(pool=nft_id, result="error")
+        pool_span.error = f"{type(e).__name__}: {e}"
         print(f"!!! Error syncing {label}: {e}")
         return False
+    finally:
+        end_stage()
+        pool_span.end()
 
 def main():
     start_time = time.time()
@@ -77,12 +134,64 @@ def main():
     except FileNotFoundError:
         print(f"Error: {POOLS_FILE} not found.")
         sys.exit(1)
+
+    with tracing.span("sync.run", pools=len(pools)):
+        run_all(pools, start_time)
+
+def run_all(pools, start_time):
+    # Mirror the registry into the state store the dashboard reads from
+    conn = state_db.connect()
+    for pool in pools:
+        state_db.upsert_pool(conn, pool)
+
+    # Positions flagged closed by discover_positions.py stay in the registry but leave the hot path
+    closed = [p for p in pools if p.get("status") == "closed"]
+    pools = [p for p in pools if p.get("status") != "closed"]
+    print(f"Found {len(pools)} pools to sync" + (f" ({len(closed)} closed skipped).\n" if closed else ".\n"))
+
+    # Warm the shared price cache once: every update_history.py child reuses these quotes
+    os.environ["PRICE_RUN_STARTED"] = str(start_time)
+    with tracing.span("prices.warm"):
+        quotes = PriceService().get_prices(COINGECKO_IDS)
+    print("Prices: " + ", ".join(f"{s} ${q['price']:,.2f} ({q['source']})" for s, q in quotes.items()))
     
-    print(f"Found {len(pools)} pools to sync.\n")
-    
-    # Sync each pool using the new provider architecture
+    # Positions are fetched in one batched request per provider group (exchange/network),
+    # then each pool runs its fee and history stages
+    groups = ProviderFactory.group(pools)
+    print("Provider groups: " + ", ".join(g.label for g in groups))
+    with tracing.span("sync.position_batch", groups=len(groups)), STAGE_SECONDS.time(pool="all", stage="position_batch"):
+        positions = ProviderFactory.fetch_all(pools)
     for pool in pools:
-        sync_pool(pool)
+        sync_pool(pool, pos_data=positions.get(pool["nft_id"]))
+
+    # Swap index of the V3 pools (range/rebalance simulator); a failure here never fails the sync
+    with tracing.span("sync.swaps"), STAGE_SECONDS.time(pool="all", stage="swaps"):
+        for pool_address in swap_index.tracked_pools(conn):
+            try:
+                added = swap_index.sync_pool(conn, pool_address)
+                if added:
+                    print(f"Swap index: {added} new swap(s) for {pool_address}")
+            except Exception as e:
+                print(f"Swap index: {pool_address} failed: {e}")
+
+    # Pool-derived prices (TWAPs, realized volatility, drawdowns) from the fresh swap index
+    with tracing.span("sync.price_analytics"), STAGE_SECONDS.time(pool="all", stage="price_analytics"):
+        try:
+            from tools import price_analytics
+            for pool_address, a in price_analytics.refresh(conn).items():
+                vol = ", ".join(f"{k} {v:.0f}%" for k, v in a["realized_vol"].items()) or "n/a"
+                print(f"Price analytics: {pool_address} {len(a['twap'])} TWAP window(s), vol {vol}")
+        except Exception as e:
+            print(f"Price analytics failed: {e}")
+
+    # Monte Carlo range risk on the fresh positions (the dashboard shows the cached results)
+    with tracing.span("sync.range_risk"), STAGE_SECONDS.time(pool="all", stage="range_risk"):
+        try:
+            from tools import range_risk
+            risk = range_risk.refresh(conn)
+            print(f"Range risk: {len(risk)} pool(s), {range_risk.PATHS:,} paths over {range_risk.HORIZON_DAYS:g} days")
+        except Exception as e:
+            print(f"Range risk failed: {e}")
     
     # 3. Generate multi-pool dashboard
     print(f"\n{'='*50}")
@@ -91,7 +200,11 @@ def main():
     run_script("dashboard_gen_v3.py")
     
     elapsed = time.time() - start_time
+    RUN_SECONDS.observe(elapsed)
+    LAST_RUN.set(time.time())
     print(f"\nSync completed in {elapsed:.2f} seconds.")
 
 if __name__ == "__main__":
-    main()
+    # python tools/sync.py --profile[=sample]
+    with profiling.profile("sync", profiling.cli_mode()):
+        main()
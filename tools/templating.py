@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
+from markupsafe import Markup
+
+from tools.storage import atomic_open
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATES_DIR = os.path.join(SCRIPT_DIR, "templates")
+CACHE_DIR = os.path.join(SCRIPT_DIR, ".cache")
+BYTECODE_CACHE_DIR = os.path.join(CACHE_DIR, "jinja")
+FRAGMENT_CACHE_DIR = os.path.join(CACHE_DIR, "fragments")
+
+_env = None
+
+def fmt(value, spec):
+    """Jinja filter mirroring the f-string format specs used by the old generator."""
+    return format(value or 0, spec)
+
+def get_env():
+    """Return the shared Jinja environment (templates compiled once, bytecode cached on disk)."""
+    global _env
+    if _env is None:
+        os.makedirs(BYTECODE_CACHE_DIR, exist_ok=True)
+        _env = Environment(
+            loader=FileSystemLoader(TEMPLATES_DIR),
+            bytecode_cache=FileSystemBytecodeCache(BYTECODE_CACHE_DIR),
+            autoescape=select_autoescape(enabled_extensions=("html.j2",), default_for_string=False),
+            keep_trailing_newline=True,
+            auto_reload=False,
+        )
+        _env.filters["fmt"] = fmt
+    return _env
+
+class FragmentCache:
+    """
+    Cache of rendered per-pool fragments keyed on (template, context) content.
+    Entries live in memory for the process and on disk between runs, so
+    unchanged pools are not re-rendered when the dashboard is regenerated.
+    """
+
+    def __init__(self, directory=FRAGMENT_CACHE_DIR, max_entries=4096):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._used = set()
+        self.hits = 0
+        self.misses = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _key(self, template, context):
+        payload = json.dumps(context, sort_keys=True, default=str)
+        digest = hashlib.sha1()
+        digest.update(template.name.encode())
+        digest.update(str(os.path.getmtime(template.filename)).encode())
+        digest.update(payload.encode())
+        return digest.hexdigest()
+
+    def render(self, template_name, **context):
+        template = get_env().get_template(template_name)
+        key = self._key(template, context)
+        self._used.add(key)
+
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return self._memory[key]
+
+        path = os.path.join(self.directory, f"{key}.html") if self.directory else None
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                fragment = Markup(f.read())
+            self.hits += 1
+        else:
+            fragment = Markup(template.render(**context))
+            self.misses += 1
+            if path:
+                with atomic_open(path) as f:
+                    f.write(fragment)
+
+        self._memory[key] = fragment
+        if len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+        return fragment
+
+    def prune(self):
+        """Drop on-disk fragments that were not used since this cache was created."""
+        if not self.directory:
+            return
+        for name in os.listdir(self.directory):
+            if name.endswith(".html") and name[:-5] not in self._used:
+                os.remove(os.path.join(self.directory, name))
+
+def stream_to_file(template_name, path, **context):
+    """
+    Render a template straight to disk in one pass, without building the page in memory.
+    The page is swapped in atomically, so the web server never serves a half-written file.
+    """
+    template = get_env().get_template(template_name)
+    with atomic_open(path) as f:
+        template.stream(**context).dump(f)
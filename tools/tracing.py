@@ -0,0 +1,222 @@
+import contextlib
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+# Lightweight tracing for the sync pipeline: nested, timed spans with
+# attributes, written as JSON lines to .cache/traces/<trace_id>.jsonl.
+#
+# The sync stages are separate processes, so the active span travels to child
+# processes in the W3C TRACEPARENT environment variable (see child_env()); a
+# child's spans land in the same trace file under the stage that launched it.
+#
+#   python tools/tracing.py list                 # recent traces
+#   python tools/tracing.py show [trace_id]      # span tree of a trace (default: latest)
+#   python tools/tracing.py otlp <trace_id> out.json   # OTLP/JSON for Jaeger, Tempo, otel-desktop-viewer
+#
+# TRACING=0 disables recording.
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+TRACE_DIR = os.getenv("TRACE_DIR", os.path.join(SCRIPT_DIR, ".cache", "traces"))
+ENABLED = os.getenv("TRACING", "1") != "0"
+MAX_TRACES = 50
+
+_current: contextvars.ContextVar = contextvars.ContextVar("tracing_span", default=None)
+_write_lock = threading.Lock()
+
+class SpanContext:
+    def __init__(self, trace_id: str, span_id: str):
+        self.trace_id = trace_id
+        self.span_id = span_id
+
+    @classmethod
+    def from_traceparent(cls, value: Optional[str]) -> Optional["SpanContext"]:
+        parts = (value or "").split("-")
+        if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+            return None
+        return cls(parts[1], parts[2])
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+_inherited = SpanContext.from_traceparent(os.getenv("TRACEPARENT"))
+
+class Span(SpanContext):
+    def __init__(self, name: str, parent: Optional[SpanContext], attributes: Dict[str, Any]):
+        super().__init__(parent.trace_id if parent else os.urandom(16).hex(), os.urandom(8).hex())
+        self.name = name
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        self.start_ns = time.time_ns()
+        self._token = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self):
+        if self._token is not None:
+            with contextlib.suppress(ValueError):  # ended from another context
+                _current.reset(self._token)
+            self._token = None
+        if ENABLED:
+            _export({
+                "traceId": self.trace_id, "spanId": self.span_id, "parentSpanId": self.parent_id,
+                "name": self.name, "startTimeUnixNano": self.start_ns, "endTimeUnixNano": time.time_ns(),
+                "attributes": self.attributes, "status": "error" if self.error else "ok", "error": self.error,
+                "process": _process_name(), "pid": os.getpid(),
+            })
+
+def current() -> Optional[SpanContext]:
+    """Active span in this thread/task, else the span that launched this process."""
+    return _current.get() or _inherited
+
+def start_span(name: str, parent: Optional[SpanContext] = None, activate: bool = False, **attributes) -> Span:
+    """
+    Span that the caller ends explicitly; for stages that are not a single block.
+    activate=True makes it the current span until end() (end spans in LIFO order).
+    """
+    parent = parent or current()
+    span_ = Span(name, parent, attributes)
+    if parent is None and ENABLED:
+        _prune()
+    if activate:
+        span_._token = _current.set(span_)
+    return span_
+
+@contextlib.contextmanager
+def span(name: str, parent: Optional[SpanContext] = None, **attributes):
+    """Time the block as a child of the current span (or of `parent`, e.g. across a thread pool)."""
+    span_ = start_span(name, parent, activate=True, **attributes)
+    try:
+        yield span_
+    except BaseException as e:
+        span_.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        span_.end()
+
+def child_env(env: Optional[Dict[str, str]] = None, parent: Optional[SpanContext] = None) -> Dict[str, str]:
+    """Environment for a subprocess whose spans should nest under the current span (or `parent`)."""
+    env = dict(os.environ if env is None else env)
+    ctx = parent or current()
+    if ctx is not None:
+        env["TRACEPARENT"] = ctx.traceparent
+    return env
+
+def _process_name() -> str:
+    script = os.path.basename(sys.argv[0]) if sys.argv else ""
+    return "python" if not script or script.startswith("-") else os.path.splitext(script)[0]
+
+def _export(record: Dict[str, Any]):
+    line = json.dumps(record, default=str) + "\n"
+    try:
+        os.makedirs(TRACE_DIR, exist_ok=True)
+        # O_APPEND single-line writes: processes sharing a trace can append concurrently
+        with _write_lock:
+            fd = os.open(os.path.join(TRACE_DIR, f"{record['traceId']}.jsonl"), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o666)
+            try:
+                os.write(fd, line.encode())
+            finally:
+                os.close(fd)
+    except OSError:
+        pass  # tracing must never break a sync
+
+def _prune():
+    try:
+        files = sorted((os.path.join(TRACE_DIR, f) for f in os.listdir(TRACE_DIR) if f.endswith(".jsonl")),
+                       key=os.path.getmtime)
+    except OSError:
+        return
+    for path in files[:-MAX_TRACES]:
+        with contextlib.suppress(OSError):
+            os.remove(path)
+
+# --- reading traces --------------------------------------------------------------
+
+def load(trace_id: str) -> List[Dict[str, Any]]:
+    spans = []
+    with open(os.path.join(TRACE_DIR, f"{trace_id}.jsonl"), "r") as f:
+        for line in f:
+            with contextlib.suppress(json.JSONDecodeError):
+                spans.append(json.loads(line))
+    return sorted(spans, key=lambda s: s["startTimeUnixNano"])
+
+def recent() -> List[str]:
+    if not os.path.isdir(TRACE_DIR):
+        return []
+    files = sorted((f for f in os.listdir(TRACE_DIR) if f.endswith(".jsonl")),
+                   key=lambda f: os.path.getmtime(os.path.join(TRACE_DIR, f)), reverse=True)
+    return [f[:-6] for f in files]
+
+def to_otlp(spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """OTLP/JSON (ExportTraceServiceRequest), one resource per process."""
+    def value(v):
+        if isinstance(v, bool):
+            return {"boolValue": v}
+        if isinstance(v, int):
+            return {"intValue": str(v)}
+        if isinstance(v, float):
+            return {"doubleValue": v}
+        return {"stringValue": str(v)}
+
+    by_process: Dict[str, List[Dict]] = {}
+    for s in spans:
+        by_process.setdefault(s.get("process", "python"), []).append({
+            "traceId": s["traceId"], "spanId": s["spanId"], "parentSpanId": s.get("parentSpanId") or "",
+            "name": s["name"], "kind": 1,
+            "startTimeUnixNano": str(s["startTimeUnixNano"]), "endTimeUnixNano": str(s["endTimeUnixNano"]),
+            "attributes": [{"key": k, "value": value(v)} for k, v in (s.get("attributes") or {}).items()],
+            "status": {"code": 2, "message": s.get("error") or ""} if s.get("status") == "error" else {"code": 1},
+        })
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": f"pool-tracker.{process}"}}]},
+        "scopeSpans": [{"scope": {"name": "tools.tracing"}, "spans": items}],
+    } for process, items in by_process.items()]}
+
+def print_tree(spans: List[Dict[str, Any]]):
+    ids = {s["spanId"] for s in spans}
+    children: Dict[Optional[str], List[Dict]] = {}
+    for s in spans:
+        parent = s.get("parentSpanId") if s.get("parentSpanId") in ids else None
+        children.setdefault(parent, []).append(s)
+
+    def walk(parent, depth):
+        for s in children.get(parent, []):
+            ms = (s["endTimeUnixNano"] - s["startTimeUnixNano"]) / 1e6
+            attrs = " ".join(f"{k}={v}" for k, v in (s.get("attributes") or {}).items())
+            flag = f"  !! {s['error']}" if s.get("error") else ""
+            print(f"{ms:>10.1f} ms  {'  ' * depth}{s['name']} [{s.get('process')}] {attrs}{flag}")
+            walk(s["spanId"], depth + 1)
+    walk(None, 0)
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else "show"
+    traces = recent()
+    if command == "list":
+        for trace_id in traces[:20]:
+            spans = load(trace_id)
+            roots = [s for s in spans if not s.get("parentSpanId")] or spans[:1]
+            total = (max(s["endTimeUnixNano"] for s in spans) - min(s["startTimeUnixNano"] for s in spans)) / 1e9
+            print(f"{trace_id}  {total:>8.2f}s  {len(spans):>5} spans  {roots[0]['name'] if roots else ''}")
+        return
+    trace_id = sys.argv[2] if len(sys.argv) > 2 else (traces[0] if traces else None)
+    if not trace_id:
+        print(f"No traces in {TRACE_DIR}")
+        return
+    if command == "otlp":
+        out = sys.argv[3] if len(sys.argv) > 3 else f"{trace_id}.otlp.json"
+        with open(out, "w") as f:
+            json.dump(to_otlp(load(trace_id)), f)
+        print(f"Wrote {out}")
+        return
+    print(f"Trace {trace_id}")
+    print_tree(load(trace_id))
+
+if __name__ == "__main__":
+    main()
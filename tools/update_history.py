@@ -1,23 +1,11 @@
-import json
 import datetime
 import time
 import os
-import requests
 import sys
 
-def get_cbbtc_price(fallback=68000.0):
-    """Fetch live cbBTC price from CoinGecko API"""
-    try:
-        url = "https://api.coingecko.com/api/v3/simple/price?ids=coinbase-wrapped-btc&vs_currencies=usd"
-        res = requests.get(url, timeout=5)
-        price = res.json().get('coinbase-wrapped-btc', {}).get('usd')
-        if price:
-            print(f"cbBTC price (CoinGecko): ${price:,.2f}")
-            return float(price)
-    except Exception as e:
-        print(f"CoinGecko error: {e}")
-    print(f"Using fallback price: ${fallback:,.2f}")
-    return fallback
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tools import state_db, storage, tracing
+from tools.price_service import PriceService, hints_from_position
 
 def main():
     # 1. NFT ID from arguments
@@ -31,48 +19,46 @@ def main():
     history_file = f"{pool_dir}/history.json"
 
     # 2. Read latest snapshot
-    try:
-        with open(data_file, "r") as f:
-            snapshot = json.load(f)
-    except FileNotFoundError:
+    snapshot = storage.read_json(data_file)
+    if snapshot is None:
         print(f"Error: {data_file} not found. Run fetch_pool_data.py {nft_id} first.")
         return
+    # Without a pool price the provider estimated the tick from the range midpoint:
+    # its price, amounts and value are made up and never land in history
+    if snapshot.get('price_source') == "range_midpoint":
+        print(f"Error: no pool price for {nft_id} this run (range midpoint estimate); history not updated.")
+        sys.exit(1)
 
     # 3. Add Metadata (Time, Values)
     now = datetime.datetime.now()
     snapshot['timestamp'] = int(time.time())
     snapshot['date'] = now.strftime("%Y-%m-%d %H:%M:%S")
     
-    # Get live cbBTC price (fallback to price from position data)
-    fallback_price = snapshot.get('price_cbbtc', 68000.0)
-    price_cbbtc = get_cbbtc_price(fallback=fallback_price)
-    
-    snapshot['prices'] = {
-        "USDC": 1.0,
-        "cbBTC": price_cbbtc
-    }
-
-    # 4. Append to History
-    history = []
-    if os.path.exists(history_file):
-        try:
-            with open(history_file, "r") as f:
-                history = json.load(f)
-        except json.JSONDecodeError:
-            history = []
+    # Prices come from the shared price service (cached across the whole sync run).
+    # An asset that cannot be priced is left out rather than filled with a guess.
+    symbols = [s for s in (snapshot.get('symbol0'), snapshot.get('symbol1')) if s] or ["USDC", "cbBTC"]
+    with tracing.span("history.prices", symbols=",".join(symbols)):
+        quotes = PriceService().get_prices(symbols, hints_from_position(snapshot))
+    snapshot['prices'] = {s: q['price'] for s, q in quotes.items()}
+    snapshot['price_sources'] = {s: q['source'] for s, q in quotes.items()}
+    for s, q in quotes.items():
+        print(f"{s} price ({q['source']}): ${q['price']:,.2f}")
+    missing = [s for s in symbols if s not in quotes]
+    if missing:
+        print(f"Warning: no price available for {', '.join(missing)}; omitted from snapshot")
 
-    history.append(snapshot)
+    # 4. Append to History (locked read-modify-write: the app, the API and the
+    # sync container may all append to the same pool)
+    with tracing.span("history.append", pool=nft_id):
+        with storage.update_json(history_file, []) as history:
+            history.append(snapshot)
+        state_db.append_snapshot(state_db.connect(), nft_id, snapshot)
 
-    # 5. Save
-    with open(history_file, "w") as f:
-        json.dump(history, f, indent=2)
-    
     print(f"History updated for Pool {nft_id}. Total snapshots: {len(history)}")
 
     # 6. Legacy support (if it's the main pool)
     if nft_id == "4227642":
-        with open("tools/history.json", "w") as f:
-            json.dump(history, f, indent=2)
+        storage.write_json("tools/history.json", history)
 
 if __name__ == "__main__":
     main()
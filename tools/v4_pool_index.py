@@ -0,0 +1,159 @@
+import collections
+import os
+import sqlite3
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+# Allow importing from the project root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tools import rpc, state_db
+from tools.clmath import to_signed
+from tools.providers.uniswap_v4_provider import UniswapV4Provider
+
+# Local index of Uniswap V4 pools, built from PoolManager Initialize events.
+# V4 pools have no contract address of their own, so "which pools exist for
+# USDC/cbBTC" is answered here with a query instead of guessing PoolKeys.
+# The table lives in the shared state store (tools/state_db.py), next to the
+# other scanners' checkpoints.
+
+# Initialize(PoolId indexed id, Currency indexed currency0, Currency indexed currency1,
+#            uint24 fee, int24 tickSpacing, IHooks hooks, uint160 sqrtPriceX96, int24 tick)
+INITIALIZE_TOPIC = "0xdd466e674ea557f56295e2d0218a125ea4b4f0f6f3307b95f85e6110838d6438"
+POOL_MANAGER_DEPLOY_BLOCK = int(os.getenv("V4_START_BLOCK", "25350988"))  # Base
+CHUNK_SIZE = 10000
+CONFIRMATIONS = 10
+CHECKPOINT = "v4_initialize"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS v4_pools (
+    pool_id TEXT PRIMARY KEY,
+    currency0 TEXT NOT NULL,
+    currency1 TEXT NOT NULL,
+    fee INTEGER NOT NULL,
+    tick_spacing INTEGER NOT NULL,
+    hooks TEXT NOT NULL,
+    sqrt_price_x96 TEXT,
+    tick INTEGER,
+    block_number INTEGER NOT NULL,
+    tx_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_v4_pools_pair ON v4_pools (currency0, currency1);
+"""
+
+def connect(db_file: str = state_db.DB_FILE) -> sqlite3.Connection:
+    conn = state_db.connect(db_file)
+    conn.executescript(SCHEMA)
+    return conn
+
+def decode_initialize(log: Dict) -> Dict:
+    topics = log["topics"]
+    data = log.get("data", "0x")[2:]
+    words = [data[i:i+64] for i in range(0, len(data), 64)]
+    return {
+        "pool_id": topics[1].lower(),
+        "currency0": "0x" + topics[2][-40:].lower(),
+        "currency1": "0x" + topics[3][-40:].lower(),
+        "fee": int(words[0], 16),
+        "tick_spacing": to_signed(int(words[1], 16), 24),
+        "hooks": "0x" + words[2][-40:].lower(),
+        "sqrt_price_x96": str(int(words[3], 16)),
+        "tick": to_signed(int(words[4], 16), 24),
+        "block_number": int(log["blockNumber"], 16),
+        "tx_hash": log.get("transactionHash"),
+    }
+
+def get_checkpoint(conn: sqlite3.Connection) -> int:
+    return state_db.get_checkpoint(conn, CHECKPOINT, POOL_MANAGER_DEPLOY_BLOCK - 1)
+
+def update(conn: sqlite3.Connection, to_block: Optional[int] = None, workers: int = 4) -> int:
+    """
+    Scan Initialize events from the checkpoint to head - CONFIRMATIONS.
+    Chunks are fetched in parallel but committed in block order, each together
+    with its checkpoint, so an interrupted run resumes where it stopped.
+    Returns the number of pools added.
+    """
+    start = get_checkpoint(conn) + 1
+    if to_block is None:
+        head = rpc.block_number()
+        if head == 0:
+            print("Failed to get current block number")
+            return 0
+        to_block = head - CONFIRMATIONS
+    if start > to_block:
+        print(f"V4 pool index up to date (block {start - 1}).")
+        return 0
+
+    ranges = [(b, min(b + CHUNK_SIZE - 1, to_block)) for b in range(start, to_block + 1, CHUNK_SIZE)]
+    print(f"Indexing V4 Initialize events {start} -> {to_block} ({len(ranges)} chunks)...")
+
+    def fetch(block_range):
+        return rpc.get_logs(UniswapV4Provider.POOL_MANAGER_ADDRESS, [INITIALIZE_TOPIC], *block_range)
+
+    added = 0
+    executor = ThreadPoolExecutor(max_workers=workers)
+    # At most workers * 2 chunks in flight, refilled as chunks are committed in block
+    # order (keeps the checkpoint contiguous); a failure stops the requests still queued
+    pending = collections.deque()
+    chunks = iter(ranges)
+
+    def submit_next():
+        block_range = next(chunks, None)
+        if block_range is not None:
+            pending.append((block_range, executor.submit(fetch, block_range)))
+
+    try:
+        for _ in range(workers * 2):
+            submit_next()
+        while pending:
+            (lo, hi), future = pending.popleft()
+            logs = future.result()
+            if logs is None:
+                print(f"\n  Chunk {lo}-{hi} failed; index checkpoint left at {lo - 1}")
+                break
+            submit_next()
+            rows = [decode_initialize(log) for log in logs if not log.get("removed")]
+            with conn:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO v4_pools VALUES (:pool_id, :currency0, :currency1, :fee, :tick_spacing,"
+                    " :hooks, :sqrt_price_x96, :tick, :block_number, :tx_hash)", rows)
+                state_db.set_checkpoint(conn, CHECKPOINT, hi)
+            added += len(rows)
+            sys.stdout.write(f"\r  Indexed through block {hi} ({added} new pools)")
+            sys.stdout.flush()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+    print()
+    return added
+
+def find_pools(conn: sqlite3.Connection, token_a: str, token_b: str) -> List[Dict]:
+    """All indexed pools for a pair (either order), most recently initialized first."""
+    currency0, currency1 = sorted([token_a.lower(), token_b.lower()])
+    rows = conn.execute(
+        "SELECT * FROM v4_pools WHERE currency0 = ? AND currency1 = ? ORDER BY block_number DESC",
+        (currency0, currency1)).fetchall()
+    return [dict(r) for r in rows]
+
+def pool_key(row: Dict) -> Dict:
+    return {k: row[k] for k in ("currency0", "currency1", "fee", "tick_spacing", "hooks")}
+
+def _resolve(token: str) -> str:
+    if token.startswith("0x"):
+        return token.lower()
+    for address, info in UniswapV4Provider.KNOWN_TOKENS.items():
+        if info["symbol"].lower() == token.lower():
+            return address
+    raise ValueError(f"Unknown token symbol: {token}")
+
+def main():
+    conn = connect()
+    if len(sys.argv) >= 4 and sys.argv[1] == "find":
+        pools = find_pools(conn, _resolve(sys.argv[2]), _resolve(sys.argv[3]))
+        print(f"{len(pools)} pool(s) indexed through block {get_checkpoint(conn)}:")
+        for p in pools:
+            print(f"  {p['pool_id']} fee={p['fee']} tickSpacing={p['tick_spacing']} hooks={p['hooks']}")
+        return
+    update(conn)
+
+if __name__ == "__main__":
+    main()